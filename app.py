@@ -1,6 +1,4 @@
 import streamlit as st
-import requests
-import base64
 from io import BytesIO
 from PIL import Image
 import google.generativeai as genai
@@ -9,9 +7,23 @@ import os
 from dotenv import load_dotenv
 import time
 import re
+import json
+
+from utils.backend_pool import backend_pool
+from utils.colab_client import analyze_batch_with_colab, analyze_with_jobs, test_colab_connection
+from utils.consistency import check_consistency
+from utils.dicom import is_dicom, read_dicom
+from utils.llm_client import GeminiBackend, LLMClient
+from utils.metrics import Spans
+from utils.postprocess import translation_prompt
+from utils.preprocess import MODEL_INPUT_SIZE
+from utils.report_cache import ReportCache
+from utils.translation_memory import TranslationMemory
 
 load_dotenv()
 
+UPLOAD_TARGET_SIZE = int(os.getenv("UPLOAD_TARGET_SIZE", MODEL_INPUT_SIZE))
+
 st.set_page_config(
     page_title="CheXagent - AI Radiology Assistant",
     page_icon="🏥",
@@ -28,6 +40,12 @@ if 'colab_connected' not in st.session_state:
     st.session_state.colab_connected = False
 if 'analyzing' not in st.session_state:
     st.session_state.analyzing = False
+if 'upload_stats' not in st.session_state:
+    st.session_state.upload_stats = None
+if 'timings' not in st.session_state:
+    st.session_state.timings = None
+if 'batch_results' not in st.session_state:
+    st.session_state.batch_results = None
 
 # Custom CSS with Claude Sans font and animations
 st.markdown("""
@@ -351,36 +369,67 @@ def markdown_to_html(text):
 # COLAB CONNECTION FUNCTIONS
 # ============================================================
 
-def test_colab_connection(url):
-    """Test if Colab backend is reachable"""
-    try:
-        response = requests.get(url.replace('/analyze', '/'), timeout=5)
-        return response.status_code == 200
-    except:
-        return False
+@st.cache_resource
+def get_report_cache():
+    """Process-wide report cache shared by all sessions"""
+    return ReportCache(os.getenv("REPORT_CACHE_DIR", ".report_cache"))
 
-def analyze_with_colab(image_file, colab_url):
-    """Send image to Colab GPU for analysis"""
-    
-    # Convert image to base64
-    buffered = BytesIO()
-    image = Image.open(image_file)
-    image.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    
-    # Call Colab API
-    response = requests.post(
-        colab_url,
-        json={'image': img_str},
-        timeout=120
+def medical_report_card(report):
+    """HTML for the medical report card"""
+    return f"""
+    <div class="report-card medical-report-card">
+        <div class="report-header"><span>🔬</span> Technical Medical Analysis</div>
+        <div class="report-content">{markdown_to_html(report)}</div>
+    </div>
+    """
+
+# ============================================================
+# RESULTS HELPERS (memoized so reruns cost no model loads or API calls)
+# ============================================================
+
+@st.cache_resource
+def get_llm_client():
+    """Shared Gemini client with rate limiting and retries on 429/5xx"""
+    return LLMClient(GeminiBackend('gemini-2.5-flash'))
+
+@st.cache_resource
+def get_translation_memory():
+    """Sentence-level translation cache shared by all sessions"""
+    return TranslationMemory(os.getenv("TRANSLATION_MEMORY_PATH", ".translation_memory.json"))
+
+@st.cache_resource
+def get_similarity_model():
+    """Load the sentence embedding model once per process"""
+    return SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+
+@st.cache_data(show_spinner=False)
+def report_similarity(medical_report, layman_report):
+    """Cosine similarity between the two report embeddings"""
+    similarity_model = get_similarity_model()
+    medical_embedding, layman_embedding = similarity_model.encode(
+        [medical_report, layman_report], convert_to_tensor=True
     )
-    
-    result = response.json()
-    
-    if result.get('status') == 'success':
-        return result['report']
-    else:
-        raise Exception(result.get('error', 'Unknown error'))
+    return util.cos_sim(medical_embedding, layman_embedding).item()
+
+@st.cache_data(show_spinner=False)
+def check_hallucination(medical_report, layman_report):
+    """Sentence-level check, run locally with the MiniLM model (no API call)"""
+    result = check_consistency(get_similarity_model(), medical_report, layman_report)
+    return result['hallucinated'], result['difference'], result['explanation'], result['hallucination_score']
+
+@st.cache_data(show_spinner=False)
+def make_thumbnail(image_bytes, max_side=1024):
+    """Decode the upload once into a display-sized thumbnail"""
+    if is_dicom(image_bytes):
+        image, original_size = read_dicom(image_bytes, max_side // 2)
+        image.thumbnail((max_side, max_side))
+        return image, original_size
+    image = Image.open(BytesIO(image_bytes))
+    original_size = image.size
+    # JPEG can decode straight to a reduced scale
+    image.draft(None, (max_side, max_side))
+    image.thumbnail((max_side, max_side))
+    return image, original_size
 
 # ============================================================
 # SIDEBAR
@@ -389,21 +438,32 @@ def analyze_with_colab(image_file, colab_url):
 with st.sidebar:
     st.markdown("### 🔌 Colab GPU Connection")
     
-    # Colab URL input
-    colab_url = st.text_input(
-        "Colab API URL",
+    # Colab URL input (one per line to spread studies over several backends)
+    colab_url = st.text_area(
+        "Colab API URL(s)",
         value=os.getenv("COLAB_API_URL", ""),
         placeholder="https://xxxx.ngrok-free.app/analyze",
-        help="Paste the ngrok URL from your Colab notebook"
+        help="Paste the ngrok URL from your Colab notebook; add one per line for several backends"
+    )
+    hedge_requests = st.checkbox(
+        "Hedge slow /analyze calls",
+        value=os.getenv("HEDGE_REQUESTS", "") == "1",
+        help="Only for blocking /analyze and /workup calls, which this app makes only with old backends "
+             "without the job queue and streaming: if one is slower than that endpoint's usual p95, send a "
+             "copy to another backend and keep the first reply. Queued jobs and batch uploads are never "
+             "duplicated."
     )
     
     # Test connection
     if colab_url:
+        pool = backend_pool(colab_url)
+        pool.hedge = hedge_requests
         if st.button("🔍 Test Connection"):
             with st.spinner("Testing..."):
-                if test_colab_connection(colab_url):
+                healthy = test_colab_connection(pool)
+                if healthy:
                     st.session_state.colab_connected = True
-                    st.success("✅ Connected to Colab GPU!")
+                    st.success(f"✅ Connected to {healthy} of {len(pool.backends)} Colab backend(s)!")
                 else:
                     st.session_state.colab_connected = False
                     st.error("❌ Cannot reach Colab backend")
@@ -411,9 +471,26 @@ with st.sidebar:
         # Show status
         if st.session_state.colab_connected:
             st.markdown('<div class="status-box status-online">🟢 Colab GPU Online</div>', unsafe_allow_html=True)
+            if len(pool.backends) > 1:
+                for replica in pool.status():
+                    st.caption(
+                        f"{'🟢' if replica['healthy'] else '🔴'} {replica['url']} · "
+                        f"{replica['health_ms'] or '–'} ms · {replica['load']} queued"
+                    )
         else:
             st.markdown('<div class="status-box status-offline">🔴 Not Connected</div>', unsafe_allow_html=True)
     
+    cache_stats = get_report_cache().stats()
+    st.caption(
+        f"⚡ Report cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits · "
+        f"{cache_stats['misses']} misses"
+    )
+    translation_memory = get_translation_memory()
+    st.caption(
+        f"📚 Translation memory: {translation_memory.hit_rate():.0%} sentence hit rate · "
+        f"~{translation_memory.stats['tokens_saved']:,} tokens saved"
+    )
+    
     st.markdown("---")
     
     # Gemini API key
@@ -480,32 +557,73 @@ col1, col2 = st.columns([1, 1])
 with col1:
     st.markdown('<div class="upload-section">', unsafe_allow_html=True)
     st.markdown("### 📤 Upload X-Ray Image")
-    
-    uploaded_file = st.file_uploader(
-        "Choose a chest X-ray image",
-        type=['png', 'jpg', 'jpeg'],
-        help="Upload a clear chest X-ray image"
+    batch_mode = st.toggle(
+        "📚 Batch mode",
+        help="Upload several X-rays and generate all their reports in one request"
     )
     
+    if batch_mode:
+        uploaded_file = None
+        uploaded_files = st.file_uploader(
+            "Choose chest X-ray images",
+            type=['png', 'jpg', 'jpeg', 'dcm', 'dicom'],
+            accept_multiple_files=True,
+            help="Reports are generated on the backend in batches and shown as each one finishes"
+        )
+        if uploaded_files:
+            st.success(f"✅ {len(uploaded_files)} images uploaded")
+    else:
+        uploaded_files = []
+        uploaded_file = st.file_uploader(
+            "Choose a chest X-ray image",
+            type=['png', 'jpg', 'jpeg', 'dcm', 'dicom'],
+            help="Upload a clear chest X-ray image (PNG, JPEG or DICOM)"
+        )
+    
     if uploaded_file:
-        image = Image.open(uploaded_file)
+        thumbnail, image_size = make_thumbnail(uploaded_file.getvalue())
         st.markdown('<div class="image-container">', unsafe_allow_html=True)
-        st.image(image, caption="Uploaded X-Ray", use_container_width=True)
+        st.image(thumbnail, caption="Uploaded X-Ray", use_container_width=True)
         st.markdown('</div>', unsafe_allow_html=True)
         
-        st.success(f"✅ Image uploaded: {image.size[0]} × {image.size[1]} pixels")
+        st.success(f"✅ Image uploaded: {image_size[0]} × {image_size[1]} pixels")
     st.markdown('</div>', unsafe_allow_html=True)
 
 with col2:
     st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
     st.markdown("### 🤖 Analysis")
     
-    if uploaded_file is None:
+    if uploaded_file is None and not uploaded_files:
         st.info("👈 Upload an X-ray image to begin")
     elif not colab_url:
         st.warning("⚠️ Configure Colab URL in sidebar first")
     elif not st.session_state.colab_connected:
         st.warning("⚠️ Test connection to Colab first")
+    elif batch_mode:
+        if st.button(f"🔍 Analyze {len(uploaded_files)} X-Rays", use_container_width=True, type="primary"):
+            progress_bar = st.progress(0)
+            status_text = st.empty()
+            status_text.text("Uploading and generating reports on Colab GPU...")
+            
+            try:
+                # One streamed upload; after it, each report arrives as soon as its batch finishes
+                results = {}
+                for event in analyze_batch_with_colab(uploaded_files, colab_url, get_report_cache(), UPLOAD_TARGET_SIZE):
+                    if event['type'] == 'done':
+                        continue
+                    results[event['index']] = event
+                    progress_bar.progress(len(results) / len(uploaded_files))
+                    status_text.text(f"Generated {len(results)}/{len(uploaded_files)} reports...")
+                st.session_state.batch_results = [results[i] for i in sorted(results)]
+                progress_bar.empty()
+                status_text.empty()
+                
+                failed = sum(1 for r in results.values() if r['type'] == 'error')
+                st.success(f"✅ {len(results) - failed} reports generated" + (f", {failed} failed" if failed else ""))
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+                progress_bar.empty()
+                status_text.empty()
     elif not api_key:
         st.warning("⚠️ Enter Gemini API key in sidebar")
     else:
@@ -516,44 +634,67 @@ with col2:
             
             try:
                 # Step 1: Send to Colab GPU
-                status_text.text("Step 1/3: Sending to Colab GPU...")
+                status_text.text("Step 1/3: Generating report on Colab GPU...")
                 progress_bar.progress(10)
                 
-                with st.spinner("🌐 Analyzing on Colab GPU (30-60 sec)..."):
-                    medical_report = analyze_with_colab(uploaded_file, colab_url)
-                    st.session_state.medical_report = medical_report
+                # Submitted as a backend job; the report card fills in as output arrives
+                timings = Spans()
+                live_report = st.empty()
+                streamed_text = ""
+                medical_report = None
+                started = time.perf_counter()
+                for event in analyze_with_jobs(uploaded_file, colab_url, get_report_cache(), UPLOAD_TARGET_SIZE, timings):
+                    if event['type'] == 'token':
+                        if not streamed_text:
+                            timings.record("time_to_first_token", (time.perf_counter() - started) * 1000)
+                        streamed_text += event['text']
+                        live_report.markdown(medical_report_card(streamed_text), unsafe_allow_html=True)
+                    elif event['type'] == 'done':
+                        medical_report = event['report']
+                        timings.values.setdefault('backend', event.get('timings', {}))
+                        st.session_state.near_duplicate = event.get('near_duplicate')
+                timings.record("report_total", (time.perf_counter() - started) * 1000)
+                live_report.empty()
+                st.session_state.upload_stats = timings.values.get('upload')
+                
+                if medical_report is None:
+                    raise Exception("Backend closed the stream before the report finished")
+                st.session_state.medical_report = medical_report
                 
                 progress_bar.progress(50)
                 status_text.text("Step 2/3: Translating to simple language...")
                 
                 # Step 2: Translate
-                with st.spinner("📝 Translating..."):
-                    translation_model = genai.GenerativeModel('gemini-2.5-flash')
-                    
-                    prompt = f"""You are a medical translator. Translate this medical report into simple, patient-friendly language that anyone can understand. Give direct response as you are actually giving the report.
-
-Medical Report: {medical_report}
-
-Provide a clear, layman translation:"""
-                    
-                    translation_response = translation_model.generate_content(prompt)
-                    layman_report = translation_response.text
+                with st.spinner("📝 Translating..."), timings.span("translation"):
+                    # Known sentences come from the translation memory; only new ones go to Gemini
+                    llm_client = get_llm_client()
+                    layman_report = get_translation_memory().translate(
+                        medical_report, llm_client.generate_blocking
+                    )
+                    if layman_report is None:
+                        layman_report = llm_client.generate_blocking(translation_prompt(medical_report))
                     st.session_state.layman_report = layman_report
+                st.session_state.timings = timings
                 
-                progress_bar.progress(90)
-                status_text.text("Step 3/3: Calculating accuracy...")
-                
-                # Step 3: Accuracy check
-                time.sleep(1)
-                
+                # Step 3 (accuracy check) runs in the results section below
                 progress_bar.progress(100)
-                status_text.text("✅ Analysis complete!")
-                
-                time.sleep(1)
                 progress_bar.empty()
                 status_text.empty()
                 
                 st.success("✅ Analysis complete!")
+                near_duplicate = st.session_state.get('near_duplicate')
+                if near_duplicate:
+                    st.info(
+                        f"♻️ Near-duplicate of a study analyzed before ({near_duplicate['distance']} of 64 hash "
+                        f"bits differ); its stored report was reused"
+                    )
+                upload_stats = st.session_state.upload_stats
+                if upload_stats:
+                    st.caption(
+                        f"📦 Uploaded {upload_stats['upload_bytes'] / 1024:.0f} KB instead of "
+                        f"{upload_stats['original_bytes'] / 1024:.0f} KB "
+                        f"({upload_stats['ratio']}× smaller, {upload_stats['format']})"
+                    )
                 st.balloons()
                 
             except Exception as e:
@@ -564,88 +705,64 @@ Provide a clear, layman translation:"""
 
 
 # ============================================================
-# RESULTS SECTION (UPDATED WITH LLM-ONLY HALLUCINATION CHECK)
+# BATCH RESULTS
 # ============================================================
 
-if st.session_state.medical_report and st.session_state.layman_report:
+if batch_mode and st.session_state.batch_results:
+    st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+    st.markdown("## 📋 Batch Results")
+    
+    for result in st.session_state.batch_results:
+        if result['type'] == 'error':
+            st.error(f"❌ {result['id']}: {result['error']}")
+            continue
+        label = f"🔬 {result['id']}"
+        if result.get('near_duplicate'):
+            label += " · ♻️ near-duplicate"
+        with st.expander(label):
+            st.markdown(medical_report_card(result['report']), unsafe_allow_html=True)
+    
+    st.download_button(
+        label="📥 Download all reports (JSONL)",
+        data="\n".join(
+            json.dumps({'id': r['id'], 'report': r['report']} if r['type'] == 'result' else {'id': r['id'], 'error': r['error']})
+            for r in st.session_state.batch_results
+        ),
+        file_name="medical_reports.jsonl",
+        mime="application/x-ndjson",
+        use_container_width=True
+    )
+
+# ============================================================
+# RESULTS SECTION (LOCAL EMBEDDING-BASED HALLUCINATION CHECK)
+# ============================================================
+
+if not batch_mode and st.session_state.medical_report and st.session_state.layman_report:
     st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
     st.markdown("## 📋 Analysis Results")
     
     # ------------------------------------------------------------
     # 1) Sentence Similarity Score (your current method)
     # ------------------------------------------------------------
-    similarity_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-    medical_embedding = similarity_model.encode(st.session_state.medical_report, convert_to_tensor=True)
-    layman_embedding = similarity_model.encode(st.session_state.layman_report, convert_to_tensor=True)
-    similarity_score = util.cos_sim(medical_embedding, layman_embedding).item()
+    results_timings = Spans()
+    with results_timings.span("embedding_similarity"):
+        similarity_score = report_similarity(
+            st.session_state.medical_report, st.session_state.layman_report
+        )
 
     # ------------------------------------------------------------
-    # 2) LLM-ONLY Hallucination / Difference Check
+    # 2) Local Hallucination / Difference Check (sentence embeddings)
     # ------------------------------------------------------------
-    with st.spinner("🔍 Checking report accuracy..."):
-        analysis_model = genai.GenerativeModel('gemini-2.5-flash')
-
-        comparison_prompt = f"""
-You are a medical analysis expert LLM.
-
-Two reports are provided:
-- Report A = Original medical report  
-- Report B = Layman translation generated by another LLM  
-
-Your ONLY job:
-- Decide if Report B contains *hallucinations* (incorrect additions NOT in Report A).  
-- Normal explanation or simplification is allowed.  
-- Only WRONG MEDICAL ADDITIONS count as hallucinations.
-
-Return EXACTLY this format:
-
-Hallucinated: YES or NO  
-Difference: HIGH / MEDIUM / LOW  
-Explanation: <short explanation>  
-Hallucination Score: <0-100 number>
-
------------------
-Report A:
-{st.session_state.medical_report}
-
-Report B:
-{st.session_state.layman_report}
-"""
-
-        analysis_response = analysis_model.generate_content(comparison_prompt)
-        analysis_text = analysis_response.text
-
-        # ---- PARSE OUTPUT ----
-        hallucinated = "UNKNOWN"
-        difference = "UNKNOWN"
-        explanation = "No explanation found."
-        hallucination_score = 0
-
-        for line in analysis_text.split("\n"):
-            line = line.strip()
-            if line.lower().startswith("hallucinated:"):
-                hallucinated = line.split(":")[1].strip()
-            elif line.lower().startswith("difference:"):
-                difference = line.split(":")[1].strip()
-            elif line.lower().startswith("explanation:"):
-                explanation = line.split(":", 1)[1].strip()
-            elif "hallucination score" in line.lower():
-                try:
-                    hallucination_score = int(line.split(":")[1].strip())
-                except:
-                    hallucination_score = 0
+    with st.spinner("🔍 Checking report accuracy..."), results_timings.span("verification"):
+        hallucinated, difference, explanation, hallucination_score = check_hallucination(
+            st.session_state.medical_report, st.session_state.layman_report
+        )
 
     # ------------------------------------------------------------
     # MEDICAL REPORT CARD
     # ------------------------------------------------------------
     st.markdown("### 🔬 Medical Report")
-    medical_html = markdown_to_html(st.session_state.medical_report)
-    st.markdown(f"""
-    <div class="report-card medical-report-card">
-        <div class="report-header"><span>🔬</span> Technical Medical Analysis</div>
-        <div class="report-content">{medical_html}</div>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(medical_report_card(st.session_state.medical_report), unsafe_allow_html=True)
 
     st.download_button(
         label="📥 Download",
@@ -682,9 +799,9 @@ Report B:
 
 
     # ------------------------------------------------------------
-    # HALLUCINATION CHECK RESULTS (LLM ONLY)
+    # HALLUCINATION CHECK RESULTS (LOCAL)
     # ------------------------------------------------------------
-    st.markdown("### 🤖 LLM Consistency & Hallucination Check")
+    st.markdown("### 🤖 Consistency & Hallucination Check")
 
     st.markdown(f"""
     <div class="report-card comparison-card">
@@ -714,6 +831,17 @@ Report B:
     </div>
     """, unsafe_allow_html=True)
 
+    # ------------------------------------------------------------
+    # STAGE TIMINGS
+    # ------------------------------------------------------------
+    with st.expander("⏱️ Stage timings"):
+        frontend = dict(st.session_state.timings.timings) if st.session_state.timings else {}
+        frontend.update(results_timings.timings)
+        backend = st.session_state.timings.values.get('backend', {}) if st.session_state.timings else {}
+        rows = [{'side': 'frontend', 'stage': k, 'ms': v} for k, v in frontend.items()]
+        rows += [{'side': 'backend', 'stage': k, 'ms': v} for k, v in backend.items()]
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+
     st.markdown("<br><br>", unsafe_allow_html=True)
 
 
@@ -0,0 +1,689 @@
+"""CheXagent inference API served from the Colab notebook
+
+The notebook loads the model and calls `create_app`; benchmarks and load
+tests build the same app around a stand-in model.
+"""
+from flask import Flask, Response, request, jsonify, stream_with_context
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+import torch
+import base64
+import json
+import math
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from io import BytesIO
+from PIL import Image
+import threading
+import time
+
+from utils.admission import AdmissionController, Overloaded
+from utils.assisted import AssistedDecoder
+from utils.batching import MicroBatcher
+from utils.inference import (REPORT_PROMPT, WORKUP_PROMPTS, InMemoryImages, VisionFeatureCache,
+                             generate_reports, stream_report)
+from utils.job_queue import DONE, QUEUED
+from utils.metrics import MetricsRegistry, Spans
+from utils.prompt_cache import PromptTemplate
+from utils.report_cache import ReportCache, cache_key, pixel_digest
+from utils.worker_pool import CPUWorkerPool
+
+MODEL_NAME = "StanfordAIMI/CheXagent-2-3b"
+
+# Stages that run inside a batch; everything else a request waits for is queueing
+BATCH_STAGES = ("tokenize", "from_list_format", "apply_chat_template", "generate", "decode")
+
+def read_upload():
+    """Raw image bytes from a multipart, raw-bytes or legacy base64 JSON request"""
+    if 'image' in request.files:
+        return request.files['image'].read()
+    if request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+        return request.get_data()
+    data = request.get_json(silent=True)
+    if data and 'image' in data:
+        return base64.b64decode(data['image'])
+    return None
+
+
+def iter_upload_files(stream, boundary, chunk_size=64 * 1024):
+    """Yield (filename, bytes) per file part of a multipart body as soon as it has arrived
+
+    The body is parsed incrementally, so the first images reach the model
+    while later ones are still uploading.
+    """
+    decoder = MultipartDecoder(boundary.encode())
+    name, chunks = None, []
+    while True:
+        data = stream.read(chunk_size)
+        decoder.receive_data(data or None)
+        event = decoder.next_event()
+        while not isinstance(event, (NeedData, Epilogue)):
+            if isinstance(event, File):
+                name, chunks = event.filename or event.name, []
+            elif isinstance(event, Field):
+                name = None
+            elif isinstance(event, Data) and name is not None:
+                chunks.append(event.data)
+                if not event.more_data:
+                    yield name, b"".join(chunks)
+                    name = None
+            event = decoder.next_event()
+        if isinstance(event, Epilogue) or not data:
+            return
+
+
+def create_app(model, tokenizer, device, model_name=MODEL_NAME, model_revision="main",
+               report_cache=None, max_batch_size=8, max_wait_ms=15, max_queue=32,
+               job_store=None, job_ttl=24 * 3600, vision_cache_mb=256,
+               cpu_workers=0, threads_per_worker=None, draft_model=None, near_duplicates=None):
+    """Build the Flask API around an already-loaded model and tokenizer
+
+    Pass a `JobStore` to enable the asynchronous `/jobs` API and its worker.
+    On CPU, `cpu_workers` > 0 runs inference in that many forked processes
+    sharing the weights. A `draft_model` enables assisted decoding for
+    single-study generations, kept only if a startup check shows identical
+    output.
+    With a `NearDuplicateIndex`, slightly altered copies of analyzed studies
+    get the stored report, flagged as a near-duplicate.
+    """
+    app = Flask(__name__)
+
+    # Reports are deterministic (greedy decoding), so repeat studies are served from cache
+    if report_cache is None:
+        report_cache = ReportCache("report_cache")
+
+    def lookup(image, digest):
+        """Stored report for these pixels or, failing that, for a near-duplicate study
+
+        Returns (report, near) where `near` describes the matched study, if any.
+        """
+        report = report_cache.get(cache_key(digest, REPORT_PROMPT, model_name, model_revision))
+        if report is not None or near_duplicates is None:
+            return report, None
+        for distance, match in near_duplicates.query(image, digest):
+            report = report_cache.get(cache_key(match, REPORT_PROMPT, model_name, model_revision))
+            if report is not None:
+                near_duplicates.hit()
+                return report, {'distance': distance, 'digest': match}
+        return None, None
+
+    def remember(image, digest, report):
+        report_cache.put(cache_key(digest, REPORT_PROMPT, model_name, model_revision), report)
+        if near_duplicates is not None:
+            near_duplicates.add(image, digest)
+
+    # Batched generation pads on the left so every prompt ends at the same position
+    tokenizer.padding_side = "left"
+
+    # Uploaded images are handed to the vision encoder from memory, not via temp
+    # files; their features are kept per study so follow-up prompts skip the vision tower
+    feature_cache = VisionFeatureCache(vision_cache_mb * 1024 * 1024)
+    image_store = InMemoryImages(model, feature_cache)
+
+    # The fixed system prompt and instruction are tokenized once, not per request
+    template = PromptTemplate(tokenizer)
+
+    # One generate() barely uses all cores on CPU; forked workers share the weights.
+    # Forked before anything runs the model so no thread pool state is inherited
+    worker_pool = None
+    if cpu_workers and str(device) == "cpu":
+        worker_pool = CPUWorkerPool(model, tokenizer, device, image_store, cpu_workers,
+                                    threads_per_worker, template)
+        print(f"✅ {cpu_workers} CPU workers × {worker_pool.threads_per_worker} threads")
+
+    # A small draft LM proposes tokens that the main model verifies in one pass
+    assistant = None
+    if draft_model is not None and worker_pool is None:
+        assistant = AssistedDecoder(model, draft_model, tokenizer)
+        check = assistant.verify(model, device, image_store, template)
+        if check is not None:
+            print(f"✅ Assisted decoding enabled (acceptance {check['acceptance_rate']:.0%}, "
+                  f"speedup {check['speedup']}x on the startup check)")
+        else:
+            print("⚠️ Assisted decoding changes this model's output; disabled")
+            assistant = None
+
+    def generate(studies, prompt=REPORT_PROMPT, max_new_tokens=512, spans=None, listeners=None):
+        """Reports for studies given as lists of (image, pixel digest) pairs
+
+        `listeners` get partial text per study; worker processes don't report it.
+        """
+        if worker_pool is not None:
+            return worker_pool.generate(studies, prompt, max_new_tokens, spans)
+        with ExitStack() as stack:
+            paths = [[stack.enter_context(image_store.register(image, key=digest)) for image, digest in study]
+                     for study in studies]
+            return generate_reports(model, tokenizer, device, paths, prompt, max_new_tokens, spans,
+                                    template=template, assistant=assistant, listeners=listeners)
+
+    def stream(image, digest, spans):
+        """Report events for one image, from a worker process when there is a pool"""
+        if worker_pool is not None:
+            yield from worker_pool.stream([(image, digest)], spans=spans)
+            return
+        with image_store.register(image, key=digest) as image_path:
+            yield from stream_report(model, tokenizer, device, [image_path], spans=spans,
+                                     template=template, assistant=assistant)
+
+    def run_batch(items):
+        """Generate a batch of (study, partial-text listener or None) items
+
+        Every study in it shares the batch's stage timings.
+        """
+        spans = Spans()
+        listeners = [listener for _, listener in items]
+        reports = generate([study for study, _ in items], spans=spans,
+                           listeners=listeners if any(listeners) else None)
+        return [(report, spans) for report in reports]
+
+    # Micro-batching: concurrent requests are held up to max_wait_ms and
+    # padded into one generate() call of at most max_batch_size studies
+    batch_slots = worker_pool.workers if worker_pool is not None else 1
+    batcher = MicroBatcher(
+        run_batch,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        concurrency=batch_slots
+    )
+
+    # Backpressure: at most max_queue studies generating or waiting to; the
+    # rest get an immediate 429 instead of piling up until they time out
+    admission = AdmissionController(max_queue)
+
+    # Per-stage latency histograms, scraped from /metrics
+    metrics = MetricsRegistry()
+    metrics.gauge("queue_pending", batcher.pending)
+    metrics.gauge("in_flight", admission.in_flight)
+    metrics.gauge("report_cache_hit_rate", lambda: report_cache.stats()['hit_rate'])
+
+    app.extensions['chexagent'] = {
+        'batcher': batcher,
+        'admission': admission,
+        'metrics': metrics,
+        'report_cache': report_cache,
+        'job_store': job_store,
+        'worker_pool': worker_pool
+    }
+
+    # Queued jobs go through the micro-batcher and hold admission slots like
+    # interactive requests; at most enough of them to fill every batch slot
+    job_slots = threading.BoundedSemaphore(max_batch_size * batch_slots)
+    # Finished jobs are saved off the batcher thread so the next batch starts at once
+    job_finisher = ThreadPoolExecutor(max_workers=1)
+
+    def finish_job(job_id, image, digest, spans, admitted, future):
+        admission.release(time.perf_counter() - admitted)
+        job_slots.release()
+        try:
+            report, batch_spans = future.result()
+            spans.merge(batch_spans)
+            remember(image, digest, report)
+            job_store.finish(job_id, report, spans.timings)
+        except Exception as e:
+            job_store.fail(job_id, str(e))
+            metrics.inc("requests_total", {'endpoint': 'jobs', 'status': 'error'})
+            print(f"❌ Job {job_id} failed: {str(e)}")
+            return
+        metrics.observe_spans(spans)
+        metrics.inc("requests_total", {'endpoint': 'jobs', 'status': 'success'})
+        print(f"✅ Job {job_id} finished")
+
+    def start_job(job_id, image_data):
+        """Answer a claimed job from the cache or queue it for batching; True if queued"""
+        spans = Spans()
+        try:
+            with spans.span("image_decode"):
+                image = Image.open(BytesIO(image_data))
+                image.load()
+
+            # An identical study may have finished while this one was queued
+            digest = pixel_digest(image)
+            report, _ = lookup(image, digest)
+            if report is not None:
+                job_store.finish(job_id, report, spans.timings)
+                metrics.inc("requests_total", {'endpoint': 'jobs', 'status': 'cached'})
+                return False
+        except Exception as e:
+            job_store.fail(job_id, str(e))
+            metrics.inc("requests_total", {'endpoint': 'jobs', 'status': 'error'})
+            print(f"❌ Job {job_id} failed: {str(e)}")
+            return False
+
+        admission.acquire()
+        admitted = time.perf_counter()
+        future = batcher.enqueue(([(image, digest)], lambda text: job_store.update_partial(job_id, text)))
+        future.add_done_callback(
+            lambda f: job_finisher.submit(finish_job, job_id, image, digest, spans, admitted, f)
+        )
+        return True
+
+    def run_jobs():
+        """Feed queued jobs to the micro-batcher; partial output is saved as reports decode"""
+        last_purge = 0.0
+        while True:
+            job_slots.acquire()
+            claimed = job_store.claim()
+            if claimed is None or not start_job(*claimed[:2]):
+                job_slots.release()
+            if claimed is None and time.time() - last_purge > 60:
+                job_store.purge(job_ttl)
+                last_purge = time.time()
+
+    if job_store is not None:
+        # Whatever was running when the backend last stopped starts over
+        requeued = job_store.requeue_running()
+        if requeued:
+            print(f"🔁 Re-queued {requeued} interrupted job(s)")
+        metrics.gauge("jobs_queued", lambda: job_store.counts()[QUEUED])
+        threading.Thread(target=run_jobs, daemon=True).start()
+
+    def overloaded(endpoint, retry_after):
+        """429 with a Retry-After the client can honour"""
+        metrics.inc("requests_total", {'endpoint': endpoint, 'status': 'rejected'})
+        print(f"🚦 Busy, asking client to retry in {retry_after} s")
+        response = jsonify({
+            'status': 'error',
+            'error': f'Server busy, retry in {retry_after} s',
+            'retry_after': retry_after
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    @app.route('/', methods=['GET'])
+    def health_check():
+        """Health check endpoint"""
+        return jsonify({
+            'status': 'online',
+            'message': 'CheXagent API is running',
+            'device': str(device),
+            'model': model_name,
+            'gpu_available': torch.cuda.is_available(),
+            'gpu_name': torch.cuda.get_device_name(0) if torch.cuda.is_available() else 'N/A',
+            'batching': batcher.stats(),
+            'admission': admission.stats(),
+            'cache': report_cache.stats(),
+            'vision_cache': feature_cache.info(),
+            'workers': worker_pool.info() if worker_pool is not None else None,
+            'assisted': assistant.info() if assistant is not None else None,
+            'near_duplicates': near_duplicates.info() if near_duplicates is not None else None,
+            'jobs': job_store.counts() if job_store is not None else None
+        })
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        """Prometheus scrape endpoint"""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/analyze', methods=['POST'])
+    def analyze_xray():
+        """Analyze chest X-ray image"""
+        spans = Spans()
+        try:
+            with spans.span("read_upload"):
+                image_data = read_upload()
+
+            if not image_data:
+                return jsonify({
+                    'status': 'error',
+                    'error': 'No image data provided'
+                }), 400
+
+            print("📥 Receiving image data...")
+            with spans.span("image_decode"):
+                image = Image.open(BytesIO(image_data))
+                image.load()
+
+            with spans.span("cache_lookup"):
+                digest = pixel_digest(image)
+                report, near = lookup(image, digest)
+            if report is not None:
+                print("⚡ Near-duplicate, returning stored report" if near else "⚡ Cache hit, returning stored report")
+                metrics.observe_spans(spans)
+                metrics.inc("requests_total", {'endpoint': 'analyze', 'status': 'near_duplicate' if near else 'cached'})
+                return jsonify({
+                    'status': 'success',
+                    'report': report,
+                    'cached': True,
+                    'near_duplicate': near,
+                    'timings': spans.timings
+                })
+
+            print("🚀 Queued for batched inference...")
+
+            # Blocks until this study's batch has been generated
+            submitted = time.perf_counter()
+            with admission.admit():
+                report, batch_spans = batcher.submit(([(image, digest)], None))
+            waited_ms = (time.perf_counter() - submitted) * 1000
+            spans.merge(batch_spans)
+            spans.record("queue_wait", max(0.0, waited_ms - sum(batch_spans.timings.get(s, 0) for s in BATCH_STAGES)))
+            remember(image, digest, report)
+
+            print("✅ Report generated successfully!")
+            metrics.observe_spans(spans)
+            metrics.inc("requests_total", {'endpoint': 'analyze', 'status': 'success'})
+
+            return jsonify({
+                'status': 'success',
+                'report': report,
+                'timings': spans.timings,
+                'tokens_per_second': spans.values.get('tokens_per_second'),
+                'assisted': spans.values.get('assisted')
+            })
+
+        except Overloaded as e:
+            return overloaded('analyze', e.retry_after)
+
+        except Exception as e:
+            metrics.inc("requests_total", {'endpoint': 'analyze', 'status': 'error'})
+            print(f"❌ Error during analysis: {str(e)}")
+            import traceback
+            traceback.print_exc()  # Print full traceback for debugging
+            return jsonify({
+                'status': 'error',
+                'error': str(e)
+            }), 500
+
+    @app.route('/analyze_stream', methods=['POST'])
+    def analyze_xray_stream():
+        """Analyze chest X-ray image, streaming the report as NDJSON events"""
+        spans = Spans()
+        with spans.span("read_upload"):
+            image_data = read_upload()
+
+        if not image_data:
+            return jsonify({
+                'status': 'error',
+                'error': 'No image data provided'
+            }), 400
+
+        print("📥 Receiving image data (streaming)...")
+        try:
+            with spans.span("image_decode"):
+                image = Image.open(BytesIO(image_data))
+                image.load()
+        except Exception as e:
+            metrics.inc("requests_total", {'endpoint': 'analyze_stream', 'status': 'error'})
+            return jsonify({'status': 'error', 'error': f'Unreadable image: {str(e)}'}), 400
+
+        with spans.span("cache_lookup"):
+            digest = pixel_digest(image)
+            report, near = lookup(image, digest)
+
+        if report is None and not admission.try_acquire():
+            return overloaded('analyze_stream', admission.retry_after())
+        started = time.perf_counter()
+
+        def events():
+            if report is not None:
+                print("⚡ Near-duplicate, returning stored report" if near else "⚡ Cache hit, returning stored report")
+                metrics.observe_spans(spans)
+                metrics.inc("requests_total", {'endpoint': 'analyze_stream',
+                                               'status': 'near_duplicate' if near else 'cached'})
+                yield json.dumps({'type': 'done', 'report': report, 'cached': True, 'near_duplicate': near,
+                                  'timings': spans.timings}) + "\n"
+                return
+
+            try:
+                for event in stream(image, digest, spans):
+                    if event['type'] == 'done':
+                        remember(image, digest, event['report'])
+                        metrics.observe_spans(spans)
+                        metrics.inc("requests_total", {'endpoint': 'analyze_stream', 'status': 'success'})
+                        event['timings'] = spans.timings
+                        event['tokens_per_second'] = spans.values.get('tokens_per_second')
+                        event['assisted'] = spans.values.get('assisted')
+                        print("✅ Report streamed successfully!")
+                    yield json.dumps(event) + "\n"
+            except Exception as e:
+                print(f"❌ Error during streaming analysis: {str(e)}")
+                metrics.inc("requests_total", {'endpoint': 'analyze_stream', 'status': 'error'})
+                yield json.dumps({'type': 'error', 'error': str(e)}) + "\n"
+
+        response = Response(events(), mimetype='application/x-ndjson')
+        if report is None:
+            # Released when the stream closes, even if the client disconnects early
+            response.call_on_close(lambda: admission.release(time.perf_counter() - started))
+        return response
+
+    @app.route('/analyze_batch', methods=['POST'])
+    def analyze_batch():
+        """Analyze many chest X-rays from one multipart upload, streaming NDJSON results
+
+        Every file part is queued for batched inference as soon as it has
+        arrived. One `{"type": "result", ...}` or `{"type": "error", ...}`
+        line is written per image, in completion order, then a
+        `{"type": "done", ...}` summary. A bad image only fails its own line.
+
+        Lines are held back until the whole body has been read: clients
+        like `requests` only read the response once their upload is sent,
+        so writing earlier could fill the socket buffers and stall both
+        sides.
+        """
+        boundary = request.mimetype_params.get('boundary')
+        if request.mimetype != 'multipart/form-data' or not boundary:
+            return jsonify({
+                'status': 'error',
+                'error': 'Expected a multipart/form-data upload'
+            }), 400
+        upload = request.stream
+        started = time.perf_counter()
+
+        def results():
+            pending = {}
+            counts = {'result': 0, 'error': 0}
+
+            def line(event):
+                counts[event['type']] += 1
+                return json.dumps(event) + "\n"
+
+            def collect(block):
+                """Lines for queued studies that have finished, waiting for one if `block`"""
+                if block and pending:
+                    wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in [f for f in pending if f.done()]:
+                    index, name, image, digest, submitted = pending.pop(future)
+                    admission.release(time.perf_counter() - submitted)
+                    try:
+                        report, batch_spans = future.result()
+                    except Exception as e:
+                        print(f"❌ Error analyzing {name}: {str(e)}")
+                        metrics.inc("requests_total", {'endpoint': 'analyze_batch', 'status': 'error'})
+                        yield line({'type': 'error', 'index': index, 'id': name, 'error': str(e)})
+                        continue
+                    remember(image, digest, report)
+                    metrics.observe_spans(batch_spans)
+                    metrics.inc("requests_total", {'endpoint': 'analyze_batch', 'status': 'success'})
+                    yield line({'type': 'result', 'index': index, 'id': name, 'report': report,
+                                'cached': False, 'timings': batch_spans.timings})
+
+            try:
+                held = []
+                for index, (name, image_data) in enumerate(iter_upload_files(upload, boundary)):
+                    held.extend(collect(block=False))
+                    try:
+                        image = Image.open(BytesIO(image_data))
+                        image.load()
+                        digest = pixel_digest(image)
+                        report, near = lookup(image, digest)
+                    except Exception as e:
+                        metrics.inc("requests_total", {'endpoint': 'analyze_batch', 'status': 'error'})
+                        held.append(line({'type': 'error', 'index': index, 'id': name,
+                                          'error': f'Unreadable image: {str(e)}'}))
+                        continue
+
+                    if report is not None:
+                        metrics.inc("requests_total", {'endpoint': 'analyze_batch',
+                                                       'status': 'near_duplicate' if near else 'cached'})
+                        held.append(line({'type': 'result', 'index': index, 'id': name, 'report': report,
+                                          'cached': True, 'near_duplicate': near}))
+                        continue
+
+                    # This upload's own finished studies make room; refuse only if none are queued
+                    admitted = admission.try_acquire()
+                    while not admitted and pending:
+                        held.extend(collect(block=True))
+                        admitted = admission.try_acquire()
+                    if not admitted:
+                        retry_after = admission.retry_after()
+                        metrics.inc("requests_total", {'endpoint': 'analyze_batch', 'status': 'rejected'})
+                        held.append(line({'type': 'error', 'index': index, 'id': name,
+                                          'error': f'Server busy, retry in {retry_after} s',
+                                          'retry_after': retry_after}))
+                        continue
+                    pending[batcher.enqueue(([(image, digest)], None))] = (index, name, image, digest,
+                                                                           time.perf_counter())
+
+                # The upload is complete; from here on every line goes out as it is ready
+                yield from held
+                while pending:
+                    yield from collect(block=True)
+            finally:
+                # If the client went away, free the admission slots as the rest finish
+                for future, (_, _, _, _, submitted) in pending.items():
+                    future.add_done_callback(lambda f, s=submitted: admission.release(time.perf_counter() - s))
+
+            print(f"✅ Batch of {counts['result'] + counts['error']} studies done")
+            yield json.dumps({
+                'type': 'done',
+                'count': counts['result'] + counts['error'],
+                'succeeded': counts['result'],
+                'failed': counts['error'],
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+            }) + "\n"
+
+        return Response(stream_with_context(results()), mimetype='application/x-ndjson')
+
+    @app.route('/workup', methods=['POST'])
+    def workup():
+        """Answer several prompts about one chest X-ray from a single vision pass
+
+        Optional fields: `prompts` (JSON object name -> prompt, default
+        WORKUP_PROMPTS), `batch` (0 to decode prompts one at a time) and
+        `max_new_tokens`.
+        """
+        spans = Spans()
+        try:
+            image_data = read_upload()
+            if not image_data:
+                return jsonify({
+                    'status': 'error',
+                    'error': 'No image data provided'
+                }), 400
+
+            fields = request.form if request.form else (request.get_json(silent=True) or {})
+            prompts = fields.get('prompts') or WORKUP_PROMPTS
+            if isinstance(prompts, str):
+                prompts = json.loads(prompts)
+            batch = str(fields.get('batch', '1')).lower() not in ('0', 'false', 'no')
+            max_new_tokens = int(fields.get('max_new_tokens', 512))
+
+            with spans.span("image_decode"):
+                image = Image.open(BytesIO(image_data))
+                image.load()
+
+            answers, keys, cached = {}, {}, []
+            with spans.span("cache_lookup"):
+                digest = pixel_digest(image)
+                for name, prompt in prompts.items():
+                    keys[name] = cache_key(digest, prompt, model_name, model_revision)
+                    answers[name] = report_cache.get(keys[name])
+                    if answers[name] is not None:
+                        cached.append(name)
+            todo = [name for name in prompts if answers[name] is None]
+
+            if todo:
+                print(f"🩻 Work-up: {len(todo)} prompt(s), {'batched' if batch else 'sequential'}...")
+                with admission.admit():
+                    if batch:
+                        outputs = generate([[(image, digest)]] * len(todo), [prompts[name] for name in todo],
+                                           max_new_tokens, spans)
+                    else:
+                        outputs = [generate([[(image, digest)]], prompts[name], max_new_tokens, spans)[0]
+                                   for name in todo]
+                for name, output in zip(todo, outputs):
+                    answers[name] = output
+                    report_cache.put(keys[name], output)
+
+            metrics.observe_spans(spans)
+            metrics.inc("requests_total", {'endpoint': 'workup', 'status': 'success'})
+            return jsonify({
+                'status': 'success',
+                'answers': answers,
+                'cached': cached,
+                'timings': spans.timings,
+                'vision_cache': feature_cache.info()
+            })
+
+        except Overloaded as e:
+            return overloaded('workup', e.retry_after)
+
+        except Exception as e:
+            metrics.inc("requests_total", {'endpoint': 'workup', 'status': 'error'})
+            print(f"❌ Error during work-up: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'error': str(e)
+            }), 500
+
+    @app.route('/jobs', methods=['POST'])
+    def submit_job():
+        """Queue a chest X-ray for analysis and return its job ID immediately"""
+        if job_store is None:
+            return jsonify({'status': 'error', 'error': 'Job API is not enabled'}), 404
+
+        image_data = read_upload()
+        if not image_data:
+            return jsonify({
+                'status': 'error',
+                'error': 'No image data provided'
+            }), 400
+
+        try:
+            image = Image.open(BytesIO(image_data))
+            image.load()
+        except Exception as e:
+            return jsonify({'status': 'error', 'error': f'Unreadable image: {str(e)}'}), 400
+
+        digest = pixel_digest(image)
+        key = cache_key(digest, REPORT_PROMPT, model_name, model_revision)
+        report, near = lookup(image, digest)
+        job_id = job_store.submit(image_data if report is None else None, key, report)
+        status = 'queued' if report is None else 'near_duplicate' if near else 'cached'
+        metrics.inc("requests_total", {'endpoint': 'jobs', 'status': status})
+        print(f"📥 Job {job_id} {'queued' if report is None else 'answered from cache'}")
+
+        return jsonify({
+            'status': 'success',
+            'job_id': job_id,
+            'state': DONE if report is not None else QUEUED,
+            'cached': report is not None,
+            'near_duplicate': near
+        }), 202
+
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    def job_status(job_id):
+        """Job state, partial output and result
+
+        `?wait=<s>` long-polls (up to 30 s) until the job has more than
+        `?since=<n>` characters of output or has finished. Values that aren't
+        numbers get a 400; negative ones count as 0.
+        """
+        if job_store is None:
+            return jsonify({'status': 'error', 'error': 'Job API is not enabled'}), 404
+
+        try:
+            wait = float(request.args.get('wait', 0))
+            since = int(request.args.get('since', 0))
+            if not math.isfinite(wait):
+                raise ValueError(wait)
+        except ValueError:
+            return jsonify({'status': 'error', 'error': "'wait' and 'since' must be numbers"}), 400
+        wait = min(max(wait, 0.0), 30.0)
+        since = max(since, 0)
+        job = job_store.wait(job_id, since, wait) if wait > 0 else job_store.get(job_id)
+        if job is None:
+            return jsonify({'status': 'error', 'error': 'Unknown job'}), 404
+        return jsonify({'status': 'success', **job})
+
+    return app
@@ -0,0 +1,140 @@
+"""Assisted-decoding benchmark with tiny random-init transformers models
+
+The main model is a small GPT-2 and the draft keeps only its first layer(s),
+sharing its embeddings and vocabulary. Each synthetic study is generated
+with plain greedy decoding and through transformers' `assistant_model`
+path; the benchmark checks the reports are identical and reports the
+acceptance rate and decode speedup per study:
+
+    python -m benchmarks.assisted --studies 12 --layers 8 --draft-layers 1
+
+Exits non-zero if any assisted report differs from the greedy one.
+"""
+import argparse
+import copy
+import json
+import sys
+
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from benchmarks.e2e import summarize
+from benchmarks.stubs import StubTokenizer
+from utils.assisted import AssistedDecoder
+from utils.inference import InMemoryImages, generate_reports
+from utils.metrics import Spans
+from utils.prompt_cache import PromptTemplate
+
+
+def build_models(layers=8, draft_layers=1, hidden=512, vocab_size=2048, seed=0):
+    """Random-init GPT-2 and a draft made of its embeddings and first `draft_layers` blocks
+
+    The residual stream of a freshly initialized GPT-2 is dominated by the
+    embeddings, so the truncated copy agrees with the full model often
+    enough for a meaningful acceptance rate.
+    """
+    torch.manual_seed(seed)
+    config = GPT2Config(
+        vocab_size=vocab_size,
+        n_positions=1024,
+        n_embd=hidden,
+        n_layer=layers,
+        n_head=8,
+        bos_token_id=StubTokenizer.eos_token_id,
+        eos_token_id=StubTokenizer.eos_token_id,
+        pad_token_id=StubTokenizer.pad_token_id
+    )
+    model = GPT2LMHeadModel(config).eval()
+
+    draft_config = copy.deepcopy(config)
+    draft_config.n_layer = draft_layers
+    draft = GPT2LMHeadModel(draft_config).eval()
+    # The main model's later blocks are "unexpected" for the draft and skipped
+    draft.load_state_dict(model.state_dict(), strict=False)
+    return model, draft
+
+
+def run(studies=12, layers=8, draft_layers=1, hidden=512, max_new_tokens=128, num_assistant_tokens=5):
+    tokenizer = StubTokenizer()
+    model, draft = build_models(layers, draft_layers, hidden)
+    image_store = InMemoryImages(model)
+    template = PromptTemplate(tokenizer)
+
+    assistant = AssistedDecoder(model, draft, tokenizer, num_assistant_tokens=num_assistant_tokens)
+    assistant.verify(model, "cpu", image_store, template)
+    if not assistant.enabled:
+        raise RuntimeError("Startup check found assisted output differing from greedy; assistance disabled")
+
+    rows = []
+    for seed in range(studies):
+        # A text-only LM never opens the image; the path just makes each prompt different
+        study = [f"study-{seed}.png"]
+        plain_spans, assisted_spans = Spans(), Spans()
+        plain = generate_reports(model, tokenizer, "cpu", [study], max_new_tokens=max_new_tokens,
+                                 spans=plain_spans, template=template)
+        assisted = generate_reports(model, tokenizer, "cpu", [study], max_new_tokens=max_new_tokens,
+                                    spans=assisted_spans, template=template, assistant=assistant)
+        stats = assisted_spans.values['assisted']
+        rows.append({
+            'seed': seed,
+            'identical': plain == assisted,
+            'new_tokens': assisted_spans.values['new_tokens'],
+            'plain_ms': plain_spans.timings['generate'],
+            'assisted_ms': assisted_spans.timings['generate'],
+            'speedup': round(plain_spans.timings['generate'] / assisted_spans.timings['generate'], 2),
+            'estimated_speedup': stats['speedup'],
+            'acceptance_rate': stats['acceptance_rate']
+        })
+
+    return {
+        'config': {
+            'studies': studies,
+            'layers': layers,
+            'draft_layers': draft_layers,
+            'hidden': hidden,
+            'max_new_tokens': max_new_tokens,
+            'num_assistant_tokens': num_assistant_tokens
+        },
+        'studies': rows,
+        'identical': all(row['identical'] for row in rows),
+        'plain': summarize([row['plain_ms'] for row in rows]),
+        'assisted': summarize([row['assisted_ms'] for row in rows]),
+        'decoder': assistant.info()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=12)
+    parser.add_argument("--layers", type=int, default=8, help="Main model transformer blocks")
+    parser.add_argument("--draft-layers", type=int, default=1, help="Blocks kept in the draft")
+    parser.add_argument("--hidden", type=int, default=512, help="Hidden size of both models")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--num-assistant-tokens", type=int, default=5, help="Tokens drafted per pass")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    result = run(args.studies, args.layers, args.draft_layers, args.hidden, args.max_new_tokens,
+                 args.num_assistant_tokens)
+
+    print(f"{'seed':>4}{'tokens':>8}{'greedy ms':>12}{'assisted ms':>13}{'accepted':>10}{'speedup':>9}")
+    for row in result['studies']:
+        print(f"{row['seed']:>4}{row['new_tokens']:>8}{row['plain_ms']:>12}{row['assisted_ms']:>13}"
+              f"{row['acceptance_rate']:>10.0%}{row['speedup']:>8}x")
+    decoder = result['decoder']
+    print(f"\n🚀 Acceptance {decoder['acceptance_rate']:.0%}, p50 decode "
+          f"{result['plain']['p50_ms']} -> {result['assisted']['p50_ms']} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if not result['identical']:
+        print("❌ Assisted output differs from greedy decoding")
+        sys.exit(1)
+    print("✅ Assisted output identical to greedy decoding")
+
+
+if __name__ == "__main__":
+    main()
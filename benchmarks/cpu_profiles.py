@@ -0,0 +1,99 @@
+"""Compare CPU inference profiles for CheXagent
+
+Each profile runs in its own subprocess so peak RSS is measured cleanly:
+
+    python -m benchmarks.cpu_profiles xray.png --profiles fp32 bf16 int8 --threads 8
+"""
+import argparse
+import difflib
+import json
+import resource
+import subprocess
+import sys
+import time
+
+
+def peak_rss_mb():
+    # ru_maxrss is kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_profile(image_path, profile, num_threads, max_new_tokens):
+    """Load the model with one profile and time a single report"""
+    import torch
+    from utils.inference import build_input_ids, decode_report
+    from utils.model_loader import load_chexagent_model
+
+    started = time.perf_counter()
+    model, tokenizer, device = load_chexagent_model(cpu_profile=profile, num_threads=num_threads)
+    load_seconds = time.perf_counter() - started
+
+    input_ids = build_input_ids(tokenizer, [image_path]).unsqueeze(0).to(device)
+    started = time.perf_counter()
+    with torch.no_grad():
+        output = model.generate(
+            input_ids,
+            do_sample=False,
+            num_beams=1,
+            max_new_tokens=max_new_tokens
+        )[0]
+    generate_seconds = time.perf_counter() - started
+
+    new_tokens = output[input_ids.size(1):]
+    eos = tokenizer.eos_token_id
+    report = decode_report(tokenizer, new_tokens, {eos} if eos is not None else set())
+    return {
+        'profile': profile,
+        'threads': torch.get_num_threads(),
+        'load_seconds': round(load_seconds, 1),
+        'generate_seconds': round(generate_seconds, 1),
+        'new_tokens': len(new_tokens),
+        'tokens_per_second': round(len(new_tokens) / generate_seconds, 2),
+        'peak_rss_mb': round(peak_rss_mb()),
+        'report': report
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("image")
+    parser.add_argument("--profiles", nargs="+", default=["fp32", "bf16", "int8"])
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--max-new-tokens", type=int, default=512)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_profile(args.image, args.profiles[0], args.threads, args.max_new_tokens)
+        print(json.dumps(result))
+        return
+
+    # fp32 is the reference for report agreement
+    profiles = ["fp32"] + [p for p in args.profiles if p != "fp32"]
+    results = []
+    for profile in profiles:
+        cmd = [sys.executable, "-m", "benchmarks.cpu_profiles", args.image,
+               "--profiles", profile, "--max-new-tokens", str(args.max_new_tokens), "--child"]
+        if args.threads:
+            cmd += ["--threads", str(args.threads)]
+        print(f"🔄 Running {profile}...", file=sys.stderr)
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    baseline = results[0]['report']
+    print(f"{'profile':<8}{'threads':>8}{'load s':>8}{'tok/s':>8}{'RSS MB':>9}{'agree':>8}  exact")
+    for result in results:
+        result['agreement'] = round(difflib.SequenceMatcher(None, baseline, result['report']).ratio(), 3)
+        result['exact_match'] = result['report'] == baseline
+        print(f"{result['profile']:<8}{result['threads']:>8}{result['load_seconds']:>8}"
+              f"{result['tokens_per_second']:>8}{result['peak_rss_mb']:>9}{result['agreement']:>8}"
+              f"  {result['exact_match']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""End-to-end benchmark of the report pipeline with stand-in models
+
+Runs the real client -> Flask backend -> batching -> generation -> translation
+-> consistency path against deterministic stubs (no GPU, no Gemini key):
+
+    python -m benchmarks.e2e --studies 24 --concurrency 4 --output bench.json
+    python -m benchmarks.e2e --baseline bench.json --max-regression 0.2
+
+With --baseline, exits non-zero if any stage's p50 latency (or throughput)
+regressed by more than --max-regression.
+"""
+import argparse
+import json
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import make_server
+
+from backend import create_app
+from benchmarks.stubs import FakeUpload, StubChexagent, StubEmbedder, StubTokenizer, fake_gemini, synthetic_xray
+from utils.colab_client import analyze_with_colab, stream_with_colab
+from utils.consistency import check_consistency
+from utils.llm_client import LLMClient, StubBackend
+from utils.metrics import Spans
+from utils.postprocess import comparison_prompt, parse_hallucination, translation_prompt
+from utils.report_cache import ReportCache
+from utils.translation_memory import TranslationMemory
+
+# Stage p50s this small are mostly timer noise; don't flag them
+NOISE_FLOOR_MS = 2.0
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summarize(samples):
+    return {
+        'count': len(samples),
+        'mean_ms': round(sum(samples) / len(samples), 2) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50), 2),
+        'p95_ms': round(percentile(samples, 95), 2),
+        'max_ms': round(max(samples), 2) if samples else 0.0
+    }
+
+
+def start_backend(token_delay, max_batch_size, max_wait_ms, cache_dir, max_queue=32):
+    """Serve the real Flask app around the stub model on a free local port"""
+    tokenizer = StubTokenizer()
+    model = StubChexagent(tokenizer, token_delay=token_delay)
+    app = create_app(model, tokenizer, "cpu", model_name="stub-chexagent",
+                     report_cache=ReportCache(cache_dir),
+                     max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, max_queue=max_queue)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/analyze"
+
+
+class Pipeline:
+    """What the Streamlit app does per study, minus the UI"""
+
+    def __init__(self, url, llm_latency, memory):
+        self.url = url
+        self.client = LLMClient(StubBackend(fake_gemini, latency=llm_latency), requests_per_minute=60000)
+        self.memory = memory
+        self.embedder = StubEmbedder()
+
+    def run(self, seed):
+        spans = Spans()
+        upload = FakeUpload(synthetic_xray(seed))
+        with spans.span("end_to_end"):
+            report = analyze_with_colab(upload, self.url, spans=spans)
+
+            with spans.span("translate"):
+                layman = self.memory.translate(report, self.client.generate_blocking)
+                if layman is None:
+                    layman = self.client.generate_blocking(translation_prompt(report))
+
+            with spans.span("verify_llm"):
+                parse_hallucination(self.client.generate_blocking(comparison_prompt(report, layman)))
+
+            with spans.span("similarity"):
+                check_consistency(self.embedder, report, layman)
+
+        for stage, ms in spans.values.get('backend', {}).items():
+            spans.record(f"backend.{stage}", ms)
+        return spans
+
+
+def stream_first_token(url, seed):
+    """Time from request to the first streamed token, and to the finished report"""
+    started = time.perf_counter()
+    first = None
+    for event in stream_with_colab(FakeUpload(synthetic_xray(seed)), url):
+        if first is None:
+            first = time.perf_counter()
+    return (first - started) * 1000, (time.perf_counter() - started) * 1000
+
+
+def run(studies=24, concurrency=4, token_delay=0.005, llm_latency=0.05, max_batch_size=8, max_wait_ms=15):
+    with tempfile.TemporaryDirectory() as workdir:
+        server, url = start_backend(token_delay, max_batch_size, max_wait_ms, f"{workdir}/reports")
+        memory = TranslationMemory(f"{workdir}/memory.json")
+        try:
+            # Warm-up so imports and first-request setup don't skew stage one
+            Pipeline(url, llm_latency, memory).run(-1)
+
+            # Sequential: per-stage latency of one study at a time
+            pipeline = Pipeline(url, llm_latency, memory)
+            stage_samples = {}
+            for seed in range(studies):
+                for stage, ms in pipeline.run(seed).timings.items():
+                    stage_samples.setdefault(stage, []).append(ms)
+
+            # Concurrent: distinct studies so every request reaches the model
+            local = threading.local()
+
+            def worker(seed):
+                if not hasattr(local, 'pipeline'):
+                    local.pipeline = Pipeline(url, llm_latency, memory)
+                return local.pipeline.run(seed).timings['end_to_end']
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                concurrent = list(pool.map(worker, range(studies, 2 * studies)))
+            elapsed = time.perf_counter() - started
+
+            streamed = [stream_first_token(url, seed) for seed in range(2 * studies, 2 * studies + max(1, studies // 4))]
+        finally:
+            server.shutdown()
+
+    stages = {stage: summarize(samples) for stage, samples in sorted(stage_samples.items())}
+    stages['concurrent.end_to_end'] = summarize(concurrent)
+    stages['stream.first_token'] = summarize([first for first, _ in streamed])
+    stages['stream.total'] = summarize([total for _, total in streamed])
+
+    return {
+        'config': {
+            'studies': studies,
+            'concurrency': concurrency,
+            'token_delay': token_delay,
+            'llm_latency': llm_latency,
+            'max_batch_size': max_batch_size,
+            'max_wait_ms': max_wait_ms
+        },
+        'stages': stages,
+        'throughput_studies_per_second': round(len(concurrent) / elapsed, 2),
+        'translation_memory': dict(memory.stats, hit_rate=round(memory.hit_rate(), 3))
+    }
+
+
+def compare(result, baseline, max_regression):
+    """Return human-readable regressions against a previous run"""
+    regressions = []
+    for stage, stats in result['stages'].items():
+        before = baseline.get('stages', {}).get(stage)
+        if not before:
+            continue
+        limit = before['p50_ms'] * (1 + max_regression)
+        if stats['p50_ms'] > limit and stats['p50_ms'] - before['p50_ms'] > NOISE_FLOOR_MS:
+            regressions.append(f"{stage}: p50 {before['p50_ms']} ms -> {stats['p50_ms']} ms")
+
+    before = baseline.get('throughput_studies_per_second')
+    now = result['throughput_studies_per_second']
+    if before and now < before / (1 + max_regression):
+        regressions.append(f"throughput: {before} -> {now} studies/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Stub decode seconds per token")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Stub Gemini seconds per call")
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=15)
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--baseline", help="Previous --output to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed fractional slowdown before failing (default: 0.2)")
+    args = parser.parse_args()
+
+    result = run(args.studies, args.concurrency, args.token_delay, args.llm_latency,
+                 args.max_batch_size, args.max_wait_ms)
+
+    print(f"{'stage':<32}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    for stage, stats in result['stages'].items():
+        print(f"{stage:<32}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['mean_ms']:>10}")
+    print(f"\n🚀 Throughput at concurrency {args.concurrency}: "
+          f"{result['throughput_studies_per_second']} studies/s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.max_regression)
+        if regressions:
+            print("❌ Performance regressions:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print("✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
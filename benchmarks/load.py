@@ -0,0 +1,196 @@
+"""Replay an upload trace against /analyze at several client concurrencies
+
+Arrivals are open-loop: requests are released on the trace's schedule whether
+or not earlier ones have finished, and latency is measured from the scheduled
+arrival, so time spent waiting for a free client counts against the server.
+
+    python -m benchmarks.load --concurrency 1 4 16 64 --rate 20 --requests 200
+    python -m benchmarks.load --trace trace.jsonl --url https://xxxx.ngrok-free.app/analyze
+
+A trace is JSONL, one upload per line: {"image": "path/to/xray.png", "at": 0.25}
+(`at` = seconds from start; without it arrivals are Poisson at --rate).
+Without --url a local stand-in backend (stub model) is started.
+"""
+import argparse
+import json
+import queue
+import random
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.e2e import percentile, start_backend
+from benchmarks.stubs import FakeUpload, synthetic_xray
+from utils.preprocess import MODEL_INPUT_SIZE, prepare_upload
+
+# Same timeout the Streamlit client uses for /analyze
+CLIENT_TIMEOUT = 120
+
+
+def load_trace(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def arrival_times(count, rate, seed=0, trace=None):
+    """Scheduled send times (s): the trace's `at` fields, else a Poisson process"""
+    if trace and all('at' in row for row in trace):
+        return [float(row['at']) for row in trace[:count]]
+    rng = random.Random(seed)
+    times, t = [], 0.0
+    for _ in range(count):
+        t += rng.expovariate(rate)
+        times.append(t)
+    return times
+
+
+def prepare_payloads(count, trace=None, first_seed=0, target_size=MODEL_INPUT_SIZE):
+    """Upload bodies exactly as the app would send them (downscaled, re-encoded)"""
+    payloads = []
+    for i in range(count):
+        if trace:
+            path = trace[i % len(trace)]['image']
+            with open(path, "rb") as f:
+                upload = FakeUpload(f.read(), name=path)
+        else:
+            upload = FakeUpload(synthetic_xray(first_seed + i, size=1024))
+        _, data, mime, _ = prepare_upload(upload, target_size=target_size)
+        payloads.append((data, mime))
+    return payloads
+
+
+def run_level(url, payloads, arrivals, concurrency, timeout=CLIENT_TIMEOUT):
+    """Replay one trace with `concurrency` clients; returns one record per request"""
+    pending = queue.Queue()
+    results = []
+    lock = threading.Lock()
+    start = time.perf_counter() + 0.05
+
+    def client():
+        session = requests.Session()
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            index, at = item
+            data, mime = payloads[index]
+            sent = time.perf_counter()
+            try:
+                response = session.post(url, files={'image': ('xray', data, mime)}, timeout=timeout)
+                ok = response.status_code == 200 and response.json().get('status') == 'success'
+                # 429 is the backend shedding load on purpose, not a failure
+                status = "ok" if ok else "rejected" if response.status_code == 429 else "error"
+                code = response.status_code
+            except requests.Timeout:
+                status, code = "timeout", None
+            except (requests.RequestException, ValueError):
+                status, code = "error", None
+            done = time.perf_counter()
+
+            latency = done - (start + at)
+            # A reply the user gave up on is as good as a timeout
+            if status == "ok" and latency > timeout:
+                status = "timeout"
+            with lock:
+                results.append({
+                    'status': status,
+                    'code': code,
+                    'latency_ms': latency * 1000,
+                    'service_ms': (done - sent) * 1000,
+                    'done': done - start
+                })
+
+    clients = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for index, at in enumerate(arrivals):
+        delay = start + at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pending.put((index, at))
+    for _ in clients:
+        pending.put(None)
+    for thread in clients:
+        thread.join()
+    return results
+
+
+def summarize_level(results, arrivals):
+    ok = [r for r in results if r['status'] == "ok"]
+    latencies = [r['latency_ms'] for r in ok]
+    # Sustained throughput: completions over the span from first arrival to last completion
+    elapsed = max((r['done'] for r in results), default=0.0) - (arrivals[0] if arrivals else 0.0)
+    return {
+        'requests': len(results),
+        'offered_rate': round(len(arrivals) / arrivals[-1], 2) if arrivals and arrivals[-1] > 0 else None,
+        'throughput': round(len(ok) / elapsed, 2) if elapsed > 0 else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'service_p50_ms': round(percentile([r['service_ms'] for r in ok], 50), 1),
+        'error_rate': round(sum(r['status'] == "error" for r in results) / len(results), 4) if results else 0.0,
+        'timeout_rate': round(sum(r['status'] == "timeout" for r in results) / len(results), 4) if results else 0.0,
+        'rejected_rate': round(sum(r['status'] == "rejected" for r in results) / len(results), 4) if results else 0.0
+    }
+
+
+def run(concurrency_levels=(1, 4, 16, 64), count=200, rate=20.0, trace=None, url=None,
+        timeout=CLIENT_TIMEOUT, seed=0, token_delay=0.005, max_batch_size=8, max_wait_ms=15, max_queue=32):
+    with tempfile.TemporaryDirectory() as workdir:
+        server = None
+        if url is None:
+            server, url = start_backend(token_delay, max_batch_size, max_wait_ms, f"{workdir}/reports", max_queue)
+        try:
+            if trace:
+                count = min(count, len(trace)) if all('at' in row for row in trace) else count
+            arrivals = arrival_times(count, rate, seed, trace)
+            levels = {}
+            for level, concurrency in enumerate(concurrency_levels):
+                # Fresh synthetic images per level so the report cache can't answer them;
+                # a replayed trace repeats its images, as real traffic would
+                payloads = prepare_payloads(count, trace, first_seed=level * count)
+                print(f"🚀 {count} requests at concurrency {concurrency}...")
+                results = run_level(url, payloads, arrivals, concurrency, timeout)
+                levels[concurrency] = summarize_level(results, arrivals)
+        finally:
+            if server is not None:
+                server.shutdown()
+    return {'url': url, 'requests_per_level': count, 'rate': rate, 'levels': levels}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trace", help="JSONL upload trace (default: synthetic X-rays)")
+    parser.add_argument("--url", help="Backend /analyze URL (default: local stand-in backend)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--rate", type=float, default=20.0, help="Poisson arrivals per second")
+    parser.add_argument("--timeout", type=float, default=CLIENT_TIMEOUT)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Stand-in decode seconds per token")
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=15)
+    parser.add_argument("--max-queue", type=int, default=32, help="Stand-in backend admission limit")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    trace = load_trace(args.trace) if args.trace else None
+    result = run(args.concurrency, args.requests, args.rate, trace, args.url, args.timeout,
+                 args.seed, args.token_delay, args.max_batch_size, args.max_wait_ms, args.max_queue)
+
+    print(f"\n{'clients':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}{'timeouts':>10}{'429s':>8}")
+    for concurrency, stats in result['levels'].items():
+        print(f"{concurrency:>8}{stats['throughput']:>9}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['error_rate']:>9.1%}{stats['timeout_rate']:>10.1%}"
+              f"{stats['rejected_rate']:>8.1%}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
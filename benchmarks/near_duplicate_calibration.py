@@ -0,0 +1,205 @@
+"""Calibrate the near-duplicate thresholds on real studies
+
+Each study in `--studies` (PNG, JPEG or DICOM) is altered the ways a
+re-submitted X-ray comes back: re-exported as JPEG, cropped by a few
+pixels, re-windowed, saved at half size. Every copy goes through the
+client's `prepare_upload`, exactly as the backend would receive it, and is
+hashed. Same-study distances give the recall of a (64-bit, 256-bit)
+threshold pair; distances between different studies give its false matches:
+
+    python -m benchmarks.near_duplicate_calibration --studies /data/cxr --radius 4 --fine-radius 16
+
+Without `--studies` it runs on synthetic images, which only exercises the
+tool. Exits non-zero if the evaluated thresholds match two different studies.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.stubs import synthetic_xray
+from utils.dicom import is_dicom, read_dicom
+from utils.near_duplicates import DEFAULT_RADIUS, fingerprint, hamming
+from utils.preprocess import downscale, prepare_upload, to_grayscale8
+
+STUDY_EXTENSIONS = (".png", ".jpg", ".jpeg", ".dcm", ".dicom")
+
+
+def _window(image, lo, hi):
+    scale = 255.0 / (hi - lo)
+    return image.point(lambda v: min(255, max(0, round((v - lo) * scale))))
+
+
+def _gamma(image, gamma):
+    return image.point(lambda v: round(255 * (v / 255) ** gamma))
+
+
+def _crop(image, left, top, right, bottom):
+    return image.crop((left, top, image.width - right, image.height - bottom))
+
+
+def _half(image):
+    return image.resize((image.width // 2, image.height // 2), Image.LANCZOS)
+
+
+# name -> (transform of the 8-bit original, format it is saved in)
+ALTERATIONS = {
+    'png': (lambda image: image, "PNG"),
+    'jpeg95': (lambda image: image, ("JPEG", 95)),
+    'jpeg85': (lambda image: image, ("JPEG", 85)),
+    'jpeg70': (lambda image: image, ("JPEG", 70)),
+    'crop2': (lambda image: _crop(image, 2, 2, 2, 2), "PNG"),
+    'crop4': (lambda image: _crop(image, 4, 4, 4, 4), "PNG"),
+    'crop8': (lambda image: _crop(image, 8, 8, 8, 8), "PNG"),
+    'crop4_corner': (lambda image: _crop(image, 4, 4, 0, 0), "PNG"),
+    'gamma0.8': (lambda image: _gamma(image, 0.8), "PNG"),
+    'gamma1.25': (lambda image: _gamma(image, 1.25), "PNG"),
+    'window10': (lambda image: _window(image, 13, 242), "PNG"),
+    'half': (_half, "PNG"),
+}
+
+
+def load_original(path, size):
+    """8-bit grayscale study with its short side at most `size`"""
+    if is_dicom(path):
+        image = read_dicom(path, size)[0]
+    else:
+        image = to_grayscale8(Image.open(path))
+    return downscale(image, size, 1.0)
+
+
+def upload_hashes(image, fmt):
+    """Hashes the backend computes for `image` saved as `fmt` and sent by the client"""
+    buffered = BytesIO()
+    if isinstance(fmt, tuple):
+        image.save(buffered, format=fmt[0], quality=fmt[1])
+    else:
+        image.save(buffered, format=fmt)
+    prepared = prepare_upload(buffered)[0]
+    return fingerprint(prepared)
+
+
+def measure(originals):
+    """Same-study distances per alteration, and distances between every pair of studies"""
+    same = {name: [] for name in ALTERATIONS}
+    base = []
+    for original in originals:
+        hashes = upload_hashes(original, "PNG")
+        base.append(hashes)
+        for name, (alter, fmt) in ALTERATIONS.items():
+            altered = upload_hashes(alter(original), fmt)
+            same[name].append((hamming(hashes[0], altered[0]), hamming(hashes[1], altered[1])))
+    different = [(hamming(a[0], b[0]), hamming(a[1], b[1])) for a, b in itertools.combinations(base, 2)]
+    return {name: np.array(pairs) for name, pairs in same.items()}, np.array(different).reshape(-1, 2)
+
+
+def evaluate(same, different, radius, fine_radius):
+    def matched(pairs):
+        return (pairs[:, 0] <= radius) & (pairs[:, 1] <= fine_radius)
+
+    false_matches = int(matched(different).sum())
+    compared = len(different)
+    return {
+        'radius': radius,
+        'fine_radius': fine_radius,
+        'recall': {name: round(float(matched(pairs).mean()), 3) for name, pairs in same.items()},
+        'overall_recall': round(float(np.concatenate([matched(p) for p in same.values()]).mean()), 3),
+        'false_matches': false_matches,
+        'different_pairs': compared,
+        'false_match_rate': round(false_matches / compared, 6) if compared else None,
+        # Rule of three: with no false match in n pairs the rate is below 3/n at 95% confidence
+        'false_match_rate_95': round(3 / compared, 6) if compared and not false_matches else None
+    }
+
+
+def recommend(same, different):
+    """Thresholds with no false match between different studies and the highest recall"""
+    best = None
+    for radius in range(0, 17):
+        for fine_radius in range(0, 65, 2):
+            result = evaluate(same, different, radius, fine_radius)
+            if result['false_matches']:
+                continue
+            key = (result['overall_recall'], -radius - fine_radius / 4)
+            if best is None or key > best[0]:
+                best = (key, result)
+    return best[1] if best else None
+
+
+def run(studies=None, size=2048, synthetic=24, radius=DEFAULT_RADIUS, fine_radius=None):
+    if studies:
+        paths = sorted(os.path.join(studies, name) for name in os.listdir(studies)
+                       if name.lower().endswith(STUDY_EXTENSIONS))
+        originals = [load_original(path, size) for path in paths]
+    else:
+        originals = [Image.open(BytesIO(synthetic_xray(seed, size=size))).convert("L") for seed in range(synthetic)]
+    if len(originals) < 2:
+        raise ValueError("Calibration needs at least two studies")
+
+    same, different = measure(originals)
+    fine_radius = 4 * radius if fine_radius is None else fine_radius
+    return {
+        'studies': len(originals),
+        'source': studies or "synthetic",
+        'size': size,
+        'same_study': {name: {'max_bits': [int(v) for v in pairs.max(axis=0)],
+                              'p95_bits': [float(v) for v in np.percentile(pairs, 95, axis=0)]}
+                       for name, pairs in same.items()},
+        'different_studies': {'min_bits': [int(v) for v in different.min(axis=0)],
+                              'p5_bits': [float(v) for v in np.percentile(different, 5, axis=0)]},
+        'evaluated': evaluate(same, different, radius, fine_radius),
+        'recommended': recommend(same, different)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", help="Directory of real PNG/JPEG/DICOM studies, one per file")
+    parser.add_argument("--size", type=int, default=2048, help="Short side the originals are loaded at")
+    parser.add_argument("--synthetic", type=int, default=24, help="Synthetic studies when --studies is not given")
+    parser.add_argument("--radius", type=int, default=DEFAULT_RADIUS, help="64-bit threshold to evaluate")
+    parser.add_argument("--fine-radius", type=int, help="256-bit threshold to evaluate (default 4 * radius)")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    result = run(args.studies, args.size, args.synthetic, args.radius, args.fine_radius)
+    if not args.studies:
+        print("⚠️ Synthetic studies: this checks the tool, it does not calibrate the thresholds")
+
+    print(f"{'alteration':<14}{'max 64':>8}{'max 256':>9}{'recall':>8}")
+    evaluated = result['evaluated']
+    for name, stats in result['same_study'].items():
+        print(f"{name:<14}{stats['max_bits'][0]:>8}{stats['max_bits'][1]:>9}{evaluated['recall'][name]:>8.0%}")
+    closest = result['different_studies']['min_bits']
+    print(f"\n{result['studies']} studies, {evaluated['different_pairs']} different pairs; "
+          f"closest different pair {closest[0]} / {closest[1]} bits")
+    if evaluated['false_matches']:
+        rate = f"{evaluated['false_match_rate']:.2%} of pairs"
+    else:
+        rate = f"rate < {evaluated['false_match_rate_95']:.2%} at 95%"
+    print(f"🎯 radius {evaluated['radius']} / fine {evaluated['fine_radius']}: recall "
+          f"{evaluated['overall_recall']:.0%}, {evaluated['false_matches']} false matches ({rate})")
+    recommended = result['recommended']
+    if recommended:
+        print(f"💡 Highest recall with no false match: radius {recommended['radius']} / fine "
+              f"{recommended['fine_radius']} (recall {recommended['overall_recall']:.0%})")
+    else:
+        print("⚠️ No thresholds keep these studies apart; leave the index off")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if evaluated['false_matches']:
+        print("❌ These thresholds match different studies")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
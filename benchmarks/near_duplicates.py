@@ -0,0 +1,221 @@
+"""Near-duplicate index benchmark at production scale
+
+Fills a `NearDuplicateIndex` with synthetic hashes drawn around a few
+thousand centres, the way chest X-rays crowd a few regions of hash space
+(so the 16-bit buckets are far from uniform), then times lookups, inserts
+and startup, and the image fingerprint on a full-size study:
+
+    python -m benchmarks.near_duplicates --entries 1000000 --queries 2000
+
+Every `--check`-th lookup is compared with a brute-force scan of all
+entries, and an index whose file ends in a torn record is reloaded after
+further inserts; exits non-zero if any result differs or an entry is lost.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.stubs import synthetic_xray
+from utils.near_duplicates import (DEFAULT_RADIUS, RECORD, NearDuplicateIndex, _popcount, fingerprint,
+                                   perceptual_hash)
+
+
+def summarize(samples):
+    samples = np.asarray(samples)
+    return {
+        'count': len(samples),
+        'mean_ms': round(float(samples.mean()), 4),
+        'p50_ms': round(float(np.percentile(samples, 50)), 4),
+        'p95_ms': round(float(np.percentile(samples, 95)), 4),
+        'max_ms': round(float(samples.max()), 4)
+    }
+
+
+def random_bits(rng, shape, density_log2):
+    """Random uint64 words with each bit set with probability 2 ** -density_log2"""
+    words = rng.integers(0, 2 ** 64, size=shape, dtype=np.uint64)
+    for _ in range(density_log2 - 1):
+        words &= rng.integers(0, 2 ** 64, size=shape, dtype=np.uint64)
+    return words
+
+
+def clustered_records(rng, entries, clusters, spread):
+    records = np.zeros(entries, dtype=RECORD)
+    centre = rng.integers(0, clusters, size=entries)
+    centres = rng.integers(0, 2 ** 64, size=(clusters, 5), dtype=np.uint64)
+    records['value'] = centres[centre, 0] ^ random_bits(rng, entries, spread)
+    records['fine'] = centres[centre, 1:] ^ random_bits(rng, (entries, 4), spread)
+    records['digest'] = rng.integers(0, 256, size=(entries, 32), dtype=np.uint8)
+    return records, centres
+
+
+def brute_force(index, value, fine, radius):
+    count = index._count
+    distances = _popcount(index._values[:count] ^ np.uint64(value))
+    fine_words = np.frombuffer(fine.to_bytes(32, "little"), dtype="<u8")
+    fine_distances = _popcount(index._fine[:count] ^ fine_words).sum(axis=1)
+    found = np.flatnonzero((distances <= radius) & (fine_distances <= index.fine_radius))
+    return sorted((int(distances[i]), index._digests[i].tobytes().hex()) for i in found)
+
+
+def torn_record_survives(workdir, rng):
+    """Reload an index whose last write was cut short, add to it, reload again
+
+    True if every entry written after the torn record comes back intact.
+    """
+    path = os.path.join(workdir, "torn.bin")
+    records, _ = clustered_records(rng, 4, clusters=4, spread=3)
+    index = NearDuplicateIndex(path)
+    for record in records[:3]:
+        index.insert(int(record['value']), int.from_bytes(record['fine'].tobytes(), "little"),
+                     record['digest'].tobytes().hex())
+    index._file.close()
+    with open(path, "ab") as f:
+        f.write(b"\x01" * 20)
+
+    index = NearDuplicateIndex(path)
+    last = records[3]
+    index.insert(int(last['value']), int.from_bytes(last['fine'].tobytes(), "little"), last['digest'].tobytes().hex())
+    index._file.close()
+
+    index = NearDuplicateIndex(path)
+    index._file.close()
+    return (index._count == 4
+            and np.array_equal(index._values[:4], records['value'])
+            and np.array_equal(index._digests[:4], records['digest']))
+
+
+def time_fingerprint(size, repeats):
+    image = Image.open(BytesIO(synthetic_xray(7, size=size)))
+    image.load()
+    full, reduced = [], []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        perceptual_hash(image), perceptual_hash(image, size=16)
+        full.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        fingerprint(image)
+        reduced.append((time.perf_counter() - started) * 1000)
+    return {
+        'size': size,
+        'full_image_ms': summarize(full),
+        'fingerprint_ms': summarize(reduced)
+    }
+
+
+def run(entries=1_000_000, queries=2000, inserts=20000, clusters=4096, spread=3, radius=DEFAULT_RADIUS,
+        check=20, image_size=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    records, centres = clustered_records(rng, entries, clusters, spread)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "near_duplicates.bin")
+        records.tofile(path)
+
+        started = time.perf_counter()
+        index = NearDuplicateIndex(path, radius=radius)
+        load_ms = (time.perf_counter() - started) * 1000
+
+        # Half the lookups are altered copies of indexed studies, half fresh studies from the same clusters
+        picks = rng.integers(0, entries, size=queries)
+        altered = random_bits(rng, (queries, 5), 5)
+        fresh = rng.integers(0, clusters, size=queries)
+        noise = random_bits(rng, (queries, 5), spread)
+        lookups, hits, mismatches = [], 0, 0
+        for q in range(queries):
+            if q % 2 == 0:
+                words = np.concatenate(([records['value'][picks[q]]], records['fine'][picks[q]])) ^ altered[q]
+            else:
+                words = centres[fresh[q]] ^ noise[q]
+            value = int(words[0])
+            fine = int.from_bytes(words[1:].astype("<u8").tobytes(), "little")
+
+            started = time.perf_counter()
+            matches = index.search(value, fine)
+            lookups.append((time.perf_counter() - started) * 1000)
+            hits += bool(matches)
+            if check and q % check == 0 and matches != brute_force(index, value, fine, radius):
+                mismatches += 1
+
+        added, _ = clustered_records(rng, inserts, clusters, spread)
+        insert_times = []
+        for record in added:
+            fine = int.from_bytes(record['fine'].astype("<u8").tobytes(), "little")
+            started = time.perf_counter()
+            index.insert(int(record['value']), fine, record['digest'].tobytes().hex())
+            insert_times.append((time.perf_counter() - started) * 1000)
+        info = index.info()
+        torn_ok = torn_record_survives(workdir, rng)
+
+    return {
+        'config': {
+            'entries': entries,
+            'queries': queries,
+            'inserts': inserts,
+            'clusters': clusters,
+            'spread': spread,
+            'radius': radius
+        },
+        'load_ms': round(load_ms, 1),
+        'lookup': summarize(lookups),
+        'hit_rate': round(hits / queries, 3),
+        'checked': len(range(0, queries, check)) if check else 0,
+        'mismatches': mismatches,
+        'torn_record_ok': torn_ok,
+        'insert': summarize(insert_times),
+        'index': info,
+        'fingerprint': time_fingerprint(image_size, repeats=5) if image_size else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1_000_000, help="Studies in the index")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--inserts", type=int, default=20000, help="Studies added after the lookups")
+    parser.add_argument("--clusters", type=int, default=4096, help="Centres the synthetic hashes crowd around")
+    parser.add_argument("--spread", type=int, default=3,
+                        help="Each bit differs from its centre with probability 2**-spread")
+    parser.add_argument("--radius", type=int, default=DEFAULT_RADIUS)
+    parser.add_argument("--check", type=int, default=20, help="Compare every Nth lookup with a full scan (0: off)")
+    parser.add_argument("--image-size", type=int, default=3000, help="Side of the fingerprinted image (0: skip)")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    result = run(args.entries, args.queries, args.inserts, args.clusters, args.spread, args.radius, args.check,
+                 args.image_size)
+
+    lookup, insert = result['lookup'], result['insert']
+    print(f"📚 {args.entries:,} entries loaded in {result['load_ms']} ms")
+    print(f"🔎 Lookup p50 {lookup['p50_ms']} ms, p95 {lookup['p95_ms']} ms, max {lookup['max_ms']} ms "
+          f"({result['hit_rate']:.0%} matched)")
+    print(f"➕ Insert mean {insert['mean_ms']} ms, max {insert['max_ms']} ms "
+          f"({result['index']['rebuilds']} table rebuilds)")
+    if result['fingerprint']:
+        fp = result['fingerprint']
+        print(f"🖼️ {fp['size']}px study hashed in {fp['fingerprint_ms']['p50_ms']} ms "
+              f"(both hashes from the full image: {fp['full_image_ms']['p50_ms']} ms)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if not result['torn_record_ok']:
+        print("❌ Entries added after a torn record were lost on reload")
+        sys.exit(1)
+    if result['mismatches']:
+        print(f"❌ {result['mismatches']} of {result['checked']} lookups differ from a full scan")
+        sys.exit(1)
+    print(f"✅ {result['checked']} lookups match a full scan; a torn last record is recovered")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Deterministic stand-ins for CheXagent, Gemini and MiniLM
+
+They implement just the surface the real code paths touch, so benchmarks and
+load tests run offline on a CPU-only box with controllable latency.
+"""
+import hashlib
+import re
+import threading
+import time
+from io import BytesIO
+from types import SimpleNamespace
+
+import torch
+from PIL import Image, ImageDraw
+
+CANNED_REPORTS = [
+    "Findings: The heart size is normal. The lungs are clear. There is no pleural effusion or "
+    "pneumothorax. Impression: No acute cardiopulmonary process.",
+    "Findings: The cardiac silhouette is enlarged. There is mild pulmonary vascular congestion. "
+    "Small bilateral pleural effusions are present. Impression: Cardiomegaly with mild pulmonary edema.",
+    "Findings: There is a focal opacity in the right lower lobe. The heart size is normal. "
+    "No pneumothorax is seen. Impression: Right lower lobe pneumonia.",
+]
+
+
+class StubTokenizer:
+    """Whitespace tokenizer exposing the CheXagent tokenizer methods the code calls"""
+
+    pad_token_id = 0
+    eos_token_id = 1
+
+    def __init__(self):
+        self.padding_side = "right"
+        self._words = ["<pad>", "<eos>"]
+        self._ids = {w: i for i, w in enumerate(self._words)}
+        self._lock = threading.Lock()
+
+    def _id(self, word):
+        with self._lock:
+            if word not in self._ids:
+                self._ids[word] = len(self._words)
+                self._words.append(word)
+            return self._ids[word]
+
+    def encode(self, text, **kwargs):
+        return [self._id(word) for word in text.split()]
+
+    def from_list_format(self, items):
+        parts = []
+        for i, item in enumerate(i for i in items if 'image' in i):
+            parts.append(f"Picture {i + 1}: <img>{item['image']}</img>")
+        parts += [item['text'] for item in items if 'text' in item]
+        return "\n".join(parts)
+
+    def apply_chat_template(self, conv, add_generation_prompt=True, tokenize=True, return_tensors="pt"):
+        text = " ".join(f"<|{turn['from']}|> {turn['value']}" for turn in conv)
+        if add_generation_prompt:
+            text += " <|gpt|>"
+        return torch.tensor([self.encode(text)]) if tokenize else text
+
+    def decode(self, ids, skip_special_tokens=False, **kwargs):
+        ids = ids.tolist() if hasattr(ids, 'tolist') else list(ids)
+        special = (self.pad_token_id, self.eos_token_id)
+        # Ids a real LM sampled beyond this vocabulary get a placeholder word
+        return " ".join(self._words[i] if i < len(self._words) else f"<{i}>"
+                        for i in ids if not (skip_special_tokens and i in special))
+
+
+class StubVisual(torch.nn.Module):
+    """Vision tower with the Qwen-VL `encode(paths)` / `image_transform` surface
+
+    Counts its forward passes and the images they encoded.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self.images = 0
+
+    def image_transform(self, image):
+        pixels = image.convert("L").resize((16, 16)).tobytes()
+        return torch.frombuffer(bytearray(pixels), dtype=torch.uint8).float().view(1, 16, 16) / 255
+
+    def forward(self, pixels):
+        self.calls += 1
+        self.images += pixels.size(0)
+        return pixels.flatten(1).mean(dim=1)
+
+    def encode(self, image_paths):
+        return self(torch.stack([self.image_transform(Image.open(p)) for p in image_paths]))
+
+
+class StubChexagent(torch.nn.Module):
+    """Tiny causal-LM stand-in: picks a canned report from the image and
+    "decodes" it one token per `token_delay` seconds, all batch rows in lockstep
+    """
+
+    def __init__(self, tokenizer, token_delay=0.005, prefill_delay=0.02):
+        super().__init__()
+        self.tokenizer = tokenizer
+        self.token_delay = token_delay
+        self.prefill_delay = prefill_delay
+        self.visual = StubVisual()
+        self.generation_config = SimpleNamespace(eos_token_id=tokenizer.eos_token_id)
+
+    def _report_ids(self, input_ids):
+        # Like Qwen-VL, every image in the batch goes through one encode() call
+        paths = [re.search(r"<img>(.*?)</img>", self.tokenizer.decode(row)).group(1) for row in input_ids]
+        reports = []
+        for feature in self.visual.encode(paths).tolist():
+            report = CANNED_REPORTS[int(feature * 1000) % len(CANNED_REPORTS)]
+            reports.append(self.tokenizer.encode(report) + [self.tokenizer.eos_token_id])
+        return reports
+
+    def generate(self, input_ids, max_new_tokens=512, streamer=None, pad_token_id=0, **kwargs):
+        reports = self._report_ids(input_ids)
+        time.sleep(self.prefill_delay)
+        if streamer is not None:
+            streamer.put(input_ids.cpu())
+
+        steps = min(max_new_tokens, max(len(r) for r in reports))
+        columns = []
+        for step in range(steps):
+            time.sleep(self.token_delay)
+            column = [r[step] if step < len(r) else pad_token_id for r in reports]
+            columns.append(column)
+            if streamer is not None:
+                streamer.put(torch.tensor(column))
+        if streamer is not None:
+            streamer.end()
+
+        return torch.cat([input_ids, torch.tensor(columns, dtype=input_ids.dtype).T], dim=1)
+
+
+def fake_gemini(prompt):
+    """Canned Gemini replies for the translation, batch-translation and comparison prompts"""
+    if "Report A:" in prompt:
+        return ("Hallucinated: NO\nDifference: LOW\n"
+                "Explanation: The translation matches the original.\nHallucination Score: 5")
+    numbered = re.findall(r"^(\d+)\. (.+)$", prompt, flags=re.MULTILINE)
+    if numbered:
+        return "\n".join(f"{n}. In simple terms: {s.lower()}" for n, s in numbered)
+    report = prompt.split("Medical Report:", 1)[-1].split("Provide a clear", 1)[0].strip()
+    return f"In simple terms: {report.lower()}"
+
+
+class StubEmbedder:
+    """Hashed bag-of-words embeddings with the SentenceTransformer.encode signature"""
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def encode(self, sentences, convert_to_tensor=True, batch_size=32, **kwargs):
+        vectors = torch.zeros(len(sentences), self.dim)
+        for row, sentence in enumerate(sentences):
+            for word in re.findall(r"[a-z]+", sentence.lower()):
+                bucket = int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim
+                vectors[row, bucket] += 1
+        return torch.nn.functional.normalize(vectors, dim=1)
+
+
+class FakeUpload(BytesIO):
+    """Looks enough like Streamlit's UploadedFile for the client code"""
+
+    def __init__(self, data, name="xray.png", type="image/png"):
+        super().__init__(data)
+        self.name = name
+        self.type = type
+
+
+def synthetic_xray(seed, size=2048):
+    """Deterministic chest-X-ray-like PNG; different seeds give different pixels"""
+    image = Image.new("L", (size, size), 20 + seed % 40)
+    draw = ImageDraw.Draw(image)
+    offset = (seed * 37) % (size // 10)
+    draw.ellipse((size * 0.15 + offset, size * 0.2, size * 0.45, size * 0.85), fill=90 + seed % 60)
+    draw.ellipse((size * 0.55, size * 0.2, size * 0.85 - offset, size * 0.85), fill=100 + seed % 50)
+    draw.rectangle((size * 0.47, size * 0.1, size * 0.53, size * 0.9), fill=200)
+    buffered = BytesIO()
+    image.save(buffered, format="PNG")
+    return buffered.getvalue()
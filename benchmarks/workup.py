@@ -0,0 +1,104 @@
+"""Vision-pass check for /workup with the stand-in model
+
+Sends work-ups for fresh studies (cold vision cache) and repeats them with
+new prompts (warm cache), counting the stub vision tower's forward passes:
+
+    python -m benchmarks.workup --studies 4
+
+A cold work-up must encode its image exactly once, whether its prompts are
+batched or decoded one at a time; a warm one must not encode it at all.
+Exits non-zero otherwise.
+"""
+import argparse
+import json
+import sys
+import tempfile
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from backend import create_app
+from benchmarks.stubs import FakeUpload, StubChexagent, StubTokenizer, synthetic_xray
+from utils.colab_client import workup_with_colab
+from utils.inference import WORKUP_PROMPTS
+from utils.report_cache import ReportCache
+
+# Asked about an already-seen study, so none of them are in the report cache yet
+FOLLOW_UP_PROMPTS = {
+    'devices': "Are there any lines, tubes or devices? Answer yes or no.",
+    'atelectasis': "Is there atelectasis? Answer yes or no."
+}
+
+
+def run(studies=4, token_delay=0.001):
+    tokenizer = StubTokenizer()
+    model = StubChexagent(tokenizer, token_delay=token_delay)
+    visual = model.visual
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = create_app(model, tokenizer, "cpu", model_name="stub-chexagent",
+                         report_cache=ReportCache(f"{workdir}/reports"))
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/analyze"
+
+        rows = []
+        try:
+            for seed in range(studies):
+                for batch in (True, False):
+                    # Odd seeds for sequential runs so both modes start cold
+                    upload = synthetic_xray(2 * seed + (not batch), size=1024)
+                    for phase, prompts in (('cold', None), ('warm', FOLLOW_UP_PROMPTS)):
+                        calls, images = visual.calls, visual.images
+                        started = time.perf_counter()
+                        answers = workup_with_colab(FakeUpload(upload), url, prompts=prompts, batch=batch)
+                        rows.append({
+                            'seed': 2 * seed + (not batch),
+                            'batch': batch,
+                            'phase': phase,
+                            'prompts': len(answers),
+                            'vision_calls': visual.calls - calls,
+                            'images_encoded': visual.images - images,
+                            'ms': round((time.perf_counter() - started) * 1000, 2)
+                        })
+        finally:
+            server.shutdown()
+
+    for row in rows:
+        expected = 1 if row['phase'] == 'cold' else 0
+        row['ok'] = row['vision_calls'] == expected and row['images_encoded'] == expected
+    return {
+        'config': {'studies': studies, 'token_delay': token_delay, 'prompts': len(WORKUP_PROMPTS)},
+        'workups': rows,
+        'ok': all(row['ok'] for row in rows)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=4)
+    parser.add_argument("--token-delay", type=float, default=0.001, help="Stub seconds per decode step")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    result = run(args.studies, args.token_delay)
+
+    print(f"{'seed':>4}{'mode':>12}{'cache':>7}{'prompts':>9}{'passes':>8}{'images':>8}{'ms':>10}")
+    for row in result['workups']:
+        print(f"{row['seed']:>4}{'batched' if row['batch'] else 'sequential':>12}{row['phase']:>7}"
+              f"{row['prompts']:>9}{row['vision_calls']:>8}{row['images_encoded']:>8}{row['ms']:>10}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if not result['ok']:
+        print("❌ A work-up ran the vision tower more than once per study")
+        sys.exit(1)
+    print("✅ One vision pass per cold work-up, none when warm")
+
+
+if __name__ == "__main__":
+    main()
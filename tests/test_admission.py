@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from utils.admission import AdmissionController, Overloaded
+
+
+def test_refuses_past_the_limit():
+    controller = AdmissionController(max_queue=2)
+    assert controller.try_acquire()
+    assert controller.try_acquire()
+    assert not controller.try_acquire()
+    controller.release()
+    assert controller.try_acquire()
+
+    stats = controller.stats()
+    assert (stats['in_flight'], stats['admitted'], stats['rejected']) == (2, 3, 1)
+
+
+def test_admit_raises_overloaded_with_retry_after():
+    controller = AdmissionController(max_queue=1, initial_service=2.3)
+    with controller.admit():
+        with pytest.raises(Overloaded) as raised:
+            with controller.admit():
+                pass
+    assert raised.value.retry_after == 3
+    assert controller.in_flight() == 0
+
+
+def test_admit_releases_on_error():
+    controller = AdmissionController(max_queue=1)
+    with pytest.raises(ValueError):
+        with controller.admit():
+            raise ValueError
+    assert controller.in_flight() == 0
+
+
+def test_service_time_ewma_and_retry_after_floor():
+    controller = AdmissionController(alpha=0.5, initial_service=4.0)
+    controller.try_acquire()
+    controller.release(2.0)
+    assert controller.service_seconds == pytest.approx(3.0)
+    controller.service_seconds = 0.01
+    assert controller.retry_after() == 1
+
+
+def test_acquire_times_out_without_counting_a_rejection():
+    controller = AdmissionController(max_queue=1)
+    controller.try_acquire()
+    started = time.perf_counter()
+    assert not controller.acquire(timeout=0.05)
+    assert time.perf_counter() - started >= 0.05
+    assert controller.stats()['rejected'] == 0
+
+
+def test_release_wakes_a_waiter():
+    controller = AdmissionController(max_queue=1)
+    controller.try_acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(controller.acquire(timeout=5)))
+    waiter.start()
+    time.sleep(0.05)
+    assert not acquired
+    controller.release()
+    waiter.join(timeout=5)
+    assert acquired == [True]
+    assert controller.in_flight() == 1
@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+from utils.batching import MicroBatcher
+
+
+def test_concurrent_items_share_a_batch_and_keep_their_results():
+    started, release = threading.Event(), threading.Event()
+    batches = []
+
+    def run_batch(items):
+        started.set()
+        release.wait(5)
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(run_batch, max_batch_size=4, max_wait_ms=1)
+    # The first item runs alone and holds the worker while the rest queue up
+    first = batcher.enqueue(0)
+    assert started.wait(5)
+    futures = [batcher.enqueue(i) for i in range(1, 6)]
+    release.set()
+
+    assert first.result(timeout=5) == 0
+    assert [future.result(timeout=5) for future in futures] == [10, 20, 30, 40, 50]
+    assert batches == [[0], [1, 2, 3, 4], [5]]
+    stats = batcher.stats()
+    assert stats['requests'] == 6
+    assert stats['batches'] == 3
+
+
+def test_errors_reach_every_caller():
+    def run_batch(items):
+        raise ValueError("model failed")
+
+    batcher = MicroBatcher(run_batch, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        batcher.submit("x", timeout=5)
+
+
+def test_wrong_result_count_is_an_error():
+    batcher = MicroBatcher(lambda items: items[:-1], max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.submit("x", timeout=5)
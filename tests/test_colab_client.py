@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from utils.colab_client import rejected_multipart  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, text=""):
+        self.status_code = status_code
+        self._body = body
+        self.text = text
+
+    def json(self):
+        if self._body is None:
+            raise ValueError("not JSON")
+        return self._body
+
+
+@pytest.mark.parametrize("response, rejected", [
+    (FakeResponse(200, {'status': 'success'}), False),
+    (FakeResponse(404, {'error': 'Not found'}), False),
+    (FakeResponse(429, {'error': 'Server busy'}), False),
+    (FakeResponse(415, text="Unsupported Media Type"), True),
+    (FakeResponse(400, {'status': 'error', 'error': 'No image data provided'}), True),
+    (FakeResponse(500, {'status': 'error', 'error': '415 Unsupported Media Type: ... JSON ...'}), True),
+    (FakeResponse(400, text="<h1>Bad Request</h1> Did not attempt to load JSON data"), True),
+    (FakeResponse(500, {'status': 'error', 'error': 'CUDA out of memory'}), False),
+])
+def test_rejected_multipart(response, rejected):
+    assert rejected_multipart(response) == rejected
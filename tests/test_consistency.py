@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+
+from benchmarks.stubs import StubEmbedder  # noqa: E402
+from utils.consistency import check_consistency, split_sentences  # noqa: E402
+
+MEDICAL = "The cardiac silhouette is normal in size. There is a small left pleural effusion."
+
+
+def test_split_sentences_drops_markdown_and_fragments():
+    assert split_sentences("**Findings:**\n- Lungs are clear bilaterally. OK.\n# No acute disease here") == [
+        "Lungs are clear bilaterally.", "No acute disease here"]
+
+
+def test_faithful_translation_passes():
+    result = check_consistency(StubEmbedder(), MEDICAL, MEDICAL)
+    assert result['hallucinated'] == "NO"
+    assert result['difference'] == "LOW"
+    assert result['omitted_findings'] == []
+
+
+def test_invented_and_missing_findings_are_flagged():
+    layman = "The cardiac silhouette is normal in size. A broken rib was found on the right side."
+    result = check_consistency(StubEmbedder(), MEDICAL, layman)
+    assert result['hallucinated'] == "YES"
+    assert result['unsupported_sentences'] == ["A broken rib was found on the right side."]
+    assert result['omitted_findings'] == ["There is a small left pleural effusion."]
+    assert result['hallucination_score'] == 50
@@ -0,0 +1,104 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+from utils.dicom import is_dicom, read_dicom
+
+
+def _dicom(pixels, bits_stored=None, photometric="MONOCHROME2", **elements):
+    """Uncompressed little-endian DICOM file bytes for 2-D `pixels`"""
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.1"
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.is_little_endian, ds.is_implicit_VR = True, False
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.Rows, ds.Columns = pixels.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = photometric
+    ds.BitsAllocated = pixels.dtype.itemsize * 8
+    ds.BitsStored = bits_stored or ds.BitsAllocated
+    ds.HighBit = ds.BitsStored - 1
+    ds.PixelRepresentation = int(pixels.dtype.kind == "i")
+    for name, value in elements.items():
+        setattr(ds, name, value)
+    ds.PixelData = pixels.astype(pixels.dtype.newbyteorder("<")).tobytes()
+
+    buffered = BytesIO()
+    ds.save_as(buffered, write_like_original=False)
+    return buffered.getvalue()
+
+
+def _ramp(low, high, shape=(64, 64), dtype=np.uint16):
+    return np.tile(np.linspace(low, high, shape[1]), (shape[0], 1)).round().astype(dtype)
+
+
+def test_is_dicom(tmp_path):
+    data = _dicom(_ramp(0, 100))
+    path = tmp_path / "study.dcm"
+    path.write_bytes(data)
+    assert is_dicom(data) and is_dicom(str(path))
+    assert not is_dicom(b"\x89PNG" + bytes(200))
+
+
+def test_bytes_and_path_decode_the_same(tmp_path):
+    data = _dicom(_ramp(0, 4000, shape=(128, 96)))
+    path = tmp_path / "study.dcm"
+    path.write_bytes(data)
+    from_bytes, size = read_dicom(data, 32)
+    from_path, _ = read_dicom(str(path), 32)
+    assert size == (96, 128)
+    assert from_bytes.mode == "L"
+    assert from_bytes.size == (32, 42)
+    assert np.array_equal(np.asarray(from_bytes), np.asarray(from_path))
+
+
+def test_without_window_values_are_stretched():
+    pixels = np.asarray(read_dicom(_dicom(_ramp(1000, 3000)), 64)[0])
+    assert pixels.min() == 0 and pixels.max() == 255
+    assert np.all(np.diff(pixels[0].astype(int)) >= 0)
+
+
+def test_window_center_and_width():
+    data = _dicom(_ramp(0, 630, shape=(64, 64)), WindowCenter=300, WindowWidth=200)
+    row = np.asarray(read_dicom(data, 64)[0])[0]
+    values = np.linspace(0, 630, 64).round()
+    assert np.all(row[values <= 199] == 0)
+    assert np.all(row[values >= 400] == 255)
+    # Column 30 holds the window centre
+    assert abs(int(row[30]) - 128) <= 1
+    assert np.all(np.diff(row.astype(int)) >= 0)
+
+
+def test_rescale_applies_before_the_window():
+    data = _dicom(_ramp(0, 630), RescaleSlope=1, RescaleIntercept=-1000, WindowCenter=-700, WindowWidth=200)
+    plain = _dicom(_ramp(0, 630), WindowCenter=300, WindowWidth=200)
+    assert np.array_equal(np.asarray(read_dicom(data, 64)[0]), np.asarray(read_dicom(plain, 64)[0]))
+
+
+def test_monochrome1_is_inverted():
+    pixels = _ramp(0, 1000)
+    normal = np.asarray(read_dicom(_dicom(pixels), 64)[0]).astype(int)
+    inverted = np.asarray(read_dicom(_dicom(pixels, photometric="MONOCHROME1"), 64)[0]).astype(int)
+    assert np.array_equal(normal + inverted, np.full_like(normal, 255))
+
+
+def test_unused_high_bits_are_ignored():
+    pixels = _ramp(0, 4095)
+    noisy = pixels | np.uint16(0xF000)
+    clean = np.asarray(read_dicom(_dicom(pixels, bits_stored=12), 64)[0])
+    assert np.array_equal(np.asarray(read_dicom(_dicom(noisy, bits_stored=12), 64)[0]), clean)
+
+
+@pytest.mark.parametrize("short_side", [16, 20, 64])
+def test_reduced_size_keeps_short_side(short_side):
+    image, _ = read_dicom(_dicom(_ramp(0, 1000, shape=(64, 128))), short_side)
+    assert min(image.size) >= short_side
+    assert min(image.size) < 2 * short_side
@@ -0,0 +1,151 @@
+import os
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import utils.near_duplicates as near_duplicates
+from utils.near_duplicates import (RECORD, NearDuplicateIndex, _popcount, fingerprint, hamming,
+                                   perceptual_hash)
+
+
+def _study(seed, size=256):
+    """Smooth grayscale image with a few bright blobs; different seeds look different"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / size
+    pixels = 60 + 80 * x
+    for cx, cy, radius, level in rng.uniform([0.1, 0.1, 0.05, 40], [0.9, 0.9, 0.25, 120], size=(6, 4)):
+        pixels += level * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * radius ** 2))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def _random_hashes(rng, count):
+    values = rng.integers(0, 2 ** 64, size=count, dtype=np.uint64)
+    fine = rng.integers(0, 2 ** 64, size=(count, 4), dtype=np.uint64)
+    return [(int(v), int.from_bytes(f.astype("<u8").tobytes(), "little")) for v, f in zip(values, fine)]
+
+
+def _flip(value, bits, rng, width=64):
+    for bit in rng.choice(width, size=bits, replace=False):
+        value ^= 1 << int(bit)
+    return value
+
+
+def test_perceptual_hash_bit_order():
+    # Brighter to the right everywhere: every comparison is set
+    ramp = Image.fromarray(np.tile(np.arange(0, 252, 28, dtype=np.uint8), (8, 1)))
+    assert perceptual_hash(ramp) == 2 ** 64 - 1
+    # Only the top-left comparison set: the most significant bit
+    pixels = np.full((8, 9), 100, dtype=np.uint8)
+    pixels[0, 1] = 200
+    assert perceptual_hash(Image.fromarray(pixels)) == 1 << 63
+
+
+def test_fingerprint_is_stable_under_reencoding_and_resizing():
+    image = _study(1, size=512)
+    buffered = BytesIO()
+    image.save(buffered, format="JPEG", quality=90)
+    variants = [Image.open(BytesIO(buffered.getvalue())), image.resize((256, 256), Image.LANCZOS)]
+    value, fine = fingerprint(image)
+    for variant in variants:
+        other_value, other_fine = fingerprint(variant)
+        assert hamming(value, other_value) <= 4
+        assert hamming(fine, other_fine) <= 16
+    assert fingerprint(image.convert("RGB")) == (value, fine)
+
+
+def test_search_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(0)
+    index = NearDuplicateIndex(str(tmp_path / "index.bin"), radius=6, fine_radius=200)
+    entries = _random_hashes(rng, 300)
+    for i, (value, fine) in enumerate(entries):
+        index.insert(value, fine, f"{i:064x}")
+    # Half the entries go through the sorted tables, the rest through the unindexed tail
+    index._rebuild()
+    for i, (value, fine) in enumerate(_random_hashes(rng, 300)):
+        index.insert(value, fine, f"{300 + i:064x}")
+        entries.append((value, fine))
+
+    for value, fine in entries[::10]:
+        query = _flip(value, int(rng.integers(0, 9)), rng)
+        expected = sorted((hamming(query, v), f"{i:064x}") for i, (v, f) in enumerate(entries)
+                          if hamming(query, v) <= 6 and hamming(fine, f) <= 200)
+        assert index.search(query, fine) == expected
+
+
+def test_fine_radius_confirms_candidates(tmp_path):
+    rng = np.random.default_rng(1)
+    index = NearDuplicateIndex(str(tmp_path / "index.bin"), radius=4)
+    assert index.fine_radius == 16
+    (value, fine), = _random_hashes(rng, 1)
+    index.insert(value, fine, "ab" * 32)
+
+    close, far = _flip(fine, 16, rng, 256), _flip(fine, 17, rng, 256)
+    assert index.search(_flip(value, 4, rng), close) == [(4, "ab" * 32)]
+    assert index.search(value, far) == []
+    assert index.search(value, far, fine_radius=17) == [(0, "ab" * 32)]
+    assert index.search(_flip(value, 5, rng), fine) == []
+
+
+def test_entries_survive_reload(tmp_path):
+    path = str(tmp_path / "index.bin")
+    rng = np.random.default_rng(2)
+    entries = _random_hashes(rng, 50)
+    index = NearDuplicateIndex(path)
+    for i, (value, fine) in enumerate(entries):
+        index.insert(value, fine, f"{i:064x}")
+    index._file.close()
+
+    reloaded = NearDuplicateIndex(path)
+    assert reloaded.info()['entries'] == 50
+    for i, (value, fine) in enumerate(entries):
+        assert (0, f"{i:064x}") in reloaded.search(value, fine)
+
+
+def test_torn_record_is_truncated(tmp_path):
+    path = str(tmp_path / "index.bin")
+    rng = np.random.default_rng(3)
+    entries = _random_hashes(rng, 4)
+    index = NearDuplicateIndex(path)
+    for i, (value, fine) in enumerate(entries[:3]):
+        index.insert(value, fine, f"{i:064x}")
+    index._file.close()
+    with open(path, "ab") as f:
+        f.write(b"\x01" * 20)
+
+    index = NearDuplicateIndex(path)
+    assert os.path.getsize(path) == 3 * RECORD.itemsize
+    index.insert(*entries[3], f"{3:064x}")
+    index._file.close()
+
+    reloaded = NearDuplicateIndex(path)
+    assert reloaded.info()['entries'] == 4
+    for i, (value, fine) in enumerate(entries):
+        assert reloaded.search(value, fine) == [(0, f"{i:064x}")]
+
+
+def test_add_reuses_the_queried_fingerprint(tmp_path, monkeypatch):
+    calls = []
+
+    def counting(image):
+        calls.append(image)
+        return fingerprint(image)
+
+    monkeypatch.setattr(near_duplicates, "fingerprint", counting)
+    index = NearDuplicateIndex(str(tmp_path / "index.bin"))
+    image, other = _study(4), _study(5)
+
+    assert index.query(image, digest="aa" * 32) == []
+    index.add(image, "aa" * 32)
+    assert len(calls) == 1
+    assert index.query(image) == [(0, "aa" * 32)]
+    index.add(other, "bb" * 32)
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize("shape", [(7,), (3, 4)])
+def test_popcount(shape):
+    values = np.random.default_rng(5).integers(0, 2 ** 64, size=shape, dtype=np.uint64)
+    expected = np.vectorize(lambda v: bin(int(v)).count("1"))(values)
+    assert np.array_equal(_popcount(values), expected)
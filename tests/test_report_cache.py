@@ -0,0 +1,98 @@
+import os
+import threading
+from io import BytesIO
+
+from PIL import Image
+
+from utils.report_cache import ReportCache, cache_key, pixel_digest
+
+
+def _key(i):
+    return cache_key(f"{i:064x}", "prompt", "model")
+
+
+def test_pixel_digest_ignores_encoding():
+    image = Image.new("L", (32, 16), 90)
+    image.putpixel((3, 4), 200)
+    buffered = BytesIO()
+    image.save(buffered, format="PNG")
+    reloaded = Image.open(BytesIO(buffered.getvalue()))
+    assert pixel_digest(reloaded) == pixel_digest(image)
+    assert pixel_digest(image.transpose(Image.FLIP_LEFT_RIGHT)) != pixel_digest(image)
+
+
+def test_cache_key_depends_on_every_part():
+    keys = {cache_key("d", "p", "m"), cache_key("d", "q", "m"), cache_key("d", "p", "n"),
+            cache_key("d", "p", "m", "v2"), cache_key("e", "p", "m")}
+    assert len(keys) == 5
+
+
+def test_memory_then_disk_hit(tmp_path):
+    cache = ReportCache(str(tmp_path), memory_items=1)
+    cache.put(_key(1), "report one")
+    cache.put(_key(2), "report two")
+
+    assert cache.get(_key(2)) == "report two"
+    assert cache.get(_key(1)) == "report one"
+    assert cache.get(_key(3)) is None
+    stats = cache.stats()
+    assert (stats['memory_hits'], stats['disk_hits'], stats['misses']) == (1, 1, 1)
+
+
+def test_index_survives_restart(tmp_path):
+    cache = ReportCache(str(tmp_path))
+    for i in range(5):
+        cache.put(_key(i), f"report {i}")
+
+    reopened = ReportCache(str(tmp_path))
+    assert reopened.stats()['disk_entries'] == 5
+    assert reopened.stats()['disk_bytes'] == cache.stats()['disk_bytes']
+    assert reopened.get(_key(3)) == "report 3"
+
+
+def test_eviction_stays_under_budget(tmp_path):
+    cache = ReportCache(str(tmp_path), memory_items=0, max_disk_bytes=1000)
+    for i in range(40):
+        cache.put(_key(i), "x" * 80)
+
+    stats = cache.stats()
+    assert stats['evictions'] > 0
+    assert stats['disk_bytes'] <= 1000
+    on_disk = sum(len(names) for _, _, names in os.walk(tmp_path))
+    assert on_disk == stats['disk_entries']
+    # Least recently used go first
+    assert cache.get(_key(0)) is None
+    assert cache.get(_key(39)) == "x" * 80
+
+
+def test_missing_file_is_rewritten(tmp_path):
+    cache = ReportCache(str(tmp_path), memory_items=0)
+    cache.put(_key(1), "report")
+    os.unlink(cache._path(_key(1)))
+
+    assert cache.get(_key(1)) is None
+    assert cache.stats()['disk_entries'] == 0
+    cache.put(_key(1), "report")
+    assert os.path.exists(cache._path(_key(1)))
+    assert cache.get(_key(1)) == "report"
+
+
+def test_concurrent_puts_keep_index_and_files_in_step(tmp_path):
+    cache = ReportCache(str(tmp_path), memory_items=0, max_disk_bytes=2000)
+
+    def worker(seed):
+        for i in range(200):
+            key = _key((seed * 7 + i) % 60)
+            if cache.get(key) is None:
+                cache.put(key, "y" * 60)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    indexed = set(cache._disk)
+    on_disk = {name[:-len(".json")] for _, _, names in os.walk(tmp_path) for name in names}
+    assert indexed == on_disk
+    assert cache.stats()['disk_bytes'] == sum(os.path.getsize(cache._path(key)) for key in indexed)
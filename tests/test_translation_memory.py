@@ -0,0 +1,59 @@
+from utils.translation_memory import TranslationMemory, normalize, parse_batch, split_report
+
+
+class FakeLLM:
+    """Numbered-reply translator that records every prompt"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        sentences = [line.split(". ", 1)[1] for line in prompt.split("\n\n")[-1].split("\n")]
+        return "\n".join(f"{i}. plain: {s}" for i, s in enumerate(sentences, 1))
+
+
+def test_normalize_and_split():
+    assert normalize("  No  pleural Effusion. ") == "no pleural effusion"
+    assert split_report("Heart normal. Lungs clear!\nNo effusion.") == [["Heart normal.", "Lungs clear!"],
+                                                                        ["No effusion."]]
+
+
+def test_parse_batch_needs_every_line():
+    assert parse_batch("1. one\n2) two\nnoise", 2) == ["one", "two"]
+    assert parse_batch("1. one\n3. three", 3) is None
+
+
+def test_only_unseen_sentences_reach_the_llm(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "memory.json"))
+    llm = FakeLLM()
+    first = memory.translate("Heart is normal. Lungs are clear.\nNo effusion.", llm)
+    assert first == "plain: Heart is normal. plain: Lungs are clear.\nplain: No effusion."
+
+    second = memory.translate("heart is normal\nThere is cardiomegaly.", llm)
+    assert second == "plain: Heart is normal.\nplain: There is cardiomegaly."
+    assert len(llm.prompts) == 2
+    assert "Heart" not in llm.prompts[1] and "cardiomegaly" in llm.prompts[1]
+    assert memory.stats['hits'] == 1 and memory.stats['misses'] == 4
+
+    memory.translate("No effusion. Lungs are clear.", llm)
+    assert len(llm.prompts) == 2
+
+
+def test_unparseable_reply_returns_none_and_caches_nothing(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "memory.json"))
+    assert memory.translate("Heart is normal.", lambda prompt: "Sorry, I can't help.") is None
+    assert memory.translate("Heart is normal.", FakeLLM()) == "plain: Heart is normal."
+
+
+def test_entries_persist_and_are_bounded(tmp_path):
+    path = str(tmp_path / "memory.json")
+    memory = TranslationMemory(path, max_entries=2)
+    memory.translate("One. Two. Three.", FakeLLM())
+
+    llm = FakeLLM()
+    reopened = TranslationMemory(path, max_entries=2)
+    reopened.translate("Two. Three.", llm)
+    assert llm.prompts == []
+    reopened.translate("One.", llm)
+    assert len(llm.prompts) == 1
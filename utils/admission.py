@@ -0,0 +1,90 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing when the backend is at its in-flight limit"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Server busy, retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bound the number of inference requests in flight
+
+    Requests past `max_queue` are refused immediately so a burst cannot pile
+    up unbounded generate calls. Admitted requests' latency (queueing
+    included) is tracked as an EWMA and becomes the Retry-After hint: by then
+    the requests now in flight have most likely finished.
+    """
+
+    def __init__(self, max_queue=32, alpha=0.2, initial_service=5.0):
+        self.max_queue = max_queue
+        self.alpha = alpha
+        self.service_seconds = initial_service
+        self._in_flight = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._lock = threading.Condition()
+
+    def retry_after(self):
+        """Whole seconds a refused client should wait (at least 1)"""
+        return max(1, math.ceil(self.service_seconds))
+
+    def try_acquire(self):
+        with self._lock:
+            if self._in_flight >= self.max_queue:
+                self._rejected += 1
+                return False
+            self._in_flight += 1
+            self._admitted += 1
+            return True
+
+    def acquire(self, timeout=None):
+        """Wait up to `timeout` s for a free slot instead of refusing; True once one is held
+
+        For background work (queued jobs) that should take spare capacity
+        without ever being counted as rejected.
+        """
+        with self._lock:
+            if not self._lock.wait_for(lambda: self._in_flight < self.max_queue, timeout):
+                return False
+            self._in_flight += 1
+            self._admitted += 1
+            return True
+
+    def release(self, seconds=None):
+        with self._lock:
+            self._in_flight -= 1
+            if seconds is not None:
+                self.service_seconds += self.alpha * (seconds - self.service_seconds)
+            self._lock.notify()
+
+    @contextmanager
+    def admit(self):
+        """Hold a slot for the duration of the block, or raise `Overloaded`"""
+        if not self.try_acquire():
+            raise Overloaded(self.retry_after())
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    def in_flight(self):
+        return self._in_flight
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'in_flight': self._in_flight,
+                'max_queue': self.max_queue,
+                'admitted': self._admitted,
+                'rejected': self._rejected,
+                'service_ms': round(self.service_seconds * 1000, 1)
+            }
+        stats['retry_after'] = self.retry_after()
+        return stats
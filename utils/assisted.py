@@ -0,0 +1,119 @@
+import threading
+from contextlib import contextmanager
+
+from PIL import Image
+
+from utils.inference import generate_reports
+from utils.metrics import Spans
+
+# Draft tokens proposed per verification step; the main model checks them in one forward pass
+NUM_ASSISTANT_TOKENS = 5
+
+
+class AssistedDecoder:
+    """Greedy decoding where a small draft LM proposes tokens for the main model
+
+    Uses the `assistant_model` path of `generate`: the draft proposes a few
+    tokens, the main model scores them all in one forward pass and keeps the
+    longest prefix matching its own greedy choice, so the output is the same
+    as plain greedy decoding. The draft must use the main model's
+    vocabulary. Only single-study generations are assisted.
+
+    Forward hooks count main-model and draft calls per generation to report
+    the acceptance rate; the speedup is relative to the plain ms/token
+    measured by `verify`.
+    """
+
+    def __init__(self, model, draft_model, tokenizer, num_assistant_tokens=NUM_ASSISTANT_TOKENS):
+        self.draft_model = draft_model
+        self.tokenizer = tokenizer
+        self.enabled = True
+        self.baseline_ms_per_token = None
+        self.stats = {'requests': 0, 'proposed': 0, 'accepted': 0}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        config = getattr(draft_model, "generation_config", None)
+        if config is not None:
+            config.num_assistant_tokens = num_assistant_tokens
+            # A fixed draft length keeps the acceptance rate comparable across requests
+            config.num_assistant_tokens_schedule = "constant"
+
+        model.register_forward_hook(self._counter('target'))
+        draft_model.register_forward_hook(self._counter('draft'))
+
+    def _counter(self, name):
+        def hook(module, inputs, output):
+            counts = getattr(self._local, 'counts', None)
+            if counts is not None:
+                counts[name] += 1
+        return hook
+
+    def applies(self, batch_size):
+        return self.enabled and batch_size == 1
+
+    def generate_kwargs(self):
+        return {'assistant_model': self.draft_model}
+
+    @contextmanager
+    def track(self):
+        """Count forward passes made by this thread's generate() call"""
+        counts = {'target': 0, 'draft': 0}
+        self._local.counts = counts
+        try:
+            yield counts
+        finally:
+            self._local.counts = None
+
+    def record(self, spans, counts, new_tokens, elapsed):
+        """Acceptance rate and speedup of one assisted generation"""
+        # Each main-model pass yields its accepted draft tokens plus one of its own
+        accepted = max(0, new_tokens - counts['target'])
+        proposed = max(accepted, counts['draft'])
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['proposed'] += proposed
+            self.stats['accepted'] += accepted
+        if spans is None:
+            return
+
+        ms_per_token = elapsed * 1000 / new_tokens if new_tokens else None
+        speedup = None
+        if ms_per_token and self.baseline_ms_per_token:
+            speedup = round(self.baseline_ms_per_token / ms_per_token, 2)
+        spans.values['assisted'] = {
+            'proposed': proposed,
+            'accepted': accepted,
+            'acceptance_rate': round(accepted / proposed, 3) if proposed else 0.0,
+            'target_passes': counts['target'],
+            'speedup': speedup
+        }
+
+    def info(self):
+        with self._lock:
+            stats = dict(self.stats)
+        rate = stats['accepted'] / stats['proposed'] if stats['proposed'] else 0.0
+        return dict(stats, enabled=self.enabled, acceptance_rate=round(rate, 3),
+                    baseline_ms_per_token=self.baseline_ms_per_token)
+
+    def verify(self, model, device, image_store, template=None, max_new_tokens=32):
+        """Check assisted and plain greedy output agree; disables assistance if not
+
+        The plain run also sets the ms/token baseline used for `speedup`.
+        """
+        image = Image.new("RGB", (512, 512), (128, 128, 128))
+        plain_spans, assisted_spans = Spans(), Spans()
+        try:
+            with image_store.register(image) as image_path:
+                plain = generate_reports(model, self.tokenizer, device, [[image_path]],
+                                         max_new_tokens=max_new_tokens, spans=plain_spans, template=template)
+                new_tokens = plain_spans.values.get('new_tokens') or 1
+                self.baseline_ms_per_token = round(plain_spans.timings['generate'] / new_tokens, 3)
+                assisted = generate_reports(model, self.tokenizer, device, [[image_path]],
+                                            max_new_tokens=max_new_tokens, spans=assisted_spans,
+                                            template=template, assistant=self)
+            self.enabled = plain == assisted
+        except Exception as e:
+            print(f"⚠️ Assisted decoding check failed: {str(e)}")
+            self.enabled = False
+        return assisted_spans.values.get('assisted') if self.enabled else None
@@ -0,0 +1,234 @@
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Hedge only once this many latencies of the same path are known; earlier p95s are noise
+MIN_HEDGE_SAMPLES = 20
+# Latencies kept per replica and path
+LATENCY_SAMPLES = 200
+
+
+def parse_urls(text):
+    """Backend URLs from a comma-, space- or newline-separated string"""
+    return [url for url in re.split(r'[\s,]+', text.strip()) if url]
+
+
+class Backend:
+    """One replica as this client sees it"""
+
+    def __init__(self, url):
+        self.url = url
+        self.healthy = True
+        self.in_flight = 0
+        self.reported_load = 0
+        self.health_ms = None
+        self.busy_until = 0.0
+        # path -> recent latencies (ms) of successful hedgeable calls
+        self.latencies = {}
+
+    def endpoint(self, path):
+        return self.url.replace('/analyze', path)
+
+    def load(self):
+        return self.in_flight + self.reported_load
+
+
+class BackendPool:
+    """Route requests over several backend replicas through one keep-alive session
+
+    A background thread polls each replica's `/` health check; requests go to
+    the healthy replica with the least work (our in-flight requests plus the
+    queue depth it reports). With `hedge=True`, an idempotent request that is
+    still unanswered after the p95 latency of earlier calls to the same path
+    is duplicated to a second replica and whichever answers first wins.
+    """
+
+    def __init__(self, urls, health_interval=10.0, hedge=False, pool_size=16):
+        if isinstance(urls, str):
+            urls = parse_urls(urls)
+        self.backends = [Backend(url) for url in urls]
+        self.hedge = hedge
+        self.stats = {'requests': 0, 'failovers': 0, 'hedged': 0, 'hedge_wins': 0}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size)
+
+        # TLS handshakes to the tunnel are paid once per connection, not per request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(1, len(self.backends)), pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        if health_interval:
+            threading.Thread(target=self._health_loop, args=(health_interval,), daemon=True).start()
+
+    def check(self, backend):
+        """Refresh one replica's health, round-trip time and reported queue depth"""
+        started = time.perf_counter()
+        try:
+            response = self.session.get(backend.endpoint('/'), timeout=5)
+            health = response.json() if response.status_code == 200 else None
+        except (requests.RequestException, ValueError):
+            health = None
+
+        with self._lock:
+            backend.healthy = health is not None
+            backend.health_ms = round((time.perf_counter() - started) * 1000, 1)
+            if health is not None:
+                admission = health.get('admission') or {}
+                batching = health.get('batching') or {}
+                jobs = health.get('jobs') or {}
+                # Running jobs hold admission slots, so they are already in `in_flight`
+                backend.reported_load = admission.get('in_flight', batching.get('pending', 0)) + jobs.get('queued', 0)
+        return backend.healthy
+
+    def check_all(self):
+        """Check every replica now; returns how many are healthy"""
+        return sum(self.check(backend) for backend in self.backends)
+
+    def _health_loop(self, interval):
+        while True:
+            self.check_all()
+            time.sleep(interval)
+
+    def choose(self, exclude=()):
+        """Least-loaded healthy replica, preferring ones that haven't just sent a 429"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude]
+            candidates = [b for b in candidates if b.healthy] or candidates
+            candidates = [b for b in candidates if b.busy_until <= now] or candidates
+            if not candidates:
+                return None
+            return min(candidates, key=lambda b: (b.load(), b.health_ms or 0.0))
+
+    def available(self):
+        """True if some healthy replica is not backing off after a 429"""
+        now = time.monotonic()
+        return any(b.healthy and b.busy_until <= now for b in self.backends)
+
+    def hedge_delay(self, path):
+        """p95 of recent successful latencies of hedgeable `path` calls (s), or None if too few"""
+        with self._lock:
+            samples = sorted(ms for b in self.backends for ms in b.latencies.get(path, ()))
+        if len(samples) < MIN_HEDGE_SAMPLES:
+            return None
+        return samples[int(0.95 * (len(samples) - 1))] / 1000
+
+    def _send(self, backend, method, path, record=False, **kwargs):
+        """One request to one replica; `record` keeps its latency for the path's hedge delay"""
+        with self._lock:
+            backend.in_flight += 1
+            self.stats['requests'] += 1
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, backend.endpoint(path), **kwargs)
+        except requests.ConnectionError:
+            with self._lock:
+                backend.healthy = False
+            raise
+        finally:
+            with self._lock:
+                backend.in_flight -= 1
+
+        with self._lock:
+            if response.status_code == 200 and record:
+                samples = backend.latencies.setdefault(path, deque(maxlen=LATENCY_SAMPLES))
+                samples.append((time.perf_counter() - started) * 1000)
+            elif response.status_code == 429:
+                backend.busy_until = time.monotonic() + float(response.headers.get('Retry-After', 1))
+        return response
+
+    def _hedged(self, primary, delay, method, path, **kwargs):
+        first = self._executor.submit(self._send, primary, method, path, True, **kwargs)
+        done, _ = wait([first], timeout=delay)
+        backup = None if done else self.choose(exclude=[primary])
+        if backup is None:
+            return first.result()
+
+        with self._lock:
+            self.stats['hedged'] += 1
+        second = self._executor.submit(self._send, backup, method, path, True, **kwargs)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.RequestException as e:
+                    error = e
+                    continue
+                if response.status_code == 200 or not pending:
+                    if future is second and response.status_code == 200:
+                        with self._lock:
+                            self.stats['hedge_wins'] += 1
+                    # The slower copy finishes in the background and is discarded
+                    return response
+        raise error
+
+    def request(self, method, path, hedgeable=False, failover=True, **kwargs):
+        """Send to the best replica, failing over to the next on connection errors
+
+        `path` replaces `/analyze` in the replica URL. Only idempotent calls
+        should be `hedgeable`; streaming responses never are. Only hedgeable
+        calls feed the latency p95, so quick calls such as job submissions
+        don't shrink the hedge delay. Bodies that can only be sent once
+        (generators) need `failover=False`.
+        """
+        tried = []
+        error = None
+        while True:
+            backend = self.choose(exclude=tried)
+            if backend is None:
+                raise error or requests.ConnectionError("No backend configured")
+            if tried:
+                with self._lock:
+                    self.stats['failovers'] += 1
+            tried.append(backend)
+
+            hedgeable = hedgeable and not kwargs.get('stream')
+            delay = self.hedge_delay(path) if hedgeable and self.hedge else None
+            try:
+                if delay is not None and len(self.backends) > 1:
+                    return self._hedged(backend, delay, method, path, **kwargs)
+                return self._send(backend, method, path, hedgeable, **kwargs)
+            except requests.ConnectionError as e:
+                if not failover:
+                    raise
+                error = e
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def status(self):
+        """Per-replica health for display"""
+        with self._lock:
+            return [{
+                'url': b.url,
+                'healthy': b.healthy,
+                'health_ms': b.health_ms,
+                'load': b.load()
+            } for b in self.backends]
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def backend_pool(backends):
+    """A `BackendPool`, given one or a list of URLs; pools are reused per URL set"""
+    if isinstance(backends, BackendPool):
+        return backends
+    urls = tuple(parse_urls(backends) if isinstance(backends, str) else backends)
+    with _pools_lock:
+        if urls not in _pools:
+            _pools[urls] = BackendPool(list(urls))
+        return _pools[urls]
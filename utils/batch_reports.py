@@ -0,0 +1,153 @@
+"""Offline batch report generation
+
+    python -m utils.batch_reports /data/xrays reports.jsonl --batch-size 8
+    python -m utils.batch_reports manifest.jsonl reports.jsonl
+
+The input is a directory (searched recursively for PNG/JPEG/DICOM files), a JSONL
+manifest with `id` and `path` fields, or a text file with one path per line.
+Each study becomes one JSONL line with its `id` and `report` (or `error`).
+Runs are resumable: IDs that already have a report in the output are skipped.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from utils.inference import InMemoryImages, generate_reports
+from utils.model_loader import load_chexagent_model
+from utils.preprocess import MODEL_INPUT_SIZE, load_image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.dcm', '.dicom')
+
+
+def read_studies(source):
+    """Yield {'id', 'path'} dicts from a directory or manifest"""
+    if os.path.isdir(source):
+        for root, _, names in sorted(os.walk(source)):
+            for name in sorted(names):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    yield {'id': os.path.relpath(path, source), 'path': path}
+        return
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if source.endswith(".jsonl"):
+                entry = json.loads(line)
+                path = entry['path']
+                study_id = str(entry.get('id', path))
+            else:
+                path = study_id = line
+            yield {'id': study_id, 'path': os.path.join(base, path)}
+
+
+def completed_ids(output_path):
+    """IDs that already have a report; failed studies are retried"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn last line from an interrupted run
+            if 'report' in entry:
+                done.add(entry['id'])
+    return done
+
+
+def prefetch(studies, load, workers, depth):
+    """Decode images in a worker pool, keeping up to `depth` studies in flight"""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        window = deque()
+        for study in studies:
+            window.append((study, pool.submit(load, study['path'])))
+            if len(window) >= depth:
+                yield window.popleft()
+        while window:
+            yield window.popleft()
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run(source, output_path, batch_size=8, workers=4, target_size=MODEL_INPUT_SIZE,
+        max_new_tokens=512, model_name="StanfordAIMI/CheXagent-2-3b", cpu_profile="fp32"):
+    done = completed_ids(output_path)
+    studies = [s for s in read_studies(source) if s['id'] not in done]
+    print(f"📂 {len(studies)} studies to process ({len(done)} already done)")
+    if not studies:
+        return
+
+    model, tokenizer, device = load_chexagent_model(model_name, cpu_profile=cpu_profile)
+    tokenizer.padding_side = "left"
+    image_store = InMemoryImages(model)
+
+    processed = 0
+    started = time.perf_counter()
+    loaded = prefetch(studies, lambda path: load_image(path, target_size), workers, batch_size * 2)
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        for chunk in batched(loaded, batch_size):
+            ready, rows = [], []
+            for study, future in chunk:
+                try:
+                    ready.append((study, future.result()))
+                except Exception as e:
+                    rows.append({'id': study['id'], 'error': f"decode failed: {e}"})
+
+            if ready:
+                try:
+                    with ExitStack() as stack:
+                        paths = [[stack.enter_context(image_store.register(image))] for _, image in ready]
+                        reports = generate_reports(model, tokenizer, device, paths, max_new_tokens=max_new_tokens)
+                    rows += [{'id': study['id'], 'report': report} for (study, _), report in zip(ready, reports)]
+                except Exception as e:
+                    rows += [{'id': study['id'], 'error': str(e)} for study, _ in ready]
+
+            for row in rows:
+                out.write(json.dumps(row) + "\n")
+            out.flush()
+
+            processed += len(chunk)
+            rate = processed / (time.perf_counter() - started)
+            print(f"   {processed}/{len(studies)} studies, {rate:.2f} images/s", file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ {processed} studies in {elapsed:.0f} s ({processed / elapsed:.2f} images/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="Directory of X-rays or manifest file")
+    parser.add_argument("output", help="JSONL file to append reports to")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4, help="Image decoding threads")
+    parser.add_argument("--target-size", type=int, default=MODEL_INPUT_SIZE)
+    parser.add_argument("--max-new-tokens", type=int, default=512)
+    parser.add_argument("--model", default="StanfordAIMI/CheXagent-2-3b")
+    parser.add_argument("--cpu-profile", default="fp32")
+    args = parser.parse_args()
+    run(args.source, args.output, args.batch_size, args.workers, args.target_size,
+        args.max_new_tokens, args.model, args.cpu_profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+
+class MicroBatcher:
+    """Hold concurrent requests for a few milliseconds and run them as one batch
+
+    `run_batch` receives a list of items and must return one result per item,
+    in the same order. Each caller of `submit` only sees its own result.
+    With `concurrency` > 1, that many batches can run at once (e.g. one per
+    worker process).
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=10, history=1000, concurrency=1):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=history)
+        self._batch_sizes = Counter()
+        self._requests = 0
+        self._batches = 0
+
+        self._workers = [threading.Thread(target=self._loop, daemon=True) for _ in range(concurrency)]
+        for worker in self._workers:
+            worker.start()
+
+    def enqueue(self, item):
+        """Queue one item without waiting; returns a Future for its result"""
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def submit(self, item, timeout=None):
+        """Queue one item and block until its batch has run"""
+        return self.enqueue(item).result(timeout=timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Anything that queued up while the previous batch ran joins immediately
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+
+            with self._lock:
+                self._requests += len(batch)
+                self._batches += 1
+                self._batch_sizes[len(batch)] += 1
+                self._waits.extend(started - enqueued for _, _, enqueued in batch)
+
+            try:
+                results = self.run_batch([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"run_batch returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        """Queue-wait and batch-size statistics since startup"""
+        with self._lock:
+            waits = sorted(self._waits)
+            sizes = dict(sorted(self._batch_sizes.items()))
+            requests, batches = self._requests, self._batches
+
+        def pct(p):
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 2)
+
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'pending': self.pending(),
+            'requests': requests,
+            'batches': batches,
+            'mean_batch_size': round(requests / batches, 2) if batches else 0.0,
+            'batch_size_histogram': sizes,
+            'queue_wait_ms': {'p50': pct(0.50), 'p95': pct(0.95), 'max': pct(1.0)}
+        }
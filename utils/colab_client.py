@@ -0,0 +1,334 @@
+import base64
+import json
+import time
+import uuid
+
+import requests
+
+from utils.backend_pool import backend_pool
+from utils.inference import REPORT_PROMPT
+from utils.metrics import span
+from utils.preprocess import MODEL_INPUT_SIZE, prepare_upload
+from utils.report_cache import cache_key, pixel_digest
+
+MODEL_NAME = "StanfordAIMI/CheXagent-2-3b"
+MODEL_REVISION = "main"
+
+# What a backend that only reads `request.json` answers to a multipart body, in any Flask version
+JSON_ONLY_ERRORS = ("json", "unsupported media type", "content-type", "no image data provided")
+
+
+def test_colab_connection(colab_url):
+    """Test if Colab backend is reachable; returns the number of healthy replicas"""
+    return backend_pool(colab_url).check_all()
+
+
+def prepare_for_colab(image_file, target_size=MODEL_INPUT_SIZE, spans=None):
+    """Downscale the upload and compute its report cache key
+
+    Upload size statistics are left in `spans.values['upload']`.
+    """
+    with span(spans, "preprocess"):
+        image, upload_data, upload_mime, upload_stats = prepare_upload(image_file, target_size=target_size)
+
+        # Same pixels + same prompt/model always give the same report
+        key = cache_key(pixel_digest(image), REPORT_PROMPT, MODEL_NAME, MODEL_REVISION)
+    if spans is not None:
+        spans.values['upload'] = upload_stats
+    return key, upload_data, upload_mime
+
+
+def post_upload(pool, path, upload_data, upload_mime, stream=False, busy_retries=3, hedgeable=False):
+    """POST the upload to the best replica
+
+    A 429 moves the request to another replica if one has room; otherwise
+    we wait for as long as the backend's Retry-After asks.
+    """
+    for attempt in range(busy_retries + 1):
+        response = pool.post(
+            path,
+            files={'image': ('xray', upload_data, upload_mime)},
+            stream=stream,
+            timeout=120,
+            hedgeable=hedgeable
+        )
+        if response.status_code != 429 or attempt == busy_retries:
+            return response
+        if not pool.available():
+            time.sleep(min(float(response.headers.get('Retry-After', 1)), 30))
+
+
+def rejected_multipart(response):
+    """True if a backend that predates binary uploads refused the multipart body
+
+    Those backends call `request.json` inside a catch-all handler: Werkzeug
+    rejects the multipart content type (415, or 400 on older versions) and
+    the handler reports that as a 500, or the body parses as no JSON at all
+    and they answer 400 "No image data provided".
+    """
+    if response.status_code in (200, 404, 429):
+        return False
+    if response.status_code == 415:
+        return True
+    try:
+        error = str(response.json().get('error', ''))
+    except ValueError:
+        error = response.text
+    return any(marker in error.lower() for marker in JSON_ONLY_ERRORS)
+
+
+def analyze_with_colab(image_file, colab_url, report_cache=None, target_size=MODEL_INPUT_SIZE, spans=None):
+    """Send image to Colab GPU for analysis
+
+    `colab_url` is one backend URL, several separated by commas or newlines,
+    or a `BackendPool`.
+    """
+    pool = backend_pool(colab_url)
+    key, upload_data, upload_mime = prepare_for_colab(image_file, target_size, spans)
+    if report_cache is not None:
+        cached_report = report_cache.get(key)
+        if cached_report is not None:
+            return cached_report
+
+    # Send the bytes as multipart; no base64 (+33%)
+    with span(spans, "upload"):
+        response = post_upload(pool, '/analyze', upload_data, upload_mime, hedgeable=True)
+
+        # Backends that predate binary uploads only accept base64 JSON
+        if rejected_multipart(response):
+            img_str = base64.b64encode(upload_data).decode()
+            response = pool.session.post(
+                response.url,
+                json={'image': img_str},
+                timeout=120
+            )
+
+    result = response.json()
+
+    if result.get('status') == 'success':
+        if spans is not None:
+            spans.values['backend'] = result.get('timings', {})
+        if report_cache is not None:
+            report_cache.put(key, result['report'])
+        return result['report']
+    else:
+        raise Exception(result.get('error', 'Unknown error'))
+
+
+def stream_with_colab(image_file, colab_url, report_cache=None, target_size=MODEL_INPUT_SIZE, spans=None):
+    """Stream report tokens from Colab GPU as they are generated
+
+    Yields `token` events with partial text and ends with a `done` event
+    carrying the full report.
+    """
+    pool = backend_pool(colab_url)
+    key, upload_data, upload_mime = prepare_for_colab(image_file, target_size, spans)
+    if report_cache is not None:
+        cached_report = report_cache.get(key)
+        if cached_report is not None:
+            yield {'type': 'done', 'report': cached_report}
+            return
+
+    with span(spans, "upload"):
+        response = post_upload(pool, '/analyze_stream', upload_data, upload_mime, stream=True)
+
+    # Backends without the streaming endpoint: fall back to one blocking call
+    if response.status_code == 404:
+        report = analyze_with_colab(image_file, pool, report_cache, target_size, spans)
+        yield {'type': 'done', 'report': report}
+        return
+    if response.status_code != 200:
+        raise Exception(response.json().get('error', 'Unknown error'))
+
+    for line in response.iter_lines():
+        if not line:
+            continue
+        event = json.loads(line)
+        if event['type'] == 'error':
+            raise Exception(event.get('error', 'Unknown error'))
+        # Near-duplicate answers aren't cached locally, so a re-upload is flagged again
+        if event['type'] == 'done' and report_cache is not None and not event.get('near_duplicate'):
+            report_cache.put(key, event['report'])
+        yield event
+
+
+def analyze_with_jobs(image_file, colab_url, report_cache=None, target_size=MODEL_INPUT_SIZE, spans=None,
+                      poll_wait=20, deadline=900, max_poll_failures=5):
+    """Submit the study as a backend job and long-poll it
+
+    Yields the same events as `stream_with_colab`, but no connection is held
+    open while the model generates: a dropped tunnel only costs a re-poll,
+    and bursts queue on the backend instead of timing out. Backends without
+    the job API fall back to streaming. The job is polled on the replica
+    that accepted it.
+    """
+    pool = backend_pool(colab_url)
+    key, upload_data, upload_mime = prepare_for_colab(image_file, target_size, spans)
+    if report_cache is not None:
+        cached_report = report_cache.get(key)
+        if cached_report is not None:
+            yield {'type': 'done', 'report': cached_report}
+            return
+
+    with span(spans, "upload"):
+        response = pool.post(
+            '/jobs',
+            files={'image': ('xray', upload_data, upload_mime)},
+            timeout=120
+        )
+
+    if response.status_code == 404:
+        yield from stream_with_colab(image_file, pool, report_cache, target_size, spans)
+        return
+
+    result = response.json()
+    if result.get('status') != 'success':
+        raise Exception(result.get('error', 'Unknown error'))
+
+    job_id = result['job_id']
+    near = result.get('near_duplicate')
+    job_url = f"{response.url}/{job_id}"
+    received = ""
+    failures = 0
+    give_up = time.monotonic() + deadline
+    while True:
+        if time.monotonic() > give_up:
+            raise TimeoutError(f"Job {job_id} did not finish within {deadline} s")
+        try:
+            response = pool.session.get(
+                job_url,
+                params={'wait': poll_wait, 'since': len(received)},
+                timeout=poll_wait + 30
+            )
+            job = response.json()
+            failures = 0
+        except (requests.RequestException, ValueError):
+            # The job keeps running on the backend; just ask again
+            failures += 1
+            if failures > max_poll_failures:
+                raise
+            time.sleep(min(2 ** failures, 30))
+            continue
+
+        if job.get('status') != 'success':
+            raise Exception(job.get('error', 'Unknown error'))
+
+        partial = job.get('partial') or ""
+        if partial.startswith(received) and len(partial) > len(received):
+            yield {'type': 'token', 'text': partial[len(received):]}
+            received = partial
+
+        if job['state'] == 'done':
+            if report_cache is not None and not near:
+                report_cache.put(key, job['report'])
+            yield {'type': 'done', 'report': job['report'], 'timings': job.get('timings', {}), 'near_duplicate': near}
+            return
+        if job['state'] == 'failed':
+            raise Exception(job.get('error') or 'Unknown error')
+
+
+def analyze_batch_with_colab(image_files, colab_url, report_cache=None, target_size=MODEL_INPUT_SIZE):
+    """Analyze several X-rays in one streamed multipart upload to `/analyze_batch`
+
+    Yields one `{'type': 'result' | 'error', 'index', 'id', ...}` event per
+    file (`index` is its position in `image_files`), in completion order,
+    then the backend's `done` summary. Each file is downscaled just before its part is
+    sent, and cached studies are not uploaded. Backends without the bulk
+    endpoint get one `/analyze` call per study.
+    """
+    pool = backend_pool(colab_url)
+    image_files = list(image_files)
+    boundary = uuid.uuid4().hex
+    sent, local = [], []
+
+    def body():
+        for index, image_file in enumerate(image_files):
+            name = getattr(image_file, 'name', None) or f"xray-{index}"
+            try:
+                key, upload_data, upload_mime = prepare_for_colab(image_file, target_size)
+            except Exception as e:
+                local.append({'type': 'error', 'index': index, 'id': name, 'error': f"Unreadable image: {e}"})
+                continue
+            cached_report = report_cache.get(key) if report_cache is not None else None
+            if cached_report is not None:
+                local.append({'type': 'result', 'index': index, 'id': name, 'report': cached_report, 'cached': True})
+                continue
+
+            sent.append((index, name, key))
+            filename = name.replace('"', "'")
+            yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"images\"; filename=\"{filename}\"\r\n"
+                   f"Content-Type: {upload_mime}\r\n\r\n").encode()
+            yield upload_data
+            yield b"\r\n"
+        yield f"--{boundary}--\r\n".encode()
+
+    # The body is generated as it is sent, so it can't be replayed on another replica
+    response = pool.post(
+        '/analyze_batch',
+        data=body(),
+        headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+        stream=True,
+        timeout=(30, 300),
+        failover=False
+    )
+    yield from local
+
+    if response.status_code == 404:
+        for index, name, _ in sent:
+            try:
+                report = analyze_with_colab(image_files[index], pool, report_cache, target_size)
+                yield {'type': 'result', 'index': index, 'id': name, 'report': report, 'cached': False}
+            except Exception as e:
+                yield {'type': 'error', 'index': index, 'id': name, 'error': str(e)}
+        return
+    if response.status_code != 200:
+        raise Exception(response.json().get('error', 'Unknown error'))
+
+    answered, summary = set(), None
+    for line in response.iter_lines():
+        if not line:
+            continue
+        event = json.loads(line)
+        if event['type'] == 'done':
+            summary = event
+            continue
+        # The backend numbers only the parts it received
+        index, name, key = sent[event['index']]
+        event.update(index=index, id=name)
+        answered.add(index)
+        if event['type'] == 'result' and report_cache is not None and not event.get('near_duplicate'):
+            report_cache.put(key, event['report'])
+        yield event
+
+    for index, name, _ in sent:
+        if index not in answered:
+            yield {'type': 'error', 'index': index, 'id': name, 'error': "Backend closed the stream before this study"}
+    if summary is not None:
+        yield summary
+
+
+def workup_with_colab(image_file, colab_url, prompts=None, batch=True, target_size=MODEL_INPUT_SIZE, spans=None):
+    """Ask the backend several questions about one study (findings, impression,
+    view, yes/no findings); returns a dict of answers keyed like `prompts`
+    """
+    pool = backend_pool(colab_url)
+    _, upload_data, upload_mime = prepare_for_colab(image_file, target_size, spans)
+
+    data = {'batch': '1' if batch else '0'}
+    if prompts:
+        data['prompts'] = json.dumps(prompts)
+    with span(spans, "upload"):
+        response = pool.post(
+            '/workup',
+            files={'image': ('xray', upload_data, upload_mime)},
+            data=data,
+            timeout=300,
+            hedgeable=True
+        )
+
+    result = response.json()
+    if result.get('status') != 'success':
+        raise Exception(result.get('error', 'Unknown error'))
+    if spans is not None:
+        spans.values['backend'] = result.get('timings', {})
+    return result['answers']
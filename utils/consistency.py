@@ -0,0 +1,68 @@
+import re
+
+from sentence_transformers import util
+
+# Cosine similarity (all-MiniLM-L6-v2) below which a sentence counts as unmatched
+SUPPORT_THRESHOLD = 0.35
+COVERAGE_THRESHOLD = 0.35
+MIN_WORDS = 3
+
+
+def split_sentences(text):
+    """Split a report into sentences, dropping markdown and very short fragments"""
+    text = re.sub(r'\*\*|__|^#+\s*|^\s*[-*•]\s+', '', text, flags=re.MULTILINE)
+    parts = re.split(r'(?<=[.!?])\s+|\n+', text)
+    return [p.strip() for p in parts if len(p.split()) >= MIN_WORDS]
+
+
+def _quote(sentences, limit=2):
+    quoted = "; ".join(f'"{s}"' for s in sentences[:limit])
+    if len(sentences) > limit:
+        quoted += f" (+{len(sentences) - limit} more)"
+    return quoted
+
+
+def check_consistency(model, medical_report, layman_report,
+                      support_threshold=SUPPORT_THRESHOLD, coverage_threshold=COVERAGE_THRESHOLD):
+    """Compare the two reports sentence by sentence with one batched encode
+
+    Layman sentences with no similar medical sentence are flagged as possible
+    hallucinations; medical sentences with no similar layman sentence as
+    omitted findings. Returns the fields the results card shows.
+    """
+    medical = split_sentences(medical_report) or [medical_report]
+    layman = split_sentences(layman_report) or [layman_report]
+
+    embeddings = model.encode(medical + layman, convert_to_tensor=True, batch_size=64)
+    # rows: layman sentences, columns: medical sentences
+    similarity = util.cos_sim(embeddings[len(medical):], embeddings[:len(medical)])
+    support = similarity.max(dim=1).values
+    coverage = similarity.max(dim=0).values
+
+    unsupported = [s for s, v in zip(layman, support.tolist()) if v < support_threshold]
+    omitted = [s for s, v in zip(medical, coverage.tolist()) if v < coverage_threshold]
+
+    agreement = (support.mean().item() + coverage.mean().item()) / 2
+    if agreement >= 0.6:
+        difference = "LOW"
+    elif agreement >= 0.45:
+        difference = "MEDIUM"
+    else:
+        difference = "HIGH"
+
+    notes = []
+    if unsupported:
+        notes.append(f"{len(unsupported)} of {len(layman)} patient sentences not found in the "
+                     f"medical report: {_quote(unsupported)}")
+    if omitted:
+        notes.append(f"{len(omitted)} of {len(medical)} medical findings missing from the "
+                     f"translation: {_quote(omitted)}")
+
+    return {
+        'hallucinated': "YES" if unsupported else "NO",
+        'difference': difference,
+        'explanation': ". ".join(notes) or "Every sentence is supported by the other report.",
+        'hallucination_score': round(100 * len(unsupported) / len(layman)),
+        'unsupported_sentences': unsupported,
+        'omitted_findings': omitted
+    }
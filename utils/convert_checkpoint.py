@@ -0,0 +1,53 @@
+"""One-time conversion of CheXagent to a target-dtype safetensors checkpoint
+
+    python -m utils.convert_checkpoint checkpoints/chexagent-bf16 --dtype bfloat16
+
+Point `load_chexagent_model` (or CHEXAGENT_CHECKPOINT on the backend) at the
+output directory; the weights are then memory-mapped in their final dtype
+and no cast is needed at startup.
+"""
+import argparse
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from utils.model_loader import cast_leftovers
+
+
+def convert_checkpoint(output_dir, model_name="StanfordAIMI/CheXagent-2-3b", dtype="bfloat16"):
+    torch_dtype = getattr(torch, dtype)
+    started = time.perf_counter()
+
+    tokenizer = AutoTokenizer.from_pretrained(
+        model_name,
+        trust_remote_code=True,
+        revision="main"
+    )
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        trust_remote_code=True,
+        revision="main",
+        torch_dtype=torch_dtype,
+        low_cpu_mem_usage=True
+    )
+    model = cast_leftovers(model, torch_dtype)
+
+    # Remote-code models also copy their modeling/tokenizer files into output_dir
+    model.save_pretrained(output_dir, safe_serialization=True, max_shard_size="2GB")
+    tokenizer.save_pretrained(output_dir)
+
+    print(f"✅ Saved {dtype} checkpoint to {output_dir} in {time.perf_counter() - started:.1f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output_dir")
+    parser.add_argument("--model", default="StanfordAIMI/CheXagent-2-3b")
+    parser.add_argument("--dtype", default="bfloat16", choices=["float32", "bfloat16", "float16"])
+    args = parser.parse_args()
+    convert_checkpoint(args.output_dir, args.model, args.dtype)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+from io import BytesIO
+
+import numpy as np
+import pydicom
+from PIL import Image
+from pydicom import encaps
+from pydicom.multival import MultiValue
+
+# Uncompressed little-endian transfer syntaxes: pixel data is read in place, never decoded
+NATIVE_SYNTAXES = ("1.2.840.10008.1.2", "1.2.840.10008.1.2.1")
+# Codecs PIL can decode straight to a reduced size (JPEG baseline, JPEG 2000)
+JPEG_SYNTAXES = ("1.2.840.10008.1.2.4.50",)
+JPEG2000_SYNTAXES = ("1.2.840.10008.1.2.4.90", "1.2.840.10008.1.2.4.91")
+
+# Full-resolution rows converted to float at a time; bounds the working memory per study
+CHUNK_ROWS = 256
+
+
+def is_dicom(source):
+    """True for DICOM Part 10 data (bytes or a path): 'DICM' after the 128-byte preamble"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[128:132]) == b"DICM"
+    with open(source, "rb") as f:
+        f.seek(128)
+        return f.read(4) == b"DICM"
+
+
+def _first(value):
+    return float(value[0] if isinstance(value, MultiValue) else value)
+
+
+def _voi_transform(ds):
+    """Vectorized modality + VOI LUT: stored values -> display values in 0..1
+
+    Returns (transform, windowed); without a VOI LUT or window the modality
+    values come back unscaled and are stretched over their range afterwards.
+    """
+    slope = float(ds.get("RescaleSlope", 1) or 1)
+    intercept = float(ds.get("RescaleIntercept", 0) or 0)
+
+    def modality(values):
+        return values * slope + intercept if slope != 1 or intercept != 0 else values
+
+    if "VOILUTSequence" in ds:
+        item = ds.VOILUTSequence[0]
+        entries, first, bits = item.LUTDescriptor
+        data = item.LUTData
+        lut = np.frombuffer(data, dtype=np.uint16) if isinstance(data, bytes) else np.asarray(data)
+        lut = lut.astype(np.float32) / float((1 << bits) - 1)
+
+        def lookup(values):
+            return lut[np.clip(modality(values) - first, 0, len(lut) - 1).astype(np.intp)]
+        return lookup, True
+
+    if "WindowCenter" in ds and "WindowWidth" in ds:
+        center, width = _first(ds.WindowCenter), max(_first(ds.WindowWidth), 1.0)
+        function = str(ds.get("VOILUTFunction", "LINEAR")).upper()
+
+        def window(values):
+            values = modality(values)
+            if function == "SIGMOID":
+                return 1.0 / (1.0 + np.exp(-4.0 * (values - center) / width))
+            if function == "LINEAR_EXACT":
+                return np.clip((values - center) / width + 0.5, 0.0, 1.0)
+            return np.clip((values - (center - 0.5)) / max(width - 1.0, 1.0) + 0.5, 0.0, 1.0)
+        return window, True
+
+    return modality, False
+
+
+def _unchanged(chunk):
+    return chunk
+
+
+def _stored_bits(ds):
+    """Drop unused high bits (BitsStored < BitsAllocated) of in-place pixel data"""
+    allocated, stored = ds.BitsAllocated, ds.get("BitsStored", ds.BitsAllocated)
+    if stored >= allocated:
+        return _unchanged
+    shift = allocated - stored
+    if ds.PixelRepresentation:
+        return lambda chunk: (chunk << shift) >> shift
+    mask = (1 << stored) - 1
+    return lambda chunk: chunk & mask
+
+
+def _reduce(pixels, factor, stored, transform):
+    """Area-average by `factor`, transforming CHUNK_ROWS rows at a time
+
+    Only one band of rows is ever held as float; a memory-mapped `pixels`
+    is read as it goes.
+    """
+    rows, cols = pixels.shape[0] // factor * factor, pixels.shape[1] // factor * factor
+    out = np.empty((rows // factor, cols // factor), dtype=np.float32)
+    band = max(factor, CHUNK_ROWS // factor * factor)
+    for top in range(0, rows, band):
+        chunk = transform(stored(np.asarray(pixels[top:min(top + band, rows), :cols])).astype(np.float32))
+        height = chunk.shape[0]
+        out[top // factor:(top + height) // factor] = (
+            chunk.reshape(height // factor, factor, cols // factor, factor).mean(axis=(1, 3))
+        )
+    return out
+
+
+def _native_pixels(ds, source):
+    """First frame of uncompressed pixel data, memory-mapped or viewed in place"""
+    element = ds.get_item("PixelData")
+    value_tell = getattr(element, "value_tell", None)
+    if value_tell is None or ds.BitsAllocated not in (8, 16, 32) or ds.get("SamplesPerPixel", 1) != 1:
+        return None
+    dtype = np.dtype(f"<{'i' if ds.PixelRepresentation else 'u'}{ds.BitsAllocated // 8}")
+    shape = (ds.Rows, ds.Columns)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return np.frombuffer(source, dtype=dtype, count=shape[0] * shape[1], offset=value_tell).reshape(shape)
+    return np.memmap(source, dtype=dtype, mode="r", offset=value_tell, shape=shape)
+
+
+def _codec_pixels(ds, syntax, short_side):
+    """Decode the first compressed frame with PIL at the smallest scale still >= short_side"""
+    frames = getattr(encaps, "generate_frames", None) or encaps.generate_pixel_data_frame
+    image = Image.open(BytesIO(next(frames(ds.PixelData))))
+    if syntax in JPEG_SYNTAXES:
+        image.draft("L", (short_side, short_side))
+    else:
+        level = 0
+        while min(image.size) >> (level + 1) >= short_side:
+            level += 1
+        image.reduce = level
+    if image.mode not in ("L", "I", "I;16"):
+        image = image.convert("L")
+    return np.asarray(image)
+
+
+def read_dicom(source, short_side):
+    """Decode a DICOM X-ray to 8-bit grayscale with its short side >= `short_side`
+
+    `source` is a path (pixel data is memory-mapped) or the file's bytes
+    (viewed in place). JPEG and JPEG 2000 frames are decoded at a reduced
+    scale; other codecs go through pydicom. The modality rescale and VOI
+    LUT / window are applied in float32 one band of rows at a time while
+    area-averaging down, so no full-size float copy exists.
+
+    Returns (image, original (width, height)).
+    """
+    in_memory = isinstance(source, (bytes, bytearray, memoryview))
+    ds = pydicom.dcmread(BytesIO(source) if in_memory else source, defer_size="1 KB")
+    syntax = ds.file_meta.TransferSyntaxUID
+    original_size = (ds.Columns, ds.Rows)
+
+    stored = _unchanged
+    pixels = None
+    if syntax in NATIVE_SYNTAXES:
+        pixels = _native_pixels(ds, source)
+        stored = _stored_bits(ds)
+    elif syntax in JPEG_SYNTAXES + JPEG2000_SYNTAXES:
+        pixels = _codec_pixels(ds, syntax, short_side)
+    if pixels is None:
+        stored = _unchanged
+        pixels = ds.pixel_array
+        if ds.get("NumberOfFrames", 1) > 1:
+            pixels = pixels[0]
+        if pixels.ndim == 3:
+            pixels = pixels.mean(axis=2)
+
+    transform, windowed = _voi_transform(ds)
+    factor = max(1, min(pixels.shape) // short_side)
+    values = _reduce(pixels, factor, stored, transform)
+
+    if not windowed:
+        lo, hi = float(values.min()), float(values.max())
+        values = (values - lo) / (hi - lo) if hi > lo else np.zeros_like(values)
+    if ds.get("PhotometricInterpretation") == "MONOCHROME1":
+        values = 1.0 - values
+
+    return Image.fromarray(np.round(values * 255).astype(np.uint8)), original_size
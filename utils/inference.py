@@ -0,0 +1,421 @@
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+import torch
+from PIL import Image
+from transformers import TextIteratorStreamer
+from transformers.generation.streamers import BaseStreamer
+
+from utils.metrics import span
+
+SYSTEM_PROMPT = "You are a helpful assistant."
+REPORT_PROMPT = "Generate a radiology report for this chest X-ray."
+
+# Partial text of a batched generation is handed to its listeners at most this often (s)
+PARTIAL_INTERVAL = 0.25
+
+# Default /workup questions, all answered from one vision pass
+WORKUP_PROMPTS = {
+    'findings': "Write the findings section of a radiology report for this chest X-ray.",
+    'impression': "Write the impression section of a radiology report for this chest X-ray.",
+    'view': "What is the view of this chest X-ray? Answer with AP, PA or lateral.",
+    'cardiomegaly': "Is there cardiomegaly? Answer yes or no.",
+    'pleural_effusion': "Is there a pleural effusion? Answer yes or no.",
+    'pneumothorax': "Is there a pneumothorax? Answer yes or no.",
+    'consolidation': "Is there consolidation? Answer yes or no."
+}
+
+
+def build_input_ids(tokenizer, image_paths, prompt=REPORT_PROMPT, spans=None):
+    """Tokenize the CheXagent chat template for one study"""
+    with span(spans, "from_list_format"):
+        query = tokenizer.from_list_format([
+            *[{'image': path} for path in image_paths],
+            {'text': prompt}
+        ])
+
+    conv = [
+        {"from": "system", "value": SYSTEM_PROMPT},
+        {"from": "human", "value": query}
+    ]
+
+    with span(spans, "apply_chat_template"):
+        return tokenizer.apply_chat_template(
+            conv,
+            add_generation_prompt=True,
+            return_tensors="pt"
+        )[0]
+
+
+def _pad_token_id(tokenizer):
+    for attr in ("pad_token_id", "eos_token_id", "eod_id"):
+        token_id = getattr(tokenizer, attr, None)
+        if token_id is not None:
+            return token_id
+    return 0
+
+
+def _eos_token_ids(model, tokenizer):
+    eos = getattr(model.generation_config, "eos_token_id", None)
+    if eos is None:
+        eos = tokenizer.eos_token_id
+    if eos is None:
+        return set()
+    return set(eos) if isinstance(eos, (list, tuple)) else {eos}
+
+
+def _left_pad(sequences, pad_id):
+    """Left-pad 1-D id tensors so every prompt ends at the same position"""
+    width = max(seq.size(0) for seq in sequences)
+    input_ids = torch.full((len(sequences), width), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), width), dtype=torch.long)
+    for row, seq in enumerate(sequences):
+        input_ids[row, width - seq.size(0):] = seq
+        attention_mask[row, width - seq.size(0):] = 1
+    return input_ids, attention_mask
+
+
+def decode_report(tokenizer, tokens, eos_ids):
+    """Decode generated ids, matching the single-request `output[n:-1]` slice"""
+    tokens = tokens.tolist()
+    for i, token in enumerate(tokens):
+        if token in eos_ids:
+            return tokenizer.decode(tokens[:i])
+    # Generation hit max_new_tokens; the original path still drops the last token
+    return tokenizer.decode(tokens[:-1])
+
+
+class FirstTokenTimer(BaseStreamer):
+    """Streamer that only notes when generate() emits its first new token"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token = None
+        self._puts = 0
+
+    def put(self, value):
+        # The first put() is the prompt itself
+        self._puts += 1
+        if self._puts == 2:
+            self.first_token = time.perf_counter()
+
+    def end(self):
+        pass
+
+
+class PartialReports(FirstTokenTimer):
+    """FirstTokenTimer that also hands each row's text so far to a listener
+
+    `listeners` has one callable (or None) per batch row; each is called
+    with its row's decoded text at most every `interval` seconds while the
+    batch decodes, and never again after that row's EOS.
+    """
+
+    def __init__(self, tokenizer, listeners, eos_ids, interval=PARTIAL_INTERVAL):
+        super().__init__()
+        self.tokenizer = tokenizer
+        self.listeners = listeners
+        self.eos_ids = eos_ids
+        self.interval = interval
+        self._tokens = [[] for _ in listeners]
+        self._finished = [False] * len(listeners)
+        self._flushed = time.perf_counter()
+        self._changed = set()
+
+    def put(self, value):
+        super().put(value)
+        if self._puts < 2:
+            return
+        tokens = value.reshape(-1).tolist()
+        # Batched steps carry one token per row; a single row may get several (assisted decoding)
+        columns = [tokens] if len(self._tokens) == 1 else [[token] for token in tokens]
+        for row, new in enumerate(columns):
+            for token in new:
+                if self._finished[row]:
+                    break
+                if token in self.eos_ids:
+                    self._finished[row] = True
+                else:
+                    self._tokens[row].append(token)
+                    self._changed.add(row)
+        if time.perf_counter() - self._flushed >= self.interval:
+            self._flush()
+
+    def _flush(self):
+        for row in sorted(self._changed):
+            if self.listeners[row] is not None:
+                self.listeners[row](self.tokenizer.decode(self._tokens[row]))
+        self._changed.clear()
+        self._flushed = time.perf_counter()
+
+    def end(self):
+        pass
+
+
+def _record_generate(spans, started, first_token, new_tokens):
+    if spans is None:
+        return
+    elapsed = time.perf_counter() - started
+    spans.record("generate", elapsed * 1000)
+    if first_token is not None:
+        spans.record("time_to_first_token", (first_token - started) * 1000)
+    spans.values['new_tokens'] = new_tokens
+    spans.values['tokens_per_second'] = round(new_tokens / elapsed, 2) if elapsed > 0 else 0.0
+
+
+def _prompt_ids(tokenizer, image_paths, prompt, spans, template):
+    if template is not None and template.prompt == prompt:
+        return template.input_ids(image_paths, spans)
+    return build_input_ids(tokenizer, image_paths, prompt, spans)
+
+
+def generate_reports(model, tokenizer, device, studies, prompt=REPORT_PROMPT, max_new_tokens=512, spans=None,
+                     template=None, assistant=None, listeners=None):
+    """Generate one report per study in a single batched `generate` call
+
+    `studies` is a list of image path lists (one list per study); `prompt`
+    is shared or a list with one prompt per study. A `PromptTemplate` skips
+    re-tokenizing the fixed text. An `AssistedDecoder` drafts tokens for single-study calls. `listeners`
+    (one callable or None per study) receive each report's partial text
+    while the batch decodes.
+    """
+    prompts = list(prompt) if isinstance(prompt, (list, tuple)) else [prompt] * len(studies)
+    sequences = [_prompt_ids(tokenizer, paths, p, spans, template) for paths, p in zip(studies, prompts)]
+    pad_id = _pad_token_id(tokenizer)
+    input_ids, attention_mask = _left_pad(sequences, pad_id)
+    extra = {}
+    assisted = assistant is not None and assistant.applies(len(studies))
+    if assisted:
+        extra.update(assistant.generate_kwargs())
+
+    eos_ids = _eos_token_ids(model, tokenizer) | {pad_id}
+    if listeners is not None and any(listeners):
+        timer = PartialReports(tokenizer, listeners, eos_ids)
+    else:
+        timer = FirstTokenTimer() if spans is not None else None
+    started = time.perf_counter()
+    with torch.no_grad(), assistant.track() if assisted else nullcontext() as counts:
+        output = model.generate(
+            input_ids.to(device),
+            attention_mask=attention_mask.to(device),
+            do_sample=False,
+            num_beams=1,
+            max_new_tokens=max_new_tokens,
+            pad_token_id=pad_id,
+            streamer=timer,
+            **extra
+        )
+
+    prompt_len = input_ids.size(1)
+    new_tokens = (output.size(1) - prompt_len) * output.size(0)
+    _record_generate(spans, started, timer.first_token if timer is not None else None, new_tokens)
+    if assisted:
+        assistant.record(spans, counts, new_tokens, time.perf_counter() - started)
+
+    with span(spans, "decode"):
+        return [decode_report(tokenizer, row[prompt_len:], eos_ids) for row in output]
+
+
+class VisionFeatureCache:
+    """LRU of vision-tower outputs per study, bounded by tensor bytes
+
+    Several prompts about one image (findings, impression, yes/no questions)
+    then cost one vision pass instead of one per prompt.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self._lock:
+            features = self._entries.get(key)
+            if features is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return features
+
+    def put(self, key, features):
+        size = features.element_size() * features.nelement()
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                old = self._entries.pop(key)
+                self._bytes -= old.element_size() * old.nelement()
+            # A row of a batched output is a view; cloning frees the rest of the batch
+            self._entries[key] = features.detach().clone()
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.element_size() * evicted.nelement()
+                self.stats['evictions'] += 1
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+
+
+class InMemoryImages:
+    """Feed decoded PIL images to the vision encoder without a temp-file round trip
+
+    CheXagent (like Qwen-VL) embeds each image *path* in the prompt and opens
+    it inside the vision tower's `encode`. We wrap that method so paths of the
+    form `mem://<id>` resolve to images held in this registry. Models without
+    such an encoder fall back to files on /dev/shm (RAM-backed), never disk.
+
+    Images registered with a `key` (e.g. their pixel digest) have their
+    features kept in `feature_cache`; repeats of one study in a batch (same
+    key, or same path when there is none) are encoded once.
+    """
+
+    SCHEME = "mem://"
+
+    def __init__(self, model, feature_cache=None):
+        self._images = {}
+        self._keys = {}
+        self.feature_cache = feature_cache
+        self._lock = threading.Lock()
+        self._visual = self._find_visual(model)
+        if self._visual is not None:
+            self._patch(self._visual)
+
+    @staticmethod
+    def _find_visual(model):
+        for module in model.modules():
+            if callable(getattr(module, "encode", None)) and hasattr(module, "image_transform"):
+                return module
+        return None
+
+    def _patch(self, visual):
+        original_encode = visual.encode
+
+        def encode(image_paths):
+            if not any(str(path).startswith(self.SCHEME) for path in image_paths):
+                return original_encode(image_paths)
+            with self._lock:
+                keys = [self._keys.get(path) for path in image_paths]
+
+            features = [None] * len(image_paths)
+            if self.feature_cache is not None:
+                for i, key in enumerate(keys):
+                    if key is not None:
+                        features[i] = self.feature_cache.get(key)
+
+            # Study (pixel digest, else path) -> positions still needing the vision tower.
+            # One image registered once per prompt has a new path each time but one key
+            todo = OrderedDict()
+            for i, path in enumerate(image_paths):
+                if features[i] is None:
+                    todo.setdefault(keys[i] if keys[i] is not None else path, []).append(i)
+
+            if todo:
+                pixels = []
+                for positions in todo.values():
+                    path = image_paths[positions[0]]
+                    if str(path).startswith(self.SCHEME):
+                        with self._lock:
+                            image = self._images[path]
+                    else:
+                        image = Image.open(path)
+                    pixels.append(visual.image_transform(image.convert("RGB")))
+                encoded = visual(torch.stack(pixels, dim=0))
+                for positions, feature in zip(todo.values(), encoded):
+                    for i in positions:
+                        features[i] = feature
+                    key = keys[positions[0]]
+                    if key is not None and self.feature_cache is not None:
+                        self.feature_cache.put(key, feature)
+            return torch.stack(features, dim=0)
+
+        visual.encode = encode
+
+    @contextmanager
+    def register(self, image, key=None):
+        """Yield a path string the tokenizer can embed for `image`"""
+        if self._visual is None:
+            shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+            with tempfile.NamedTemporaryFile(suffix=".png", dir=shm_dir) as tmp:
+                image.save(tmp, format="PNG")
+                tmp.flush()
+                yield tmp.name
+            return
+
+        path = f"{self.SCHEME}{uuid.uuid4().hex}"
+        with self._lock:
+            self._images[path] = image
+            if key is not None:
+                self._keys[path] = key
+        try:
+            yield path
+        finally:
+            with self._lock:
+                self._images.pop(path, None)
+                self._keys.pop(path, None)
+
+
+def stream_report(model, tokenizer, device, image_paths, prompt=REPORT_PROMPT, max_new_tokens=512, spans=None,
+                  template=None, assistant=None):
+    """Yield report text as it is generated
+
+    Emits `{'type': 'token', 'text': ...}` events while decoding and a final
+    `{'type': 'done', 'report': ...}` whose text matches `generate_reports`.
+    """
+    input_ids = _prompt_ids(tokenizer, image_paths, prompt, spans, template).unsqueeze(0)
+    extra = {}
+    assisted = assistant is not None and assistant.applies(1)
+    if assisted:
+        extra.update(assistant.generate_kwargs())
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    result = {}
+
+    def run():
+        try:
+            # Forward passes are counted in the thread that runs generate()
+            with torch.no_grad(), assistant.track() if assisted else nullcontext() as counts:
+                result['counts'] = counts
+                result['output'] = model.generate(
+                    input_ids.to(device),
+                    do_sample=False,
+                    num_beams=1,
+                    max_new_tokens=max_new_tokens,
+                    streamer=streamer,
+                    **extra
+                )[0]
+        except Exception as e:
+            result['error'] = e
+            streamer.end()
+
+    started = time.perf_counter()
+    first_token = None
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    for text in streamer:
+        if text:
+            if first_token is None:
+                first_token = time.perf_counter()
+            yield {'type': 'token', 'text': text}
+    thread.join()
+
+    if 'error' in result:
+        raise result['error']
+
+    new_tokens = result['output'][input_ids.size(1):]
+    _record_generate(spans, started, first_token, len(new_tokens))
+    if assisted:
+        assistant.record(spans, result['counts'], len(new_tokens), time.perf_counter() - started)
+
+    eos_ids = _eos_token_ids(model, tokenizer)
+    with span(spans, "decode"):
+        report = decode_report(tokenizer, new_tokens, eos_ids)
+    yield {'type': 'done', 'report': report}
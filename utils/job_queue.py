@@ -0,0 +1,167 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    image BLOB,
+    cache_key TEXT,
+    partial TEXT NOT NULL DEFAULT '',
+    report TEXT,
+    error TEXT,
+    timings TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state_created ON jobs (state, created);
+"""
+
+
+class JobStore:
+    """Durable analysis queue in SQLite
+
+    Uploads are stored with the job, so queued work survives a backend
+    restart; jobs that were running when the process died are re-queued.
+    """
+
+    def __init__(self, path="jobs.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._wakeup = threading.Condition()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _notify(self):
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def submit(self, image_data, key=None, report=None):
+        """Queue an upload; pass `report` to record an already-answered job"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        if report is None:
+            self._execute(
+                "INSERT INTO jobs (id, state, image, cache_key, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, image_data, key, now, now)
+            )
+        else:
+            self._execute(
+                "INSERT INTO jobs (id, state, cache_key, partial, report, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, DONE, key, report, report, now, now)
+            )
+        self._notify()
+        return job_id
+
+    def claim(self, timeout=1.0):
+        """Take the oldest queued job, waiting up to `timeout` s; returns (id, image, key) or None"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                row = self._conn.execute(
+                    "SELECT id, image, cache_key FROM jobs WHERE state = ? ORDER BY created LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row:
+                    self._conn.execute("UPDATE jobs SET state = ?, updated = ? WHERE id = ?",
+                                       (RUNNING, time.time(), row[0]))
+                self._conn.execute("COMMIT")
+            if row:
+                self._notify()
+                return row
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            with self._wakeup:
+                self._wakeup.wait(remaining)
+
+    def update_partial(self, job_id, text):
+        self._execute("UPDATE jobs SET partial = ?, updated = ? WHERE id = ?", (text, time.time(), job_id))
+        self._notify()
+
+    def finish(self, job_id, report, timings=None):
+        # The upload is no longer needed once the report exists
+        self._execute(
+            "UPDATE jobs SET state = ?, partial = ?, report = ?, timings = ?, image = NULL, updated = ? WHERE id = ?",
+            (DONE, report, report, json.dumps(timings or {}), time.time(), job_id)
+        )
+        self._notify()
+
+    def fail(self, job_id, error):
+        self._execute("UPDATE jobs SET state = ?, error = ?, image = NULL, updated = ? WHERE id = ?",
+                      (FAILED, error, time.time(), job_id))
+        self._notify()
+
+    def get(self, job_id):
+        rows = self._execute(
+            "SELECT state, partial, report, error, timings, created, updated FROM jobs WHERE id = ?", (job_id,)
+        )
+        if not rows:
+            return None
+        state, partial, report, error, timings, created, updated = rows[0]
+        job = {
+            'job_id': job_id,
+            'state': state,
+            'partial': partial,
+            'report': report,
+            'error': error,
+            'timings': json.loads(timings) if timings else {},
+            'created': created,
+            'updated': updated
+        }
+        if state == QUEUED:
+            job['position'] = self._execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = ? AND created < ?", (QUEUED, created)
+            )[0][0]
+        return job
+
+    def wait(self, job_id, since=0, timeout=20.0):
+        """Long-poll: return the job once it has more than `since` characters of
+        output or has finished, or after `timeout` seconds
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['state'] in (DONE, FAILED) or len(job['partial']) > since:
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            with self._wakeup:
+                self._wakeup.wait(min(remaining, 1.0))
+
+    def requeue_running(self):
+        """Put jobs orphaned by a crash or restart back in the queue"""
+        with self._lock:
+            count = self._conn.execute(
+                "UPDATE jobs SET state = ?, partial = '', updated = ? WHERE state = ?",
+                (QUEUED, time.time(), RUNNING)
+            ).rowcount
+        self._notify()
+        return count
+
+    def purge(self, older_than):
+        """Delete finished jobs last updated more than `older_than` seconds ago"""
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?) AND updated < ?", (DONE, FAILED, time.time() - older_than)
+            ).rowcount
+
+    def counts(self):
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(self._execute("SELECT state, COUNT(*) FROM jobs GROUP BY state")))
+        return counts
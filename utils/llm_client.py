@@ -0,0 +1,156 @@
+import asyncio
+import random
+import threading
+import time
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+class LLMError(Exception):
+    """Error raised by a backend, carrying the HTTP-style status code if known"""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+def is_retryable(error):
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    # google.api_core exceptions expose the HTTP status as `.code`
+    return getattr(error, 'code', None) in RETRYABLE_STATUS
+
+
+class GeminiBackend:
+    """Gemini via google-generativeai, reusing one GenerativeModel"""
+
+    def __init__(self, model_name='gemini-2.5-flash', api_key=None):
+        import google.generativeai as genai
+
+        if api_key:
+            genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt):
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+
+class StubBackend:
+    """Local stand-in for tests and benchmarks; never touches the network
+
+    `responder(prompt)` produces the reply (default: echo the last line).
+    The first `fail_times` calls raise a retryable 429.
+    """
+
+    def __init__(self, responder=None, latency=0.0, fail_times=0):
+        self.responder = responder or (lambda prompt: prompt.strip().splitlines()[-1])
+        self.latency = latency
+        self.fail_times = fail_times
+        self.calls = 0
+
+    async def generate(self, prompt):
+        self.calls += 1
+        call = self.calls
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if call <= self.fail_times:
+            raise LLMError("stub rate limit", code=429)
+        return self.responder(prompt)
+
+
+class TokenBucket:
+    """Allow `rate` requests per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._loop = None
+
+    def _bind(self):
+        """asyncio primitives belong to one event loop; create them for the running one
+
+        The bucket may be used from `generate_blocking`'s background loop in
+        one place and from a caller's own `asyncio.run` in another.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        self._bind()
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+
+
+class LLMClient:
+    """Rate-limited, bounded-concurrency LLM client with jittered retries
+
+    Many prompts can be awaited concurrently; the token bucket keeps the
+    request rate within quota and the semaphore bounds in-flight calls.
+    """
+
+    def __init__(self, backend, requests_per_minute=60, max_concurrency=8,
+                 max_retries=5, base_delay=1.0, max_delay=30.0, timeout=60.0):
+        self.backend = backend
+        self.bucket = TokenBucket(requests_per_minute / 60.0)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0}
+        self._loop = None
+        self._background = None
+        self._background_lock = threading.Lock()
+
+    def _bind(self):
+        """Create the concurrency semaphore for the running event loop (see `TokenBucket._bind`)"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def generate(self, prompt):
+        self._bind()
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.bucket.acquire()
+                self.stats['requests'] += 1
+                try:
+                    return await asyncio.wait_for(self.backend.generate(prompt), self.timeout)
+                except Exception as e:
+                    if not is_retryable(e) or attempt == self.max_retries:
+                        self.stats['failures'] += 1
+                        raise
+                    self.stats['retries'] += 1
+                    # Full jitter: sleep a random time up to the exponential cap
+                    await asyncio.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def _background_loop(self):
+        """One event loop for the client's lifetime, running in a daemon thread
+
+        The backend's async transport (Gemini's grpc-asyncio channel) is tied
+        to the loop it was first used on, so every blocking call must reuse it.
+        """
+        with self._background_lock:
+            if self._background is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True).start()
+                self._background = loop
+            return self._background
+
+    def generate_blocking(self, prompt):
+        """Synchronous wrapper for callers without an event loop (e.g. Streamlit)"""
+        return asyncio.run_coroutine_threadsafe(self.generate(prompt), self._background_loop()).result()
@@ -0,0 +1,124 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Stage latencies range from sub-millisecond (decode) to minutes (CPU generate)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 200)
+
+
+class Spans:
+    """Wall-clock timings (ms) and counters for one request or batch"""
+
+    def __init__(self):
+        self.timings = {}
+        self.values = {}
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def record(self, name, ms):
+        self.timings[name] = round(self.timings.get(name, 0.0) + ms, 2)
+
+    def merge(self, other):
+        for name, ms in other.timings.items():
+            self.record(name, ms)
+        self.values.update(other.values)
+
+
+def span(spans, name):
+    """`spans.span(name)`, or a no-op when instrumentation is off"""
+    return spans.span(name) if spans is not None else nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Histograms and counters rendered in the Prometheus text exposition format"""
+
+    def __init__(self, prefix="chexagent"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(buckets)
+            self._histograms[key].observe(value)
+
+    def inc(self, name, labels=None, amount=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name, read):
+        """Register a callable sampled at scrape time"""
+        self._gauges[name] = read
+
+    def observe_spans(self, spans):
+        """Record every stage of a request, plus decode throughput if known"""
+        for stage, ms in spans.timings.items():
+            self.observe("stage_seconds", {'stage': stage}, ms / 1000)
+        if 'tokens_per_second' in spans.values:
+            self.observe("generate_tokens_per_second", {}, spans.values['tokens_per_second'], RATE_BUCKETS)
+
+    @staticmethod
+    def _labels(pairs, extra=None):
+        pairs = list(pairs) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        seen = set()
+        for (name, labels), hist in histograms:
+            metric = f"{self.prefix}_{name}"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} histogram")
+                seen.add(metric)
+            cumulative = 0
+            for bound, count in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{self._labels(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{metric}_sum{self._labels(labels)} {hist.total}")
+            lines.append(f"{metric}_count{self._labels(labels)} {hist.count}")
+
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{metric}{self._labels(labels)} {value}")
+
+        for name, read in sorted(self._gauges.items()):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {read()}")
+
+        return "\n".join(lines) + "\n"
@@ -1,23 +1,125 @@
+import resource
+import time
+
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
-def load_chexagent_model(model_name="StanfordAIMI/CheXagent-2-3b"):
+# CPU inference profiles: full precision, bfloat16 (CPUs with native bf16),
+# or int8 dynamic quantization of the language model's linear layers
+CPU_PROFILES = ("fp32", "bf16", "int8")
+
+
+def cpu_supports_bf16():
+    """True when the CPU has native bf16 instructions (AVX512-BF16 or AMX)"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def set_cpu_threads(num_threads=None, num_interop_threads=None):
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError:
+            # Can only be set once, before any inter-op parallel work has started
+            pass
+
+
+def quantize_language_model(model):
+    """int8 dynamic quantization of every nn.Linear outside the vision tower and LM head"""
+    qconfig_spec = {
+        name: torch.ao.quantization.default_dynamic_qconfig
+        for name, module in model.named_modules()
+        if isinstance(module, torch.nn.Linear)
+        and "visual" not in name
+        and not name.endswith("lm_head")
+    }
+    return torch.ao.quantization.quantize_dynamic(model, qconfig_spec, dtype=torch.qint8, inplace=True)
+
+
+def cast_leftovers(model, dtype):
+    """Remote-code submodules can ignore torch_dtype; cast only if something was left behind"""
+    if any(p.is_floating_point() and p.dtype != dtype for p in model.parameters()):
+        model = model.to(dtype)
+    return model
+
+
+def log_startup(started, device):
+    seconds = time.perf_counter() - started
+    # ru_maxrss is kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    message = f"✅ Model loaded in {seconds:.1f} s, peak RSS {peak_rss:,.0f} MB"
+    if device == "cuda":
+        message += f", peak GPU {torch.cuda.max_memory_allocated() / 1024 ** 2:,.0f} MB"
+    print(message)
+
+
+def load_chexagent_model(model_name="StanfordAIMI/CheXagent-2-3b", cpu_profile="fp32",
+                         num_threads=None, num_interop_threads=None, dtype=None):
+    """Load CheXagent from the Hub or from a checkpoint made by utils.convert_checkpoint
+
+    Weights are loaded straight into `dtype` (safetensors are memory-mapped),
+    so there is no float32 copy followed by a cast.
+    """
+    started = time.perf_counter()
     device = "cuda" if torch.cuda.is_available() else "cpu"
-    dtype = torch.bfloat16 if device == "cuda" else torch.float32
-    
+    if dtype is None:
+        dtype = torch.bfloat16 if device == "cuda" else torch.float32
+
+    if device == "cpu":
+        if cpu_profile not in CPU_PROFILES:
+            raise ValueError(f"Unknown CPU profile {cpu_profile!r}, expected one of {CPU_PROFILES}")
+        set_cpu_threads(num_threads, num_interop_threads)
+        if cpu_profile == "bf16":
+            if cpu_supports_bf16():
+                dtype = torch.bfloat16
+            else:
+                print("⚠️ CPU has no native bf16 support, falling back to fp32")
+                cpu_profile = "fp32"
+
     tokenizer = AutoTokenizer.from_pretrained(
         model_name,
         trust_remote_code=True,
         revision="main"
     )
-    
+
     model = AutoModelForCausalLM.from_pretrained(
         model_name,
         device_map="auto",
         trust_remote_code=True,
-        revision="main"
+        revision="main",
+        torch_dtype=dtype,
+        low_cpu_mem_usage=True
     )
-    model = model.to(dtype)
+    model = cast_leftovers(model, dtype)
     model.eval()
-    
-    return model, tokenizer, device
\ No newline at end of file
+
+    if device == "cpu" and cpu_profile == "int8":
+        model = quantize_language_model(model)
+
+    log_startup(started, device)
+    return model, tokenizer, device
+
+
+def load_draft_model(model_name, device, dtype=None):
+    """Load a small causal LM to draft tokens for assisted decoding
+
+    It must share CheXagent's tokenizer: transformers 4.40 cannot translate
+    between vocabularies during assisted generation.
+    """
+    started = time.perf_counter()
+    if dtype is None:
+        dtype = torch.bfloat16 if device == "cuda" else torch.float32
+    draft = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=dtype,
+        low_cpu_mem_usage=True
+    ).to(device)
+    draft.eval()
+    print(f"✅ Draft model {model_name} loaded in {time.perf_counter() - started:.1f}s")
+    return draft
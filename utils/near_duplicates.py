@@ -0,0 +1,247 @@
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+# Hamming radius (of 64 bits) within which two images count as the same study; not yet
+# calibrated on real re-exported, cropped and re-windowed studies (see
+# benchmarks/near_duplicate_calibration.py), so the backend ships with the index off
+DEFAULT_RADIUS = 4
+# The 64-bit hash is split into this many 16-bit pieces, one lookup table each
+PIECES = 4
+PIECE_BITS = 64 // PIECES
+# On disk: 64-bit hash, 256-bit confirmation hash, SHA-256 pixel digest
+RECORD = np.dtype([('value', '<u8'), ('fine', '<u8', (4,)), ('digest', 'u1', (32,))])
+# Images are box-reduced to about this many pixels on the short side before hashing
+FINGERPRINT_SIZE = 64
+# Entries added since the last table rebuild are scanned directly; past this many, rebuild
+UNINDEXED_MAX = 16384
+# Fingerprints of queried images kept for the `add` that follows a miss
+PENDING_FINGERPRINTS = 1024
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    # NumPy < 2.0: count set bits a byte at a time
+    _BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        values = np.ascontiguousarray(values)
+        return _BYTE_BITS[values.view(np.uint8)].reshape(*values.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+def perceptual_hash(image, size=8):
+    """Difference hash: signs of horizontal gradients on a (size+1) x size thumbnail
+
+    Stable under re-encoding, rescaling, crops of a few pixels and monotonic
+    re-windowing. `size=8` gives 64 bits, `size=16` gives 256.
+    """
+    pixels = np.asarray(image.convert("L").resize((size + 1, size), Image.BOX), dtype=np.int16)
+    # Row-major, first comparison in the most significant bit
+    return int.from_bytes(np.packbits(pixels[:, :-1] < pixels[:, 1:]).tobytes(), "big")
+
+
+def fingerprint(image):
+    """(64-bit, 256-bit) difference hashes, both taken from one small grayscale copy
+
+    An integer box reduction to ~FINGERPRINT_SIZE pixels averages the same
+    regions as resizing the full image, without two passes over its pixels.
+    """
+    if image.mode in ("1", "P") or image.mode.startswith("I;"):
+        image = image.convert("L")
+    factor = min(image.size) // FINGERPRINT_SIZE
+    if factor > 1:
+        image = image.reduce(factor)
+    small = image.convert("L")
+    return perceptual_hash(small), perceptual_hash(small, size=16)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _fine_words(fine):
+    return np.frombuffer(fine.to_bytes(32, "little"), dtype="<u8")
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(bits):
+    """Every PIECE_BITS-bit mask with at most `bits` bits set"""
+    masks = [0]
+    for count in range(1, bits + 1):
+        for positions in itertools.combinations(range(PIECE_BITS), count):
+            masks.append(sum(1 << p for p in positions))
+    return np.array(masks, dtype=np.uint16)
+
+
+def _piece(values, i):
+    return ((values >> np.uint64(i * PIECE_BITS)) & np.uint64((1 << PIECE_BITS) - 1)).astype(np.uint16)
+
+
+class NearDuplicateIndex:
+    """Hamming-radius search over 64-bit perceptual hashes (multi-index hashing)
+
+    Each hash is split into PIECES 16-bit pieces with a table per piece. Two
+    hashes within `radius` bits differ by at most radius // PIECES bits in at
+    least one piece, so a query probes only those neighbourhoods (17 lookups
+    per table at the default radius) and popcounts the candidates. Chest
+    X-rays look alike at 64 bits, so every candidate is confirmed with a
+    256-bit hash within `fine_radius` bits (default: the same fraction,
+    4 * radius).
+
+    Hashes live in NumPy arrays; each table is the piece values sorted, with
+    the entry numbers in the same order, so a probe is a binary search and
+    candidates are checked in one vectorized popcount however crowded their
+    buckets are. Entries added since the last rebuild are scanned directly.
+
+    Entries are appended to `path` and reloaded on startup.
+    """
+
+    def __init__(self, path="near_duplicates.bin", radius=DEFAULT_RADIUS, fine_radius=None):
+        self.path = path
+        self.radius = radius
+        self.fine_radius = 4 * radius if fine_radius is None else fine_radius
+        self._count = 0
+        self._values = np.empty(1024, dtype=np.uint64)
+        self._fine = np.empty((1024, 4), dtype=np.uint64)
+        self._digests = np.empty((1024, 32), dtype=np.uint8)
+        self._tables = []
+        self._indexed = 0
+        self._rebuilding = False
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'queries': 0, 'near_hits': 0, 'rebuilds': 0}
+
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            # A torn last record from an interrupted write is dropped, and cut off
+            # the file so later appends start on a record boundary
+            count = len(data) // RECORD.itemsize
+            if len(data) != count * RECORD.itemsize:
+                os.truncate(path, count * RECORD.itemsize)
+            records = np.frombuffer(data, dtype=RECORD, count=count)
+            self._append(records['value'], records['fine'], records['digest'])
+            self._rebuild()
+        self._file = open(path, "ab")
+
+    def _append(self, values, fine, digests):
+        end = self._count + len(values)
+        if end > len(self._values):
+            capacity = max(end, 2 * len(self._values))
+            for name in ('_values', '_fine', '_digests'):
+                old = getattr(self, name)
+                grown = np.empty((capacity, *old.shape[1:]), dtype=old.dtype)
+                grown[:self._count] = old[:self._count]
+                setattr(self, name, grown)
+        self._values[self._count:end] = values
+        self._fine[self._count:end] = fine
+        self._digests[self._count:end] = digests
+        self._count = end
+
+    def _rebuild(self):
+        """Re-sort every piece table over the entries added so far
+
+        Sorting runs outside the lock: appends only write past the snapshot
+        (into a new array if they grow it), and whatever arrives meanwhile
+        stays in the directly scanned tail.
+        """
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            count, values = self._count, self._values
+        try:
+            tables = []
+            for i in range(PIECES):
+                pieces = _piece(values[:count], i)
+                order = np.argsort(pieces, kind="stable").astype(np.uint32)
+                tables.append((pieces[order], order))
+            with self._lock:
+                self._tables, self._indexed = tables, count
+                self.stats['rebuilds'] += 1
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    def insert(self, value, fine, digest):
+        """Index precomputed (64-bit, 256-bit) hashes under a pixel digest"""
+        record = np.zeros(1, dtype=RECORD)
+        record['value'] = value
+        record['fine'] = _fine_words(fine)
+        record['digest'] = np.frombuffer(bytes.fromhex(digest), dtype=np.uint8)
+        with self._lock:
+            self._append(record['value'], record['fine'], record['digest'])
+            self._file.write(record.tobytes())
+            self._file.flush()
+            stale = self._count - self._indexed > UNINDEXED_MAX
+        if stale:
+            self._rebuild()
+
+    def add(self, image, digest):
+        """Index an analyzed image under its pixel digest
+
+        Reuses the hashes computed when the same digest was just queried.
+        """
+        with self._lock:
+            hashes = self._pending.pop(digest, None)
+        if hashes is None:
+            hashes = fingerprint(image)
+        self.insert(*hashes, digest)
+
+    def search(self, value, fine, radius=None, fine_radius=None):
+        """(distance, digest) of entries within `radius` bits of precomputed hashes, closest first"""
+        radius = self.radius if radius is None else radius
+        fine_radius = self.fine_radius if fine_radius is None else fine_radius
+        masks = _flip_masks(radius // PIECES)
+        query = np.uint64(value)
+        query_fine = _fine_words(fine)
+
+        with self._lock:
+            self.stats['queries'] += 1
+            ranges = []
+            for i, (keys, entries) in enumerate(self._tables):
+                probes = masks ^ np.uint16((value >> (i * PIECE_BITS)) & ((1 << PIECE_BITS) - 1))
+                starts = keys.searchsorted(probes, side="left")
+                ends = keys.searchsorted(probes, side="right")
+                ranges.extend(entries[start:end] for start, end in zip(starts, ends) if end > start)
+            ranges.append(np.arange(self._indexed, self._count, dtype=np.uint32))
+            candidates = np.concatenate(ranges)
+
+            distances = _popcount(self._values[candidates] ^ query)
+            close = distances <= radius
+            candidates, distances = candidates[close], distances[close]
+            fine_distances = _popcount(self._fine[candidates] ^ query_fine).sum(axis=1)
+            confirmed = fine_distances <= fine_radius
+            # An entry sits in several tables' probed buckets; report it once
+            candidates, first = np.unique(candidates[confirmed], return_index=True)
+            distances = distances[confirmed][first]
+            digests = self._digests[candidates]
+
+        return sorted((int(distance), digest.tobytes().hex()) for distance, digest in zip(distances, digests))
+
+    def query(self, image, digest=None, radius=None, fine_radius=None):
+        """(distance, digest) of indexed images within `radius` bits, closest first
+
+        Pass the image's pixel digest so a following `add` can reuse the hashes.
+        """
+        hashes = fingerprint(image)
+        if digest is not None:
+            with self._lock:
+                self._pending[digest] = hashes
+                self._pending.move_to_end(digest)
+                while len(self._pending) > PENDING_FINGERPRINTS:
+                    self._pending.popitem(last=False)
+        return self.search(*hashes, radius, fine_radius)
+
+    def hit(self):
+        with self._lock:
+            self.stats['near_hits'] += 1
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, entries=self._count, radius=self.radius, fine_radius=self.fine_radius)
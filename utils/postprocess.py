@@ -0,0 +1,170 @@
+"""Translation and hallucination check for generated reports
+
+    python -m utils.postprocess reports.jsonl translated.jsonl --concurrency 16 --rpm 300
+
+Reads `utils.batch_reports` output and appends each study's layman report and
+verification verdict, running many reports concurrently through LLMClient.
+The verdict comes from the same local sentence check the app shows
+(`utils.consistency`); `--llm-verdict` asks Gemini instead, at one more
+request per report.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from sentence_transformers import SentenceTransformer
+
+from utils.consistency import check_consistency
+from utils.llm_client import GeminiBackend, LLMClient
+
+SIMILARITY_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+
+
+def translation_prompt(medical_report):
+    return f"""You are a medical translator. Translate this medical report into simple, patient-friendly language that anyone can understand. Give direct response as you are actually giving the report.
+
+Medical Report: {medical_report}
+
+Provide a clear, layman translation:"""
+
+
+def comparison_prompt(medical_report, layman_report):
+    return f"""
+You are a medical analysis expert LLM.
+
+Two reports are provided:
+- Report A = Original medical report  
+- Report B = Layman translation generated by another LLM  
+
+Your ONLY job:
+- Decide if Report B contains *hallucinations* (incorrect additions NOT in Report A).  
+- Normal explanation or simplification is allowed.  
+- Only WRONG MEDICAL ADDITIONS count as hallucinations.
+
+Return EXACTLY this format:
+
+Hallucinated: YES or NO  
+Difference: HIGH / MEDIUM / LOW  
+Explanation: <short explanation>  
+Hallucination Score: <0-100 number>
+
+-----------------
+Report A:
+{medical_report}
+
+Report B:
+{layman_report}
+"""
+
+
+def parse_hallucination(analysis_text):
+    """Parse the comparison reply into (hallucinated, difference, explanation, score)"""
+    hallucinated = "UNKNOWN"
+    difference = "UNKNOWN"
+    explanation = "No explanation found."
+    hallucination_score = 0
+
+    for line in analysis_text.split("\n"):
+        line = line.strip()
+        if line.lower().startswith("hallucinated:"):
+            hallucinated = line.split(":")[1].strip()
+        elif line.lower().startswith("difference:"):
+            difference = line.split(":")[1].strip()
+        elif line.lower().startswith("explanation:"):
+            explanation = line.split(":", 1)[1].strip()
+        elif "hallucination score" in line.lower():
+            try:
+                hallucination_score = int(line.split(":")[1].strip())
+            except (IndexError, ValueError):
+                hallucination_score = 0
+
+    return hallucinated, difference, explanation, hallucination_score
+
+
+async def translate_and_verify(client, medical_report, similarity_model=None):
+    """Layman translation plus verdict
+
+    With a `similarity_model` the verdict is `check_consistency`'s, as in the
+    app; without one it is Gemini's reply to `comparison_prompt`.
+    """
+    layman_report = await client.generate(translation_prompt(medical_report))
+    if similarity_model is not None:
+        return dict(check_consistency(similarity_model, medical_report, layman_report), layman_report=layman_report)
+
+    analysis_text = await client.generate(comparison_prompt(medical_report, layman_report))
+    hallucinated, difference, explanation, score = parse_hallucination(analysis_text)
+    return {
+        'layman_report': layman_report,
+        'hallucinated': hallucinated,
+        'difference': difference,
+        'explanation': explanation,
+        'hallucination_score': score
+    }
+
+
+async def process_reports(client, medical_reports, similarity_model=None):
+    """Translate and verify many reports concurrently; errors are returned per report"""
+    return await asyncio.gather(
+        *[translate_and_verify(client, report, similarity_model) for report in medical_reports],
+        return_exceptions=True
+    )
+
+
+async def _run(input_path, output_path, client, similarity_model=None):
+    done = set()
+    if os.path.exists(output_path):
+        with open(output_path, encoding="utf-8") as f:
+            done = {json.loads(line)['id'] for line in f if line.strip()}
+
+    with open(input_path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    rows = [row for row in rows if 'report' in row and row['id'] not in done]
+    print(f"📝 {len(rows)} reports to translate ({len(done)} already done)")
+
+    started = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as out:
+
+        async def one(row):
+            try:
+                row.update(await translate_and_verify(client, row['report'], similarity_model))
+            except Exception as e:
+                print(f"❌ {row['id']}: {e}", file=sys.stderr)
+                return
+            out.write(json.dumps(row) + "\n")
+            out.flush()
+
+        await asyncio.gather(*[one(row) for row in rows])
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ {len(rows)} reports in {elapsed:.0f} s ({len(rows) / max(elapsed, 1e-9):.2f} reports/s), "
+          f"{client.stats['requests']} requests, {client.stats['retries']} retries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSONL from utils.batch_reports")
+    parser.add_argument("output", help="JSONL file to append translated reports to")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rpm", type=int, default=300, help="Requests per minute quota")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--llm-verdict", action="store_true",
+                        help="Ask Gemini for the hallucination verdict instead of the local sentence check")
+    args = parser.parse_args()
+
+    similarity_model = None
+    if not args.llm_verdict:
+        similarity_model = SentenceTransformer(SIMILARITY_MODEL)
+
+    client = LLMClient(
+        GeminiBackend(args.model, api_key=os.getenv("GEMINI_API_KEY")),
+        requests_per_minute=args.rpm,
+        max_concurrency=args.concurrency
+    )
+    asyncio.run(_run(args.input, args.output, client, similarity_model))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import math
+from io import BytesIO
+
+from PIL import Image
+
+from utils.dicom import is_dicom, read_dicom
+
+# CheXagent's vision encoder works on 512 px inputs; anything larger is
+# thrown away on the GPU box, so we resize before upload instead
+MODEL_INPUT_SIZE = 512
+SAFETY_MARGIN = 1.25
+
+
+def to_grayscale8(image):
+    """Convert any PIL mode (RGB, palette, 16-bit, 32-bit) to 8-bit grayscale"""
+    if image.mode == "L":
+        return image
+    if image.mode.startswith("I") or image.mode == "F":
+        # 12/16-bit X-rays: stretch the used range into 0-255 instead of clipping
+        image = image.convert("I") if image.mode.startswith("I;") else image
+        lo, hi = image.getextrema()
+        scale = 255.0 / (hi - lo) if hi > lo else 0.0
+        return image.point(lambda v: (v - lo) * scale).convert("L")
+    return image.convert("L")
+
+
+def downscale(image, target_size=MODEL_INPUT_SIZE, margin=SAFETY_MARGIN):
+    """Shrink so the short side is target_size * margin; never upscale"""
+    short_side = math.ceil(target_size * margin)
+    scale = short_side / min(image.size)
+    if scale >= 1:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def encode_smallest(image):
+    """Try the lossless encoders PIL has and keep the smallest result"""
+    candidates = [("PNG", "image/png", {'optimize': True})]
+    if "WEBP" in Image.SAVE:
+        candidates.append(("WEBP", "image/webp", {'lossless': True, 'quality': 100, 'method': 6}))
+
+    best = None
+    for fmt, mime, options in candidates:
+        buffered = BytesIO()
+        try:
+            image.save(buffered, format=fmt, **options)
+        except (OSError, ValueError):
+            continue
+        data = buffered.getvalue()
+        if best is None or len(data) < len(best[0]):
+            best = (data, mime, fmt)
+    return best
+
+
+def prepare_upload(image_file, target_size=MODEL_INPUT_SIZE, margin=SAFETY_MARGIN):
+    """Downscale, grayscale and losslessly re-encode an X-ray before upload
+
+    Returns (prepared PIL image, encoded bytes, mime type, stats).
+    """
+    raw = image_file.getvalue()
+    original_bytes = len(raw)
+    short_side = math.ceil(target_size * margin)
+    if is_dicom(raw):
+        # Windowed and reduced while reading; no PNG conversion pass
+        image, original_size = read_dicom(raw, short_side)
+    else:
+        image = Image.open(BytesIO(raw))
+        original_size = image.size
+
+        # JPEG can decode straight to a reduced scale (1/2, 1/4, 1/8)
+        if image.format == "JPEG":
+            image.draft("L", (short_side, short_side))
+
+    image = downscale(to_grayscale8(image), target_size, margin)
+    data, mime, fmt = encode_smallest(image)
+
+    stats = {
+        'original_bytes': original_bytes,
+        'upload_bytes': len(data),
+        'bytes_saved': original_bytes - len(data),
+        'ratio': round(original_bytes / len(data), 1) if data else 0.0,
+        'original_size': original_size,
+        'upload_size': image.size,
+        'format': fmt
+    }
+    return image, data, mime, stats
+
+
+def load_image(path, target_size=MODEL_INPUT_SIZE, margin=SAFETY_MARGIN):
+    """Decode an X-ray (PNG, JPEG or DICOM) from disk straight to a model-sized 8-bit grayscale image"""
+    short_side = math.ceil(target_size * margin)
+    if is_dicom(path):
+        return downscale(read_dicom(path, short_side)[0], target_size, margin)
+    image = Image.open(path)
+    if image.format == "JPEG":
+        image.draft("L", (short_side, short_side))
+    image = downscale(to_grayscale8(image), target_size, margin)
+    image.load()
+    return image
@@ -0,0 +1,77 @@
+import re
+import threading
+
+import torch
+
+from utils.inference import REPORT_PROMPT, SYSTEM_PROMPT, build_input_ids
+from utils.metrics import span
+
+IMAGE_TAG = re.compile(r"<img>.*?</img>", re.DOTALL)
+
+
+class PromptTemplate:
+    """Chat template tokenized once, so requests only tokenize their image tags
+
+    The rendered conversation is split around each `<img>...</img>` tag and
+    the fixed pieces are tokenized up front. Each layout (number of images)
+    is checked against the full `from_list_format` + `apply_chat_template`
+    path once; if the tokenizer merges across a tag boundary the slow path is
+    used for that layout instead.
+    """
+
+    def __init__(self, tokenizer, prompt=REPORT_PROMPT):
+        self.tokenizer = tokenizer
+        self.prompt = prompt
+        self._layouts = {}
+        self._lock = threading.Lock()
+
+    def _encode(self, text):
+        if not text:
+            return []
+        return list(self.tokenizer.encode(text, add_special_tokens=False))
+
+    @staticmethod
+    def _sentinels(count):
+        # Same length as the InMemoryImages `mem://<uuid hex>` paths
+        return [f"mem://{i:032x}" for i in range(count)]
+
+    def _layout(self, count):
+        with self._lock:
+            if count in self._layouts:
+                return self._layouts[count]
+
+        paths = self._sentinels(count)
+        try:
+            query = self.tokenizer.from_list_format([*[{'image': p} for p in paths], {'text': self.prompt}])
+            text = self.tokenizer.apply_chat_template(
+                [{"from": "system", "value": SYSTEM_PROMPT}, {"from": "human", "value": query}],
+                add_generation_prompt=True,
+                tokenize=False
+            )
+            pieces = IMAGE_TAG.split(text)
+            layout = [self._encode(piece) for piece in pieces] if len(pieces) == count + 1 else None
+            if layout is not None and self._join(layout, paths) != build_input_ids(self.tokenizer, paths, self.prompt).tolist():
+                layout = None
+        except Exception:
+            layout = None
+        if layout is None:
+            print(f"⚠️ Prompt template for {count} image(s) can't be split; tokenizing per request")
+
+        with self._lock:
+            self._layouts[count] = layout
+        return layout
+
+    def _join(self, layout, image_paths):
+        ids = list(layout[0])
+        for path, piece in zip(image_paths, layout[1:]):
+            ids += self._encode(f"<img>{path}</img>") + piece
+        return ids
+
+    def input_ids(self, image_paths, spans=None):
+        """Same ids as `build_input_ids`, without re-tokenizing the fixed text"""
+        layout = self._layout(len(image_paths))
+        if layout is None:
+            return build_input_ids(self.tokenizer, image_paths, self.prompt, spans)
+        with span(spans, "tokenize"):
+            return torch.tensor(self._join(layout, image_paths), dtype=torch.long)
+
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def pixel_digest(image):
+    """Hash the decoded pixels, so re-encoding the same image gives the same digest"""
+    image = image.convert("RGB")
+    h = hashlib.sha256()
+    h.update(f"{image.width}x{image.height}".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def cache_key(digest, prompt, model_name, revision="main"):
+    """Combine the pixel digest with everything else that changes the report"""
+    h = hashlib.sha256()
+    for part in (digest, prompt, model_name, revision):
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+# Once over budget, evict down to this fraction of it so the next puts don't evict again
+EVICT_TO = 0.9
+
+
+class ReportCache:
+    """Two-tier report cache: in-memory LRU in front of a size-bounded disk store
+
+    Generation is greedy, so a (pixels, prompt, model, revision) key always
+    maps to the same report and entries never need to expire. The disk
+    files' sizes are indexed in memory in LRU order, so eviction never
+    scans the directory, and reads and writes happen outside the lock. An
+    evicted file is only unlinked, under the lock, if its key has not been
+    stored again or started being written since.
+    """
+
+    def __init__(self, directory="report_cache", memory_items=256, max_disk_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict()
+        # Keys whose file is being written outside the lock
+        self._writing = set()
+        self._lock = threading.Lock()
+        self._counts = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+        os.makedirs(directory, exist_ok=True)
+        # key -> file size, least recently used first (mtime order from the last run)
+        self._disk = OrderedDict()
+        for mtime, key, size in sorted(self._scan()):
+            self._disk[key] = size
+        self._disk_bytes = sum(self._disk.values())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _scan(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".json"):
+                    stat = os.stat(os.path.join(root, name))
+                    yield stat.st_mtime, name[:-len(".json")], stat.st_size
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._counts['memory_hits'] += 1
+                return self._memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = json.load(f)['report']
+            # Touch the file so the LRU order survives a restart
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self._counts['misses'] += 1
+                # The file is gone or unreadable: forget it so the next put rewrites it
+                if key in self._disk and key not in self._writing:
+                    self._disk_bytes -= self._disk.pop(key)
+            return None
+
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self._remember(key, value)
+            self._counts['disk_hits'] += 1
+        return value
+
+    def put(self, key, report):
+        with self._lock:
+            self._remember(key, report)
+            if key in self._disk or key in self._writing:
+                return
+            self._writing.add(key)
+
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({'report': report}, f)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError:
+            with self._lock:
+                self._writing.discard(key)
+            raise
+
+        victims = []
+        with self._lock:
+            self._writing.discard(key)
+            if key not in self._disk:
+                self._disk[key] = size
+                self._disk_bytes += size
+            if self._disk_bytes > self.max_disk_bytes:
+                while self._disk and self._disk_bytes > self.max_disk_bytes * EVICT_TO:
+                    victim, victim_size = self._disk.popitem(last=False)
+                    self._disk_bytes -= victim_size
+                    self._counts['evictions'] += 1
+                    victims.append(victim)
+
+        for victim in victims:
+            with self._lock:
+                # Stored again since it was picked, or being written right now: keep the file
+                if victim in self._disk or victim in self._writing:
+                    continue
+                try:
+                    os.unlink(self._path(victim))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            lookups = counts['memory_hits'] + counts['disk_hits'] + counts['misses']
+            hits = counts['memory_hits'] + counts['disk_hits']
+            counts.update({
+                'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes
+            })
+            return counts
@@ -0,0 +1,117 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Rough chars-per-token ratio for estimating Gemini tokens saved
+CHARS_PER_TOKEN = 4
+
+
+def normalize(sentence):
+    """Cache key for a sentence: case, spacing and trailing punctuation don't matter"""
+    return re.sub(r'\s+', ' ', sentence).strip().rstrip('.!?').lower()
+
+
+def split_report(report):
+    """Split into lines of sentences, keeping every fragment so the report can be rebuilt"""
+    lines = []
+    for line in report.strip().split('\n'):
+        sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', line) if s.strip()]
+        lines.append(sentences)
+    return lines
+
+
+def batch_prompt(sentences):
+    numbered = "\n".join(f"{i}. {s}" for i, s in enumerate(sentences, 1))
+    return f"""You are a medical translator. Translate each numbered sentence from a chest X-ray report into simple, patient-friendly language that anyone can understand.
+
+Reply with exactly one line per sentence, in the same order, formatted as "<number>. <translation>". Do not add anything else.
+
+{numbered}"""
+
+
+def parse_batch(text, count):
+    """Map the numbered reply back to sentences; None if any line is missing"""
+    found = {}
+    for line in text.split('\n'):
+        match = re.match(r'^\s*(\d+)[.)]\s*(.+)$', line)
+        if match:
+            found[int(match.group(1))] = match.group(2).strip()
+    if any(i not in found for i in range(1, count + 1)):
+        return None
+    return [found[i] for i in range(1, count + 1)]
+
+
+class TranslationMemory:
+    """Sentence-level translation cache persisted to a JSON file with LRU eviction
+
+    Radiology reports reuse the same phrasing constantly, so most sentences of
+    a normal study are already translated and never reach the LLM.
+    """
+
+    def __init__(self, path=".translation_memory.json", max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'llm_calls': 0, 'tokens_saved': 0}
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._entries.update(json.load(f))
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+
+    def translate(self, report, translate_batch):
+        """Translate `report`, sending only unseen sentences to `translate_batch(prompt)`
+
+        Returns None if the LLM reply cannot be matched to the sentences, so
+        the caller can fall back to a whole-report translation.
+        """
+        lines = split_report(report)
+        sentences = [s for line in lines for s in line]
+        keys = [normalize(s) for s in sentences]
+
+        with self._lock:
+            known = {}
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    known[key] = self._entries[key]
+
+        hits = sum(1 for key in keys if key in known)
+        saved = sum(len(s) + len(known[key]) for s, key in zip(sentences, keys) if key in known)
+        missing = list(dict.fromkeys(key for key in keys if key not in known))
+        # The original wording goes to the LLM; the cache is keyed on the normalized form
+        originals = dict(zip(keys, sentences))
+
+        if missing:
+            reply = translate_batch(batch_prompt([originals[key] for key in missing]))
+            translations = parse_batch(reply, len(missing))
+            with self._lock:
+                self.stats['llm_calls'] += 1
+            if translations is None:
+                return None
+            with self._lock:
+                for key, translation in zip(missing, translations):
+                    self._entries[key] = translation
+                    known[key] = translation
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self._save()
+
+        with self._lock:
+            self.stats['hits'] += hits
+            self.stats['misses'] += len(sentences) - hits
+            self.stats['tokens_saved'] += saved // CHARS_PER_TOKEN
+
+        return "\n".join(" ".join(known[normalize(s)] for s in line) for line in lines).strip()
+
+    def hit_rate(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / lookups if lookups else 0.0
@@ -0,0 +1,211 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+from contextlib import ExitStack
+
+import torch
+
+from utils.inference import REPORT_PROMPT, generate_reports, stream_report
+from utils.metrics import Spans
+
+
+# Longest a caller waits for a free worker, a result or the next streamed event (s);
+# CPU reports can take minutes, so this only catches a worker that hangs
+TASK_TIMEOUT = 1800
+
+
+def _worker_main(worker_id, model, tokenizer, device, image_store, template, num_threads, tasks, results):
+    """Loop of one forked worker: take a task, run it on the shared model, send results back"""
+    torch.set_num_threads(num_threads)
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, kind, args = task
+        spans = Spans()
+        try:
+            with ExitStack() as stack, torch.no_grad():
+                if kind == 'generate':
+                    studies, prompt, max_new_tokens = args
+                    paths = [[stack.enter_context(image_store.register(image, key)) for image, key in study]
+                             for study in studies]
+                    reports = generate_reports(model, tokenizer, device, paths, prompt, max_new_tokens, spans,
+                                               template=template)
+                    results.put((worker_id, task_id, 'result', (reports, spans.timings, spans.values)))
+                else:
+                    images, prompt, max_new_tokens = args
+                    paths = [stack.enter_context(image_store.register(image, key)) for image, key in images]
+                    for event in stream_report(model, tokenizer, device, paths, prompt, max_new_tokens, spans,
+                                               template=template):
+                        if event['type'] == 'done':
+                            event = dict(event, spans=(spans.timings, spans.values))
+                        results.put((worker_id, task_id, 'event', event))
+        except Exception as e:
+            results.put((worker_id, task_id, 'error', str(e)))
+
+
+class CPUWorkerPool:
+    """Forked inference workers sharing one copy of the model weights
+
+    The parameters are moved to shared memory once and the workers are forked
+    from the loaded process, so N workers cost one copy of the weights plus
+    their own activations. Each worker runs `threads_per_worker` torch
+    threads and has its own task queue: a task is handed to one idle worker,
+    so if that worker dies its task is known and failed. Create the pool
+    before the parent runs any inference.
+    """
+
+    def __init__(self, model, tokenizer, device, image_store, workers=2, threads_per_worker=None, template=None,
+                 task_timeout=TASK_TIMEOUT):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.task_timeout = task_timeout
+        self._args = (model, tokenizer, device, image_store, template, self.threads_per_worker)
+
+        model.share_memory()
+        self._ctx = multiprocessing.get_context("fork")
+        self._results = self._ctx.Queue()
+        self._pending = {}
+        self._running = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self.stats = {'tasks': 0, 'failed': 0, 'restarts': 0, 'timeouts': 0}
+
+        self._tasks = [self._ctx.Queue() for _ in range(workers)]
+        self._processes = [self._start(i) for i in range(workers)]
+        self._idle = set(range(workers))
+        threading.Thread(target=self._dispatch, daemon=True).start()
+
+    def _start(self, worker_id):
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, *self._args, self._tasks[worker_id], self._results),
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def _dispatch(self):
+        """Route worker messages to the waiting callers; replace dead workers"""
+        while True:
+            try:
+                message = self._results.get(timeout=1.0)
+            except queue.Empty:
+                message = None
+            self._reap()
+            if message is None:
+                continue
+
+            worker_id, task_id, kind, payload = message
+            with self._lock:
+                # A late message from a worker that was already replaced frees nothing
+                if (kind != 'event' or payload['type'] == 'done') and self._running.get(worker_id) == task_id:
+                    del self._running[worker_id]
+                    self._idle.add(worker_id)
+                    self._ready.notify()
+                inbox = self._pending.get(task_id)
+            if inbox is not None:
+                inbox.put((kind, payload))
+
+    def _reap(self):
+        for worker_id, process in enumerate(self._processes):
+            if process.is_alive():
+                continue
+            with self._lock:
+                task_id = self._running.pop(worker_id, None)
+                inbox = self._pending.get(task_id)
+                self._idle.discard(worker_id)
+                self.stats['restarts'] += 1
+                # The dead worker's queue may still hold its task; the replacement starts empty
+                self._tasks[worker_id] = self._ctx.Queue()
+                self._processes[worker_id] = self._start(worker_id)
+                self._idle.add(worker_id)
+                self._ready.notify()
+            if inbox is not None:
+                inbox.put(('error', f"Worker {worker_id} exited with code {process.exitcode}"))
+            print(f"⚠️ CPU worker {worker_id} died (exit code {process.exitcode}), restarting")
+
+    def _submit(self, kind, args):
+        """Hand the task to an idle worker's own queue, waiting for one to free up"""
+        task_id = next(self._ids)
+        inbox = queue.Queue()
+        with self._ready:
+            if not self._ready.wait_for(lambda: self._idle, self.task_timeout):
+                self.stats['timeouts'] += 1
+                raise TimeoutError(f"No CPU worker became free within {self.task_timeout} s")
+            worker_id = self._idle.pop()
+            self._running[worker_id] = task_id
+            self._pending[task_id] = inbox
+            self.stats['tasks'] += 1
+            tasks = self._tasks[worker_id]
+        tasks.put((task_id, kind, args))
+        return task_id, inbox
+
+    def _receive(self, task_id, inbox):
+        """Next message for a task; a worker silent for `task_timeout` is killed and restarted"""
+        try:
+            return inbox.get(timeout=self.task_timeout)
+        except queue.Empty:
+            with self._lock:
+                self.stats['timeouts'] += 1
+                hung = [w for w, t in self._running.items() if t == task_id]
+                for worker_id in hung:
+                    self._processes[worker_id].terminate()
+            raise TimeoutError(f"CPU worker sent nothing for {self.task_timeout} s")
+
+    def _finish(self, task_id, failed=False):
+        with self._lock:
+            self._pending.pop(task_id, None)
+            if failed:
+                self.stats['failed'] += 1
+
+    def generate(self, studies, prompt=REPORT_PROMPT, max_new_tokens=512, spans=None):
+        """`generate_reports` on an idle worker; studies are lists of (image, key) pairs"""
+        task_id, inbox = self._submit('generate', (studies, prompt, max_new_tokens))
+        try:
+            kind, payload = self._receive(task_id, inbox)
+        except TimeoutError:
+            self._finish(task_id, failed=True)
+            raise
+        self._finish(task_id, failed=kind == 'error')
+        if kind == 'error':
+            raise RuntimeError(payload)
+
+        reports, timings, values = payload
+        if spans is not None:
+            for name, ms in timings.items():
+                spans.record(name, ms)
+            spans.values.update(values)
+        return reports
+
+    def stream(self, images, prompt=REPORT_PROMPT, max_new_tokens=512, spans=None):
+        """`stream_report` on an idle worker; images are (image, key) pairs"""
+        task_id, inbox = self._submit('stream', (images, prompt, max_new_tokens))
+        failed = True
+        try:
+            while True:
+                kind, payload = self._receive(task_id, inbox)
+                if kind == 'error':
+                    raise RuntimeError(payload)
+                if payload['type'] == 'done':
+                    timings, values = payload.pop('spans')
+                    if spans is not None:
+                        for name, ms in timings.items():
+                            spans.record(name, ms)
+                        spans.values.update(values)
+                    failed = False
+                    yield payload
+                    return
+                yield payload
+        finally:
+            self._finish(task_id, failed=failed)
+
+    def info(self):
+        with self._lock:
+            busy = len(self._running)
+            stats = dict(self.stats)
+        return dict(stats, workers=self.workers, threads_per_worker=self.threads_per_worker,
+                    alive=sum(p.is_alive() for p in self._processes), busy=busy)